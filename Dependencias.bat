@@ -20,6 +20,8 @@ pip install urllib3==2.2.0
 pip install djangorestframework-simplejwt
 pip install geopy
 pip install stripe
+pip install numpy
+pip install uvicorn
 
 pause
 
@@ -1,5 +1,5 @@
 cd Servimatch_api
 
-python manage.py runserver 0.0.0.0:8000
+python -m uvicorn Servimatch_api.asgi:application --host 0.0.0.0 --port 8000 --reload
 
 pause
\ No newline at end of file
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -126,3 +127,7 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Usuario staff con el que el panel llama a los endpoints de administración de la API
+ADMIN_API_USUARIO = os.environ.get('ADMIN_API_USUARIO', '')
+ADMIN_API_CLAVE = os.environ.get('ADMIN_API_CLAVE', '')
@@ -15,6 +15,7 @@ urlpatterns = [
     path('dashboard-admin/', views.dashboard_admin, name='dashboard_admin'),
     path('acciones/', views.acciones, name='acciones'),
     path('admin/boletas/<int:boleta_id>/liberar/', views.liberar_pago, name='liberar_pago'),
+    path('admin/pagos/liberar/', views.liberar_pagos, name='liberar_pagos'),
     path('admin/feedback/<int:feedback_id>/responder/', views.responder_feedback, name='responder_feedback'),
     path('admin/trabajadores/<int:trabajador_id>/verificar/', views.verificar_trabajador, name='verificar_trabajador'),
     path('admin/notificaciones/', views.notificaciones_admin, name='admin_notificaciones'),
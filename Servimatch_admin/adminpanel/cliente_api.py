@@ -0,0 +1,243 @@
+"""
+Cliente de la API de Servimatch para las vistas del panel.
+
+- Una requests.Session compartida con pool keep-alive, y timeout de conexión
+  y de lectura en toda llamada (ADMIN_API_TIMEOUT).
+- listar() sigue los cursores `next` hasta ADMIN_API_LISTAR_MAXIMO filas; es
+  para catálogos acotados. Los listados que crecen se muestran por páginas
+  con obtener() y el cursor de la respuesta.
+- en_paralelo() y listar_varios() hacen en un pool de hilos las llamadas que no
+  dependen entre sí: la página tarda lo que la más lenta y no la suma.
+- Los catálogos y facetas (ADMIN_API_CACHE: ruta → segundos) se guardan en memoria.
+  Vencido el TTL, durante ADMIN_API_STALE segundos más se sigue entregando la
+  copia vieja mientras se refresca en segundo plano; pasado eso se vuelve a
+  pedir en línea. La clave es la URL más los `params` ordenados. Solo se
+  cachean llamadas sin cookies (datos públicos).
+- Las llamadas que modifican datos (todo lo que no es GET, o autenticar=True)
+  van con el JWT de un usuario staff: el cliente inicia sesión en token/ con
+  ADMIN_API_USUARIO / ADMIN_API_CLAVE, guarda el par de tokens y, si la API
+  responde 401, renueva el access (token/refresh/, o un login nuevo) y
+  reintenta una vez.
+- Cada llamada deja su latencia en el log 'adminpanel.cliente_api'.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlencode
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+ADMIN_API_TIMEOUT = getattr(settings, 'ADMIN_API_TIMEOUT', (3.05, 15))
+ADMIN_API_HILOS = getattr(settings, 'ADMIN_API_HILOS', 8)
+ADMIN_API_CACHE = getattr(settings, 'ADMIN_API_CACHE', {
+    'facetas/': 60,
+    'profesiones/': 300,
+    'servicios/': 60,
+    'usuarios/': 60,
+})
+ADMIN_API_STALE = getattr(settings, 'ADMIN_API_STALE', 600)
+ADMIN_API_LISTAR_MAXIMO = getattr(settings, 'ADMIN_API_LISTAR_MAXIMO', 1000)
+ADMIN_API_USUARIO = getattr(settings, 'ADMIN_API_USUARIO', '')
+ADMIN_API_CLAVE = getattr(settings, 'ADMIN_API_CLAVE', '')
+
+
+class ClienteAPI:
+    def __init__(self, base_url, timeout=ADMIN_API_TIMEOUT, hilos=ADMIN_API_HILOS,
+                 cache=ADMIN_API_CACHE, stale=ADMIN_API_STALE, listar_maximo=ADMIN_API_LISTAR_MAXIMO,
+                 usuario=ADMIN_API_USUARIO, clave=ADMIN_API_CLAVE):
+        self.base_url = base_url.rstrip('/')
+        self.listar_maximo = listar_maximo
+        self.usuario = usuario
+        self.clave = clave
+        self._tokens = None       # {'access', 'refresh'} del usuario staff
+        self._tokens_lock = threading.Lock()
+        self.timeout = timeout
+        self.ttls = cache
+        self.stale = stale
+        self.sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=hilos, pool_maxsize=hilos)
+        self.sesion.mount('https://', adaptador)
+        self.sesion.mount('http://', adaptador)
+        self._hilos = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='cliente-api')
+        self._cache = {}          # clave (url + params) → (guardado_en, resultados)
+        self._refrescando = set()
+        self._lock = threading.Lock()
+
+    def url(self, ruta):
+        return ruta if ruta.startswith(('http://', 'https://')) else f'{self.base_url}/{ruta.lstrip("/")}'
+
+    def solicitar(self, metodo, ruta, autenticar=None, **kwargs):
+        """
+        Una llamada con timeout; retorna la Response o lanza la excepción de
+        requests. Salvo autenticar=False, lo que no es GET va con el JWT staff.
+        """
+        if autenticar is None:
+            autenticar = metodo != 'GET'
+        if not autenticar:
+            return self._enviar(metodo, ruta, **kwargs)
+
+        access = self._access()
+        respuesta = self._enviar(metodo, ruta, **self._con_token(access, kwargs))
+        if respuesta.status_code == 401 and access:
+            # Access vencido: se renueva y se reintenta una vez
+            respuesta = self._enviar(metodo, ruta, **self._con_token(self._renovar(access), kwargs))
+        return respuesta
+
+    # ── Credencial staff ───────────────────────────────────────────────
+    @staticmethod
+    def _con_token(access, kwargs):
+        if not access:
+            return kwargs
+        return dict(kwargs, headers={**kwargs.get('headers', {}), 'Authorization': f'Bearer {access}'})
+
+    def _access(self):
+        with self._tokens_lock:
+            if self._tokens is None:
+                self._tokens = self._iniciar_sesion()
+            return self._tokens and self._tokens['access']
+
+    def _renovar(self, vencido):
+        with self._tokens_lock:
+            if self._tokens and self._tokens['access'] != vencido:
+                return self._tokens['access']   # Otro hilo ya lo renovó
+            tokens = None
+            if self._tokens:
+                r = self._enviar('POST', 'token/refresh/', json={'refresh': self._tokens['refresh']})
+                if r.ok:
+                    tokens = dict(self._tokens, **r.json())
+            self._tokens = tokens or self._iniciar_sesion()
+            return self._tokens and self._tokens['access']
+
+    def _iniciar_sesion(self):
+        """Par de tokens del usuario staff, o None si no hay credenciales o fallan."""
+        if not (self.usuario and self.clave):
+            logger.warning('ADMIN_API_USUARIO / ADMIN_API_CLAVE sin configurar: llamada sin credencial')
+            return None
+        r = self._enviar('POST', 'token/', json={'username': self.usuario, 'password': self.clave})
+        if not r.ok:
+            logger.error('La API rechazó las credenciales del panel (%s)', r.status_code)
+            return None
+        return r.json()
+
+    def _enviar(self, metodo, ruta, **kwargs):
+        url = self.url(ruta)
+        kwargs.setdefault('timeout', self.timeout)
+        inicio = time.monotonic()
+        try:
+            respuesta = self.sesion.request(metodo, url, **kwargs)
+        except requests.RequestException:
+            logger.warning('%s %s falló tras %.0f ms', metodo, url, (time.monotonic() - inicio) * 1000)
+            raise
+        logger.info('%s %s → %s en %.0f ms', metodo, url, respuesta.status_code,
+                    (time.monotonic() - inicio) * 1000)
+        return respuesta
+
+    def get(self, ruta, **kwargs):
+        return self.solicitar('GET', ruta, **kwargs)
+
+    def post(self, ruta, **kwargs):
+        return self.solicitar('POST', ruta, **kwargs)
+
+    def patch(self, ruta, **kwargs):
+        return self.solicitar('PATCH', ruta, **kwargs)
+
+    def _listar_sin_cache(self, url, **kwargs):
+        """
+        GET a un listado de la API. Los listados vienen paginados por cursor
+        ({"next", "results"}); se siguen los enlaces `next` hasta juntar todo
+        o llegar a listar_maximo filas. Retorna None si la API responde con
+        error o no responde.
+        """
+        resultados = []
+        try:
+            while url:
+                r = self.get(url, **kwargs)
+                if not r.ok:
+                    return None
+                data = r.json()
+                if isinstance(data, list):
+                    return (resultados + data)[:self.listar_maximo]
+                resultados.extend(data.get('results', []))
+                url = data.get('next')
+                if url and len(resultados) >= self.listar_maximo:
+                    logger.warning('%s truncado en %s filas; usar paginación', url, self.listar_maximo)
+                    return resultados[:self.listar_maximo]
+        except requests.RequestException:
+            return None
+        return resultados
+
+    def _obtener_sin_cache(self, url, **kwargs):
+        try:
+            r = self.get(url, **kwargs)
+        except requests.RequestException:
+            return None
+        return r.json() if r.ok else None
+
+    def listar(self, ruta, **kwargs):
+        return self._con_cache(ruta, self._listar_sin_cache, **kwargs)
+
+    def obtener(self, ruta, **kwargs):
+        """GET de un recurso que no es listado. Retorna el JSON, o None si hubo error."""
+        return self._con_cache(ruta, self._obtener_sin_cache, **kwargs)
+
+    @staticmethod
+    def _clave(url, params):
+        if not params:
+            return url
+        pares = params.items() if hasattr(params, 'items') else params
+        return f'{url}?{urlencode(sorted(pares), doseq=True)}'
+
+    def _con_cache(self, ruta, cargar, **kwargs):
+        url = self.url(ruta)
+        ttl = self.ttls.get(ruta.split('?')[0].lstrip('/'))
+        if ttl is None or kwargs.get('cookies'):
+            return cargar(url, **kwargs)
+
+        clave = self._clave(url, kwargs.get('params'))
+        with self._lock:
+            guardado = self._cache.get(clave)
+        if guardado is not None:
+            edad = time.monotonic() - guardado[0]
+            if edad < ttl:
+                return guardado[1]
+            if edad < ttl + self.stale:
+                self._refrescar_en_segundo_plano(clave, url, cargar, **kwargs)
+                return guardado[1]
+        return self._guardar(clave, cargar(url, **kwargs))
+
+    def _guardar(self, clave, resultados):
+        # Los errores no se guardan: la próxima vista vuelve a intentar
+        if resultados is not None:
+            with self._lock:
+                self._cache[clave] = (time.monotonic(), resultados)
+        return resultados
+
+    def _refrescar_en_segundo_plano(self, clave, url, cargar, **kwargs):
+        with self._lock:
+            if clave in self._refrescando:
+                return
+            self._refrescando.add(clave)
+
+        def refrescar():
+            try:
+                self._guardar(clave, cargar(url, **kwargs))
+            finally:
+                with self._lock:
+                    self._refrescando.discard(clave)
+
+        self._hilos.submit(refrescar)
+
+    def en_paralelo(self, *llamadas):
+        """Ejecuta las funciones sin argumentos en el pool; retorna sus resultados en orden."""
+        futuros = [self._hilos.submit(llamada) for llamada in llamadas]
+        return [f.result() for f in futuros]
+
+    def listar_varios(self, *rutas, **kwargs):
+        """listar() de cada ruta en paralelo; retorna los resultados en el mismo orden."""
+        return self.en_paralelo(*(partial(self.listar, ruta, **kwargs) for ruta in rutas))
@@ -1,74 +1,107 @@
+from urllib.parse import parse_qs, urlparse
+
 import requests
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse, HttpResponse
+from django.utils.dateparse import parse_datetime
+
+from .cliente_api import ClienteAPI
 
 API_BASE_URL = 'https://Recnok.pythonanywhere.com/api'
 
-def usuarios_admin(request):
-    return render(request, 'usuarios_admin.html')
+api = ClienteAPI(API_BASE_URL)
 
-def pagos_pendientes_view(request):
-    trabajadores_res = requests.get(f'{API_BASE_URL}/trabajadores/', cookies=request.COOKIES)
-    if trabajadores_res.status_code != 200:
-        return render(request, 'admin/pagos_admin.html', {'trabajadores': []})
+def enlace_siguiente(request, pagina):
+    """Query string de la página siguiente: los filtros actuales más el cursor de `next`."""
+    if not pagina.get('next'):
+        return None
+    cursor = parse_qs(urlparse(pagina['next']).query).get('cursor')
+    if not cursor:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = cursor[0]
+    return query.urlencode()
 
-    trabajadores = trabajadores_res.json()
-    data = []
+def usuarios_admin(request):
+    return render(request, 'usuarios_admin.html')
 
+def pagos_pendientes(request):
+    """
+    Pagos sin liberar ya agrupados por trabajador, en una sola llamada a la API.
+    """
+    try:
+        r = api.get('pagos/pendientes-por-trabajador/', cookies=request.COOKIES)
+    except requests.RequestException:
+        return []
+    if not r.ok:
+        return []
+    trabajadores = r.json()['trabajadores']
     for t in trabajadores:
-        reservas_res = requests.get(f"{API_BASE_URL}/reservas/?trabajador={t['id']}", cookies=request.COOKIES)
-        if reservas_res.status_code != 200:
-            continue
-
-        reservas = reservas_res.json()
-        pendientes = []
-        for r in reservas:
-            boleta = r.get('boleta')
-            if boleta and not boleta.get('liberado'):
-                pendientes.append(r)
-
-        if pendientes:
-            t['citas_pendientes'] = pendientes
-            data.append(t)
+        for c in t['citas_pendientes']:
+            c['fecha_pago'] = parse_datetime(c['fecha_pago'] or '')
+            c['fecha_preferida'] = parse_datetime(c['fecha_preferida'] or '')
+    return trabajadores
 
-    return render(request, 'pagos_admin.html', {'trabajadores': data})
+def pagos_pendientes_view(request):
+    return render(request, 'pagos_admin.html', {'trabajadores': pagos_pendientes(request)})
 
 def trabajadores_admin(request):
+    """
+    Una página de trabajadores filtrada en la API (ver TrabajadorFiltro);
+    la paginación sigue el cursor de la respuesta.
+    """
     especialidad_id = request.GET.get('especialidad')
     comuna = request.GET.get('comuna')
-
-    r = requests.get(f'{API_BASE_URL}/trabajadores/')
-    trabajadores = r.json() if r.ok else []
-
-    r2 = requests.get(f'{API_BASE_URL}/profesiones/')
-    especialidades = r2.json() if r2.ok else []
-
-    r3 = requests.get(f'{API_BASE_URL}/usuarios/')
-    comunas = list(set(u['direccion'] for u in r3.json() if u['direccion'])) if r3.ok else []
+    rating_min = request.GET.get('rating_min')
+    verificado = request.GET.get('verificado')
+
+    params = {
+        'profesion': especialidad_id,
+        'comuna': comuna,
+        'rating_min': rating_min,
+        'estado_verificado': verificado,
+        'cursor': request.GET.get('cursor'),
+    }
+    params = {k: v for k, v in params.items() if v}
+    pagina, facetas = api.en_paralelo(
+        lambda: api.obtener('trabajadores/', params=params) or {},
+        lambda: api.obtener('facetas/') or {},
+    )
+
+    siguiente = enlace_siguiente(request, pagina)
 
     return render(request, 'trabajadores_admin.html', {
-        'trabajadores': trabajadores,
-        'especialidades': especialidades,
-        'comunas': [{'id': c, 'nombre_comuna': c} for c in comunas],
+        'trabajadores': pagina.get('results', []),
+        'siguiente': siguiente,
+        'especialidades': facetas.get('profesiones', []),
+        'comunas': [{'id': c['nombre'], 'nombre_comuna': c['nombre']} for c in facetas.get('comunas', [])],
+        'ratings': [1, 2, 3, 4, 5],
         'especialidad_seleccionada': especialidad_id,
         'comuna_seleccionada': comuna,
+        'rating_seleccionado': rating_min,
+        'verificado_seleccionado': verificado,
     })
 
 def trabajador_historial(request, trabajador_id):
-    r = requests.get(f'{API_BASE_URL}/trabajadores/{trabajador_id}/historial/')
-    data = r.json() if r.ok else []
-    return render(request, 'trabajador_historial.html', {'trabajador_id': trabajador_id, 'data': data})
+    contexto = {'trabajador_id': trabajador_id, 'data': []}
+    try:
+        r = api.get(f'trabajadores/{trabajador_id}/historial/')
+    except requests.RequestException:
+        return render(request, 'trabajador_historial.html', contexto, status=502)
+    if r.ok:
+        contexto['data'] = r.json()
+    return render(request, 'trabajador_historial.html', contexto)
 
 def servicios_admin(request):
     tipo_id = request.GET.get('tipo')
     comuna = request.GET.get('comuna')
 
-    r = requests.get(f'{API_BASE_URL}/servicios/')
-    servicios = r.json() if r.ok else []
-
-    r2 = requests.get(f'{API_BASE_URL}/usuarios/')
-    comunas = list(set(u['direccion'] for u in r2.json() if u['direccion'])) if r2.ok else []
+    servicios, facetas = api.en_paralelo(
+        lambda: api.listar('servicios/') or [],
+        lambda: api.obtener('facetas/') or {},
+    )
+    comunas = [c['nombre'] for c in facetas.get('comunas', [])]
 
     return render(request, 'servicios_admin.html', {
         'servicios': servicios,
@@ -83,8 +116,7 @@ def notificaciones_admin(request):
 
 def reportes_clientes(request):
     rol = request.GET.get('rol')
-    r = requests.get(f'{API_BASE_URL}/feedback/')
-    data = r.json() if r.ok else []
+    data = api.listar('feedback/') or []
     sin_responder = sum(1 for x in data if not x.get('respuesta'))
 
     if rol:
@@ -97,42 +129,15 @@ def reportes_clientes(request):
     })
 
 def pendientes_verificacion(request):
-    r = requests.get(f'{API_BASE_URL}/trabajadores/')
-    trabajadores = [t for t in r.json() if not t.get('estado_verificado')] if r.ok else []
-    return render(request, 'pendientes_verificacion.html', {'trabajadores': trabajadores})
+    params = {'estado_verificado': 'false', 'cursor': request.GET.get('cursor')}
+    pagina = api.obtener('trabajadores/', params={k: v for k, v in params.items() if v}) or {}
+    return render(request, 'pendientes_verificacion.html', {
+        'trabajadores': pagina.get('results', []),
+        'siguiente': enlace_siguiente(request, pagina),
+    })
 
 def pagos_admin(request):
-    r = requests.get(f'{API_BASE_URL}/pagos/', cookies=request.COOKIES)
-    pagos_raw = r.json() if r.ok else []
-
-    trabajadores_dict = {}
-
-    for p in pagos_raw:
-        if p.get('liberado'):
-            continue
-
-        solicitud = p.get('solicitud')
-        if not solicitud or not solicitud.get('trabajador_asignado'):
-            continue
-
-        trabajador_id = solicitud['trabajador_asignado']
-        usuario = solicitud['cliente']['usuario']
-
-        if trabajador_id not in trabajadores_dict:
-            trabajadores_dict[trabajador_id] = {
-                'id': trabajador_id,
-                'nombre': f"Trabajador {trabajador_id}",
-                'citas_pendientes': []
-            }
-
-        trabajadores_dict[trabajador_id]['citas_pendientes'].append({
-            'id': solicitud['id'],
-            'monto': p['monto'],
-            'pago_id': p['id']
-        })
-
-    trabajadores = list(trabajadores_dict.values())
-    return render(request, 'pagos_admin.html', {'trabajadores': trabajadores})
+    return render(request, 'pagos_admin.html', {'trabajadores': pagos_pendientes(request)})
 
 def dashboard_admin(request):
     return render(request, 'dashboard_admin.html')
@@ -141,37 +146,74 @@ def acciones(request):
     return render(request, 'acciones.html')
 
 def boletas_admin(request):
+    """
+    Una página de pagos de la ventana ?desde=&hasta=, filtrada y totalizada
+    en la API; la paginación sigue el cursor de la respuesta.
+    """
     desde = request.GET.get('desde')
     hasta = request.GET.get('hasta')
-    r = requests.get(f'{API_BASE_URL}/boletas/')
-    data = r.json() if r.ok else []
-
-    if desde:
-        data = [b for b in data if b['fecha_pago'] >= desde]
-    if hasta:
-        data = [b for b in data if b['fecha_pago'] <= hasta]
-
-    return render(request, 'boletas_admin.html', {'boletas': data, 'desde': desde, 'hasta': hasta})
+    params = {'desde': desde, 'hasta': hasta, 'cursor': request.GET.get('cursor')}
+    params = {k: v for k, v in params.items() if v}
+    params['expand'] = ''   # solicitud como id, sin anidar cliente y servicio
+    pagina = api.obtener('pagos/', params=params) or {}
+
+    boletas = pagina.get('results', [])
+    for b in boletas:
+        b['fecha_pago'] = parse_datetime(b['fecha_pago'] or '')
+
+    siguiente = enlace_siguiente(request, pagina)
+
+    return render(request, 'boletas_admin.html', {
+        'boletas': boletas,
+        'totales': pagina.get('totales'),
+        'siguiente': siguiente,
+        'desde': desde,
+        'hasta': hasta,
+    })
 
 def citas_admin(request):
-    r = requests.get(f'{API_BASE_URL}/solicitudes/')
-    citas = r.json() if r.ok else []
-    return render(request, 'citas_admin.html', {'citas': citas})
+    params = {'cursor': request.GET.get('cursor')} if request.GET.get('cursor') else None
+    pagina = api.obtener('solicitudes/', params=params) or {}
+    return render(request, 'citas_admin.html', {
+        'citas': pagina.get('results', []),
+        'siguiente': enlace_siguiente(request, pagina),
+    })
 
 @csrf_exempt
 def liberar_pago(request, boleta_id):
     if request.method == 'PATCH':
-        url = f'{API_BASE_URL}/boletas/{boleta_id}/liberar/'
-        r = requests.patch(url, json={'estado_pago': 'pagado'})
+        try:
+            r = api.post('pagos/liberar/', json={'pagos': [boleta_id]})
+        except requests.RequestException:
+            return JsonResponse({'ok': False}, status=502)
         return JsonResponse({'ok': r.ok}, status=200 if r.ok else 400)
     return HttpResponse(status=405)
 
+@csrf_exempt
+def liberar_pagos(request):
+    """
+    Libera en una sola llamada a la API los pagos indicados o todos los
+    pendientes de un trabajador: {"pagos": [id, ...]} o {"trabajador": id}.
+    """
+    if request.method == 'POST':
+        import json
+        data = json.loads(request.body)
+        try:
+            r = api.post('pagos/liberar/', json=data)
+        except requests.RequestException:
+            return JsonResponse({'ok': False}, status=502)
+        return JsonResponse(r.json() if r.ok else {'ok': False}, status=200 if r.ok else 400)
+    return HttpResponse(status=405)
+
 @csrf_exempt
 def responder_feedback(request, feedback_id):
     if request.method == 'POST':
         import json
         data = json.loads(request.body)
-        r = requests.post(f'{API_BASE_URL}/feedback/{feedback_id}/respuesta/', json={'respuesta': data['respuesta']})
+        try:
+            r = api.post(f'feedback/{feedback_id}/respuesta/', json={'respuesta': data['respuesta']})
+        except requests.RequestException:
+            return JsonResponse({'ok': False}, status=502)
         return JsonResponse({'ok': r.ok}, status=200 if r.ok else 400)
     return HttpResponse(status=405)
 
@@ -180,6 +222,9 @@ def verificar_trabajador(request, trabajador_id):
     if request.method == 'PATCH':
         import json
         data = json.loads(request.body)
-        r = requests.patch(f'{API_BASE_URL}/trabajadores/{trabajador_id}/', json={'estado_verificado': data['estado']})
+        try:
+            r = api.patch(f'trabajadores/{trabajador_id}/verificar/', json={'estado_verificado': bool(data['estado'])})
+        except requests.RequestException:
+            return JsonResponse({'ok': False}, status=502)
         return JsonResponse({'ok': r.ok}, status=200 if r.ok else 400)
     return HttpResponse(status=405)
@@ -5,12 +5,23 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+El stream de mensajes (/api/chats/<id>/stream/) mantiene conexiones abiertas
+y necesita servirse por ASGI, p. ej. `uvicorn Servimatch_api.asgi:application`
+(así lo levanta "Iniciar Backend.bat"); bajo WSGI responde 501.
+Con varios workers, usar PUBSUB_BACKEND = 'core.pubsub.RedisPubSub'.
+En DEBUG también sirve los estáticos, como lo hacía runserver.
 """
 
 import os
 
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Servimatch_api.settings')
 
 application = get_asgi_application()
+
+if settings.DEBUG:
+    application = ASGIStaticFilesHandler(application)
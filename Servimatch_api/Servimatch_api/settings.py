@@ -44,8 +44,13 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.PaginacionCursor',
 }
 
+# Tamaño de página por defecto y tope para ?page_size= en los listados
+PAGINACION_TAMANO = 50
+PAGINACION_TAMANO_MAXIMO = 200
+
 CORS_ALLOW_ALL_ORIGINS = True  # SÓLO PARA DESARROLLO
 
 ROOT_URLCONF = 'Servimatch_api.urls'
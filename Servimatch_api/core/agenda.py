@@ -0,0 +1,172 @@
+"""
+Agenda de los trabajadores: disponibilidad semanal y horarios reservables.
+
+La disponibilidad llega como el JSON que guarda la app en
+Trabajador.disponibilidad: {"lunes": [{"inicio": "08:00", "fin": "13:00"}], ...}.
+Algunos registros antiguos quedaron con el repr de Python (comillas simples),
+así que también se aceptan. Al guardar un Trabajador el texto se copia a filas
+de DisponibilidadTrabajador, que son las que se consultan.
+"""
+import ast
+import json
+import unicodedata
+from datetime import datetime, timedelta, time
+
+from django.conf import settings
+
+DIAS_SEMANA = ['lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo']
+
+SLOTS_PASO_MINUTOS = getattr(settings, 'SLOTS_PASO_MINUTOS', 30)
+SLOTS_RANGO_MAXIMO_DIAS = getattr(settings, 'SLOTS_RANGO_MAXIMO_DIAS', 62)
+
+
+def leer_dia_semana(nombre):
+    """'Miércoles' → 2, '2' → 2; None si no es un día."""
+    if str(nombre).strip().isdigit():
+        dia = int(nombre)
+        return dia if 0 <= dia < len(DIAS_SEMANA) else None
+    texto = unicodedata.normalize('NFKD', str(nombre))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).casefold().strip()
+    return DIAS_SEMANA.index(texto) if texto in DIAS_SEMANA else None
+
+
+def leer_hora(texto):
+    try:
+        return datetime.strptime(str(texto).strip(), '%H:%M').time()
+    except ValueError:
+        return None
+
+
+def leer_disponibilidad(texto):
+    """
+    Convierte el texto guardado en {dia_semana: [(inicio, fin), ...]} con
+    dia_semana 0 = lunes. Lo que no se entiende (días desconocidos, horas
+    mal escritas, franjas vacías) se descarta.
+    """
+    if not texto:
+        return {}
+    try:
+        datos = json.loads(texto)
+    except ValueError:
+        try:
+            datos = ast.literal_eval(texto)
+        except (ValueError, SyntaxError):
+            return {}
+    if not isinstance(datos, dict):
+        return {}
+
+    franjas = {}
+    for nombre, lista in datos.items():
+        dia = leer_dia_semana(nombre)
+        if dia is None or not isinstance(lista, list):
+            continue
+        for franja in lista:
+            if not isinstance(franja, dict):
+                continue
+            inicio, fin = leer_hora(franja.get('inicio', '')), leer_hora(franja.get('fin', ''))
+            if inicio and fin and inicio < fin:
+                franjas.setdefault(dia, []).append((inicio, fin))
+    for lista in franjas.values():
+        lista.sort()
+    return franjas
+
+
+def franjas_guardadas(trabajador):
+    """{dia_semana: [(inicio, fin), ...]} desde la tabla DisponibilidadTrabajador."""
+    franjas = {}
+    for fila in trabajador.disponibilidades.all():
+        franjas.setdefault(fila.dia_semana, []).append((fila.inicio, fila.fin))
+    for lista in franjas.values():
+        lista.sort()
+    return franjas
+
+
+def sincronizar_disponibilidad(trabajador):
+    """
+    Reescribe las filas de DisponibilidadTrabajador a partir del texto de
+    Trabajador.disponibilidad. Si ya coinciden no escribe nada.
+    """
+    from .models import DisponibilidadTrabajador
+
+    nuevas = leer_disponibilidad(trabajador.disponibilidad)
+    actuales = {}
+    for dia, inicio, fin in DisponibilidadTrabajador.objects.filter(trabajador=trabajador) \
+            .values_list('dia_semana', 'inicio', 'fin'):
+        actuales.setdefault(dia, []).append((inicio, fin))
+    for lista in actuales.values():
+        lista.sort()
+    if actuales == nuevas:
+        return
+
+    DisponibilidadTrabajador.objects.filter(trabajador=trabajador).delete()
+    DisponibilidadTrabajador.objects.bulk_create([
+        DisponibilidadTrabajador(trabajador=trabajador, dia_semana=dia, inicio=inicio, fin=fin)
+        for dia, franjas in nuevas.items()
+        for inicio, fin in franjas
+    ])
+
+
+def _minutos(t):
+    return t.hour * 60 + t.minute
+
+
+def _hora_desde_minutos(minutos):
+    return time(minutos // 60, minutos % 60)
+
+
+def calcular_slots(franjas, duracion, ocupados, desde, hasta, paso=SLOTS_PASO_MINUTOS, ahora=None):
+    """
+    Horarios de inicio reservables entre `desde` y `hasta` (inclusive).
+
+    franjas:  {dia_semana: [(inicio, fin), ...]} (ver leer_disponibilidad)
+    duracion: timedelta del plan
+    ocupados: {fecha: [(hora_inicio, hora_fin), ...]} de las reservas vigentes
+    ahora:    datetime local; descarta los inicios que ya pasaron
+
+    Retorna {fecha: [(hora_inicio, hora_fin), ...]} solo con los días que tienen horarios.
+    """
+    largo = int(duracion.total_seconds() // 60)
+    if largo <= 0 or paso <= 0:
+        return {}
+
+    slots = {}
+    fecha = desde
+    while fecha <= hasta:
+        minimo = None
+        if ahora is not None:
+            if fecha < ahora.date():
+                fecha += timedelta(days=1)
+                continue
+            if fecha == ahora.date():
+                minimo = ahora.hour * 60 + ahora.minute + 1
+
+        reservas = sorted((_minutos(i), _minutos(f)) for i, f in ocupados.get(fecha, ()))
+        del_dia = []
+        for inicio, fin in franjas.get(fecha.weekday(), ()):
+            candidato, limite = _minutos(inicio), _minutos(fin)
+            if minimo is not None and candidato < minimo:
+                # Alinear al paso dentro de la franja
+                candidato += -(-(minimo - candidato) // paso) * paso
+            k = 0
+            while candidato + largo <= limite:
+                termino = candidato + largo
+                # Las reservas que terminan antes del candidato ya no chocan con ninguno posterior
+                while k < len(reservas) and reservas[k][1] <= candidato:
+                    k += 1
+                choque = None
+                j = k
+                while j < len(reservas) and reservas[j][0] < termino:
+                    if reservas[j][1] > candidato:
+                        choque = reservas[j]
+                        break
+                    j += 1
+                if choque is None:
+                    del_dia.append((_hora_desde_minutos(candidato), _hora_desde_minutos(termino)))
+                    candidato += paso
+                else:
+                    # Saltar hasta el primer inicio alineado después de la reserva
+                    candidato += max(1, -(-(choque[1] - candidato) // paso)) * paso
+        if del_dia:
+            slots[fecha] = sorted(set(del_dia))
+        fecha += timedelta(days=1)
+    return slots
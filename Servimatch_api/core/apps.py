@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # Barrido opcional de retenciones vencidas dentro de los procesos web:
+        # arranca con la primera solicitud (ver core.reservas.iniciar_barrido).
+        # Sin el setting, usar el comando liberar_reservas_vencidas desde cron.
+        from django.conf import settings
+        if getattr(settings, 'RESERVAS_BARRIDO_INTERVALO', None):
+            from django.core.signals import request_started
+            from .reservas import iniciar_barrido
+            request_started.connect(iniciar_barrido, dispatch_uid='core.iniciar_barrido')
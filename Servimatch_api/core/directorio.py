@@ -0,0 +1,180 @@
+"""
+Directorio en memoria de trabajadores para búsquedas por cercanía y servicio.
+
+Mantiene una foto columnar (arrays de NumPy) de todos los trabajadores
+geolocalizados: id, latitud, longitud, rating y una matriz booleana
+trabajador x servicio. La búsqueda se resuelve en una sola pasada vectorizada,
+sin tocar la base de datos. La foto es local al proceso: se actualiza por fila
+desde las señales de `core.signals` y se reconstruye completa cada
+DIRECTORIO_TTL segundos para absorber cambios hechos por otros procesos.
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .geo import RADIO_TIERRA_KM
+
+DIRECTORIO_TTL = getattr(settings, 'DIRECTORIO_TTL', 300)
+
+
+class DirectorioTrabajadores:
+    def __init__(self, ttl=DIRECTORIO_TTL):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._cargado_en = None
+        self._vaciar()
+
+    def _vaciar(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.latitud = np.empty(0, dtype=np.float64)
+        self.longitud = np.empty(0, dtype=np.float64)
+        self.rating = np.empty(0, dtype=np.float64)
+        self.servicios = np.zeros((0, 0), dtype=bool)
+        self._fila = {}        # trabajador_id -> índice de fila
+        self._columna = {}     # servicio_id   -> índice de columna
+
+    # ── Carga ──────────────────────────────────────────────────────────
+    def _filas_desde_bd(self, **filtros):
+        from .models import Trabajador
+
+        qs = Trabajador.objects.filter(
+            latitud__isnull=False, longitud__isnull=False, **filtros
+        ).values_list('pk', 'latitud', 'longitud', 'rating_sum', 'rating_count')
+
+        filas = {
+            pk: (lat, lng, suma / cantidad if cantidad else 0.0, [])
+            for pk, lat, lng, suma, cantidad in qs
+        }
+        if filas:
+            relaciones = Trabajador.servicios.through.objects.filter(
+                trabajador_id__in=list(filas)
+            ).values_list('trabajador_id', 'servicio_id')
+            for trabajador_id, servicio_id in relaciones:
+                filas[trabajador_id][3].append(servicio_id)
+        return filas
+
+    def recargar(self):
+        """Reconstruye la foto completa (2 consultas)."""
+        filas = self._filas_desde_bd()
+        with self._lock:
+            self._vaciar()
+            n = len(filas)
+            self.ids = np.fromiter(filas.keys(), dtype=np.int64, count=n)
+            self.latitud = np.fromiter((f[0] for f in filas.values()), dtype=np.float64, count=n)
+            self.longitud = np.fromiter((f[1] for f in filas.values()), dtype=np.float64, count=n)
+            self.rating = np.fromiter((f[2] for f in filas.values()), dtype=np.float64, count=n)
+            self._fila = {int(pk): i for i, pk in enumerate(self.ids)}
+
+            todos = sorted({s for f in filas.values() for s in f[3]})
+            self._columna = {s: j for j, s in enumerate(todos)}
+            self.servicios = np.zeros((n, len(todos)), dtype=bool)
+            for i, f in enumerate(filas.values()):
+                for s in f[3]:
+                    self.servicios[i, self._columna[s]] = True
+            self._cargado_en = time.monotonic()
+
+    def _asegurar_cargado(self):
+        with self._lock:
+            vencido = (
+                self._cargado_en is None
+                or time.monotonic() - self._cargado_en > self.ttl
+            )
+        if vencido:
+            self.recargar()
+
+    def invalidar(self):
+        with self._lock:
+            self._cargado_en = None
+
+    # ── Actualización incremental ──────────────────────────────────────
+    def actualizar(self, trabajador_id):
+        """Refresca (o agrega/quita) la fila de un trabajador."""
+        with self._lock:
+            if self._cargado_en is None:
+                return  # Se cargará completo en la próxima búsqueda
+
+        filas = self._filas_desde_bd(pk=trabajador_id)
+        with self._lock:
+            if trabajador_id not in filas:
+                self.quitar(trabajador_id)
+                return
+
+            lat, lng, rating, servicios = filas[trabajador_id]
+            i = self._fila.get(trabajador_id)
+            if i is None:
+                i = len(self.ids)
+                self.ids = np.append(self.ids, trabajador_id)
+                self.latitud = np.append(self.latitud, lat)
+                self.longitud = np.append(self.longitud, lng)
+                self.rating = np.append(self.rating, rating)
+                self.servicios = np.vstack([
+                    self.servicios, np.zeros((1, self.servicios.shape[1]), dtype=bool)
+                ])
+                self._fila[trabajador_id] = i
+            else:
+                self.latitud[i] = lat
+                self.longitud[i] = lng
+                self.rating[i] = rating
+
+            nuevos = [s for s in servicios if s not in self._columna]
+            if nuevos:
+                for s in nuevos:
+                    self._columna[s] = len(self._columna)
+                self.servicios = np.hstack([
+                    self.servicios, np.zeros((len(self.ids), len(nuevos)), dtype=bool)
+                ])
+            self.servicios[i, :] = False
+            for s in servicios:
+                self.servicios[i, self._columna[s]] = True
+
+    def actualizar_rating(self, trabajador_id, rating):
+        with self._lock:
+            i = self._fila.get(trabajador_id)
+            if i is not None:
+                self.rating[i] = rating
+
+    def quitar(self, trabajador_id):
+        with self._lock:
+            i = self._fila.pop(trabajador_id, None)
+            if i is None:
+                return
+            self.ids = np.delete(self.ids, i)
+            self.latitud = np.delete(self.latitud, i)
+            self.longitud = np.delete(self.longitud, i)
+            self.rating = np.delete(self.rating, i)
+            self.servicios = np.delete(self.servicios, i, axis=0)
+            self._fila = {int(pk): j for j, pk in enumerate(self.ids)}
+
+    # ── Consulta ───────────────────────────────────────────────────────
+    def buscar(self, lat, lng, radio_km, servicio_id=None):
+        """
+        Retorna [(trabajador_id, distancia_km), ...] dentro del radio,
+        ordenados por distancia.
+        """
+        self._asegurar_cargado()
+        with self._lock:
+            mascara = np.ones(len(self.ids), dtype=bool)
+            if servicio_id is not None:
+                j = self._columna.get(int(servicio_id))
+                if j is None:
+                    return []
+                mascara &= self.servicios[:, j]
+
+            ids = self.ids[mascara]
+            lat2 = np.radians(self.latitud[mascara])
+            lng2 = np.radians(self.longitud[mascara])
+
+        lat1, lng1 = np.radians(lat), np.radians(lng)
+        a = np.sin((lat2 - lat1) / 2) ** 2 \
+            + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+        distancias = 2 * RADIO_TIERRA_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+        dentro = distancias <= radio_km
+        ids, distancias = ids[dentro], distancias[dentro]
+        orden = np.argsort(distancias, kind='stable')
+        return [(int(ids[k]), float(distancias[k])) for k in orden]
+
+
+directorio = DirectorioTrabajadores()
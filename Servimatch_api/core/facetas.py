@@ -0,0 +1,42 @@
+"""
+Facetas para los filtros de los listados: comunas, profesiones y servicios
+distintos, cada uno con su conteo.
+
+Se calculan con GROUP BY en la base (values().annotate(Count())): la comuna
+sobre el índice usuario_direccion_idx, profesiones y servicios sobre las
+llaves foráneas, y el resultado queda en la caché de Django por FACETAS_TTL
+segundos. Son datos para menús desplegables, un par de minutos de atraso
+no importa.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+FACETAS_TTL = getattr(settings, 'FACETAS_TTL', 300)
+FACETAS_CLAVE = 'core:facetas'
+
+
+def calcular_facetas():
+    from .models import Profesion, Servicio, Usuario
+
+    comunas = (
+        Usuario.objects.exclude(direccion='')
+        .values('direccion').annotate(cantidad=Count('pk')).order_by('direccion')
+    )
+    profesiones = (
+        Profesion.objects.values('id', 'nombre')
+        .annotate(trabajadores=Count('trabajadores')).order_by('nombre')
+    )
+    servicios = (
+        Servicio.objects.values('id', 'nombre')
+        .annotate(trabajadores=Count('trabajadores')).order_by('nombre')
+    )
+    return {
+        'comunas': [{'nombre': c['direccion'], 'cantidad': c['cantidad']} for c in comunas],
+        'profesiones': list(profesiones),
+        'servicios': list(servicios),
+    }
+
+
+def facetas():
+    return cache.get_or_set(FACETAS_CLAVE, calcular_facetas, FACETAS_TTL)
@@ -0,0 +1,55 @@
+"""
+Filtros de django-filter para los listados de la API.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django_filters import rest_framework as filters
+
+from .models import Pago, Trabajador
+
+
+class TrabajadorFiltro(filters.FilterSet):
+    """
+    ?profesion=<id>&servicio=<id>&comuna=<texto>&rating_min=<0-5>&estado_verificado=<true|false>
+
+    Todos se combinan con AND y cada uno tiene índice detrás: profesion (llave
+    foránea), servicio (tabla intermedia), comuna (usuario_direccion_idx),
+    rating_min (trabajador_rating_idx sobre la columna generada
+    rating_promedio) y estado_verificado=false (trabajador_pendiente_idx,
+    parcial). Los verificados son la mayoría, así que para true no conviene
+    un índice propio: se apoya en los demás filtros.
+    """
+    profesion = filters.NumberFilter(field_name='profesion')
+    servicio = filters.NumberFilter(field_name='servicios')
+    comuna = filters.CharFilter(field_name='usuario__direccion')
+    rating_min = filters.NumberFilter(field_name='rating_promedio', lookup_expr='gte', min_value=0, max_value=5)
+    estado_verificado = filters.BooleanFilter()
+
+    class Meta:
+        model = Trabajador
+        fields = ['profesion', 'servicio', 'comuna', 'rating_min', 'estado_verificado']
+
+
+def inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+class PagoFiltro(filters.FilterSet):
+    """
+    ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD, ambos inclusive. Se traducen a
+    fecha_pago >= inicio de `desde` y < inicio del día siguiente a `hasta`,
+    un rango que recorre pago_fecha_idx (un filtro por __date no lo usaría).
+    """
+    desde = filters.DateFilter(method='filtrar_desde')
+    hasta = filters.DateFilter(method='filtrar_hasta')
+
+    class Meta:
+        model = Pago
+        fields = ['desde', 'hasta']
+
+    def filtrar_desde(self, queryset, name, value):
+        return queryset.filter(fecha_pago__gte=inicio_del_dia(value))
+
+    def filtrar_hasta(self, queryset, name, value):
+        return queryset.filter(fecha_pago__lt=inicio_del_dia(value + timedelta(days=1)))
@@ -0,0 +1,68 @@
+from math import asin, radians, degrees, sin, cos, sqrt, atan2
+
+RADIO_TIERRA_KM = 6371
+RADIO_BUSQUEDA_KM = 10      # Radio por defecto de las búsquedas por cercanía
+RADIO_MAXIMO_KM = 50        # Tope para ?radius=
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Distancia en km entre dos puntos (lat/lng en grados)."""
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    return RADIO_TIERRA_KM * c
+
+
+def bounding_box(lat, lng, radio_km):
+    """
+    Rectángulo lat/lng que contiene el círculo de `radio_km` alrededor del punto.
+    Retorna ((lat_min, lat_max), (lng_min, lng_max)); el rango de longitud es None
+    cuando el círculo toca un polo o cruza el antimeridiano (no se puede acotar).
+    """
+    distancia_angular = radio_km / RADIO_TIERRA_KM
+    delta_lat = degrees(distancia_angular)
+    lat_min, lat_max = lat - delta_lat, lat + delta_lat
+    if lat_min <= -90 or lat_max >= 90:
+        return (max(lat_min, -90), min(lat_max, 90)), None
+
+    # Mayor diferencia de longitud dentro del círculo; radio/cos(lat) se queda
+    # corto lejos del ecuador
+    delta_lng = degrees(asin(sin(distancia_angular) / cos(radians(lat))))
+    lng_min, lng_max = lng - delta_lng, lng + delta_lng
+    if lng_min < -180 or lng_max > 180:
+        return (lat_min, lat_max), None
+    return (lat_min, lat_max), (lng_min, lng_max)
+
+
+def leer_radio(valor, por_defecto=RADIO_BUSQUEDA_KM):
+    """Interpreta ?radius= (km). Lanza ValueError si no es un número positivo."""
+    if valor in (None, ''):
+        return por_defecto
+    radio = float(valor)
+    if not radio > 0:   # también rechaza nan
+        raise ValueError('El radio debe ser positivo')
+    return min(radio, RADIO_MAXIMO_KM)
+
+
+def filtrar_cercanos(queryset, lat, lng, radio_km):
+    """
+    Filtra `queryset` (modelo con campos latitud/longitud) a los objetos dentro de
+    `radio_km`. El rectángulo se aplica en SQL (índice latitud, longitud) y solo los
+    candidatos dentro de él se refinan con haversine en Python.
+    Retorna una lista de (objeto, distancia_km) ordenada por distancia.
+    """
+    rango_lat, rango_lng = bounding_box(lat, lng, radio_km)
+    qs = queryset.filter(latitud__range=rango_lat)
+    if rango_lng is not None:
+        qs = qs.filter(longitud__range=rango_lng)
+    else:
+        qs = qs.filter(longitud__isnull=False)
+
+    resultado = []
+    for obj in qs:
+        distancia = haversine(lat, lng, obj.latitud, obj.longitud)
+        if distancia <= radio_km:
+            resultado.append((obj, distancia))
+    resultado.sort(key=lambda par: par[1])
+    return resultado
@@ -0,0 +1,201 @@
+"""
+Geocodificación de direcciones con caché.
+
+Orden de búsqueda: LRU en memoria del proceso → tabla CacheGeocodificacion →
+geocodificador configurado en settings.GEOCODIFICADOR. Las direcciones se
+normalizan (mayúsculas, tildes y espacios) antes de usarse como clave, y los
+resultados negativos también se guardan, con un TTL más corto.
+"""
+import logging
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import timedelta
+import time
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+GEOCODIFICADOR = getattr(settings, 'GEOCODIFICADOR', 'core.geocodificacion.NominatimGeocodificador')
+GEOCODIFICACION_TTL = getattr(settings, 'GEOCODIFICACION_TTL', timedelta(days=30))
+GEOCODIFICACION_TTL_NEGATIVO = getattr(settings, 'GEOCODIFICACION_TTL_NEGATIVO', timedelta(days=1))
+GEOCODIFICACION_LRU_MAX = getattr(settings, 'GEOCODIFICACION_LRU_MAX', 1024)
+
+NO_EN_CACHE = object()
+
+
+class NominatimGeocodificador:
+    """Geocodificador por defecto (OpenStreetMap). Retorna (lat, lng) o None."""
+
+    def __init__(self, user_agent='servimatch', timeout=5):
+        from geopy.geocoders import Nominatim
+        self._geolocator = Nominatim(user_agent=user_agent, timeout=timeout)
+
+    def geocodificar(self, direccion):
+        loc = self._geolocator.geocode(direccion)
+        if loc:
+            return loc.latitude, loc.longitude
+        return None
+
+
+def normalizar_direccion(direccion):
+    """'  Av. Providencia 1234,ÑUÑOA ' → 'av. providencia 1234, nunoa'"""
+    texto = unicodedata.normalize('NFKD', direccion or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r'\s*,\s*', ', ', texto.casefold())
+    return re.sub(r'\s+', ' ', texto).strip(' ,')
+
+
+class _LRU:
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is None:
+                return NO_EN_CACHE
+            coords, expira = item
+            if expira < time.monotonic():
+                del self._datos[clave]
+                return NO_EN_CACHE
+            self._datos.move_to_end(clave)
+            return coords
+
+    def guardar(self, clave, coords, ttl):
+        with self._lock:
+            self._datos[clave] = (coords, time.monotonic() + ttl.total_seconds())
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+_lru = _LRU(GEOCODIFICACION_LRU_MAX)
+_geocodificadores = {}
+
+
+def obtener_geocodificador(ruta=None):
+    ruta = ruta or getattr(settings, 'GEOCODIFICADOR', GEOCODIFICADOR)
+    if ruta not in _geocodificadores:
+        _geocodificadores[ruta] = import_string(ruta)()
+    return _geocodificadores[ruta]
+
+
+def _ttl(coords):
+    return GEOCODIFICACION_TTL if coords else GEOCODIFICACION_TTL_NEGATIVO
+
+
+def consultar_cache(direccion):
+    """
+    Retorna (lat, lng), None (resultado negativo vigente) o NO_EN_CACHE
+    si hay que ir al geocodificador.
+    """
+    from .models import CacheGeocodificacion
+
+    clave = normalizar_direccion(direccion)
+    if not clave:
+        return None
+
+    coords = _lru.obtener(clave)
+    if coords is not NO_EN_CACHE:
+        return coords
+
+    fila = CacheGeocodificacion.objects.filter(direccion=clave).first()
+    if fila is None:
+        return NO_EN_CACHE
+    coords = fila.coordenadas
+    restante = fila.actualizado + _ttl(coords) - timezone.now()
+    if restante <= timedelta(0):
+        return NO_EN_CACHE
+    _lru.guardar(clave, coords, restante)
+    return coords
+
+
+def geocodificar(direccion, geocodificador=None, propagar_errores=False):
+    """
+    Retorna (lat, lng) o None. Los errores del geocodificador (red, cuota)
+    no se guardan en caché para reintentar en la próxima llamada; con
+    `propagar_errores` se relanzan en vez de retornar None.
+    """
+    from .models import CacheGeocodificacion
+
+    coords = consultar_cache(direccion)
+    if coords is not NO_EN_CACHE:
+        return coords
+
+    clave = normalizar_direccion(direccion)
+    geocodificador = geocodificador or obtener_geocodificador()
+    try:
+        coords = geocodificador.geocodificar(direccion)
+    except Exception:
+        if propagar_errores:
+            raise
+        logger.warning('Error geocodificando %r', direccion, exc_info=True)
+        return None
+
+    lat, lng = coords if coords else (None, None)
+    CacheGeocodificacion.objects.update_or_create(
+        direccion=clave,
+        defaults={'latitud': lat, 'longitud': lng},
+    )
+    _lru.guardar(clave, coords, _ttl(coords))
+    return coords
+
+
+# Ubicación nula, vacía o solo espacios: no hay nada que geocodificar
+SIN_DIRECCION = Q(ubicacion__isnull=True) | Q(ubicacion__regex=r'^\s*$')
+
+
+def descartar_sin_direccion():
+    """Marca 'fallida' las solicitudes pendientes sin dirección. Retorna cuántas."""
+    from .models import Solicitud
+
+    return Solicitud.objects.filter(SIN_DIRECCION, estado_geocodificacion='pendiente') \
+        .update(estado_geocodificacion='fallida')
+
+
+def geocodificar_solicitud(solicitud_id):
+    """
+    Tarea en segundo plano: completa latitud/longitud de una Solicitud pendiente.
+    Si el geocodificador falla la solicitud queda 'pendiente' para reintentarse;
+    sin dirección queda 'fallida', porque reintentar no la va a resolver.
+    """
+    from .models import Solicitud
+
+    pendiente = Solicitud.objects.filter(pk=solicitud_id, estado_geocodificacion='pendiente')
+    filas = list(pendiente.values_list('ubicacion', flat=True)[:1])
+    if not filas:
+        return
+    ubicacion = filas[0]
+    if not normalizar_direccion(ubicacion):
+        pendiente.update(estado_geocodificacion='fallida')
+        return
+
+    try:
+        coords = geocodificar(ubicacion, propagar_errores=True)
+    except Exception:
+        logger.warning('Solicitud %s queda pendiente de geocodificar', solicitud_id, exc_info=True)
+        return
+
+    lat, lng = coords if coords else (None, None)
+    Solicitud.objects.filter(pk=solicitud_id, estado_geocodificacion='pendiente').update(
+        latitud=lat,
+        longitud=lng,
+        estado_geocodificacion='ok' if coords else 'fallida',
+    )
+
+
+def limpiar_cache_local():
+    _lru.limpiar()
+    _geocodificadores.clear()
@@ -0,0 +1,127 @@
+"""
+Ingesta de mensajes de chat por lotes.
+
+Con settings.CHAT_INGESTA_LOTES = True, el POST de mensajes no escribe la fila
+directamente: la deja en una cola que un hilo del proceso vacía cada
+CHAT_INGESTA_ESPERA_MS milisegundos o cada CHAT_INGESTA_MAXIMO mensajes, con
+un solo bulk_create por lote. En SQLite los escritores se serializan, así que
+menos transacciones cortas significa menos contención con reservas y pagos.
+
+La cola es FIFO y la vacía un único hilo, por lo que los ids respetan el orden
+de llegada dentro de cada chat. Quien encola espera a que su lote se confirme
+y recibe el Mensaje guardado, con id.
+
+Si el bulk_create del lote falla (un mensaje inválido basta para tumbarlo),
+el lote se reintenta fila por fila: los mensajes válidos se guardan y solo
+los rechazados reciben la excepción, que queda en el log 'core.ingesta'.
+
+Si el lote no se confirma en CHAT_INGESTA_TIMEOUT segundos (la cola está
+atascada o el hilo murió), quien encoló retira su mensaje de la cola y lo
+guarda directamente; el hilo descarta los mensajes retirados, así un
+reintento nunca lo duplica. Si el hilo ya lo estaba guardando, se espera
+ese guardado en vez de escribirlo dos veces.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+CHAT_INGESTA_MAXIMO = getattr(settings, 'CHAT_INGESTA_MAXIMO', 100)
+CHAT_INGESTA_ESPERA_MS = getattr(settings, 'CHAT_INGESTA_ESPERA_MS', 5)
+CHAT_INGESTA_TIMEOUT = getattr(settings, 'CHAT_INGESTA_TIMEOUT', 5)
+
+
+def ingesta_activa():
+    return getattr(settings, 'CHAT_INGESTA_LOTES', False)
+
+
+class IngestaMensajes:
+    def __init__(self, maximo=CHAT_INGESTA_MAXIMO, espera_ms=CHAT_INGESTA_ESPERA_MS, timeout=CHAT_INGESTA_TIMEOUT):
+        self.maximo = maximo
+        self.espera = espera_ms / 1000
+        self.timeout = timeout
+        self._cola = queue.Queue()
+        self._hilo = None
+        self._lock = threading.Lock()
+
+    def _asegurar_hilo(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name='ingesta-mensajes', daemon=True)
+                self._hilo.start()
+
+    def ingerir(self, chat_id, remitente, contenido):
+        """Encola un mensaje y espera a que se guarde. Retorna el Mensaje con id."""
+        from .models import Mensaje
+
+        futuro = Future()
+        mensaje = Mensaje(chat_id=chat_id, remitente=remitente, contenido=contenido)
+        self._asegurar_hilo()
+        self._cola.put((mensaje, futuro))
+        try:
+            return futuro.result(self.timeout)
+        except TimeoutError:
+            if not futuro.cancel():
+                # El hilo ya lo tomó: el guardado está en curso
+                return futuro.result()
+        logger.warning('La cola de ingesta no respondió en %ss; mensaje guardado directo', self.timeout)
+        mensaje.save()
+        return mensaje
+
+    def _bucle(self):
+        while True:
+            lote = [self._cola.get()]
+            limite = time.monotonic() + self.espera
+            while len(lote) < self.maximo:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            self._guardar(lote)
+
+    def _guardar(self, lote):
+        # Los mensajes que quien encoló ya retiró por timeout no se guardan
+        lote = [(mensaje, futuro) for mensaje, futuro in lote if futuro.set_running_or_notify_cancel()]
+        if not lote:
+            return
+        try:
+            self._insertar([mensaje for mensaje, _ in lote])
+        except Exception:
+            logger.warning('Falló el lote de %s mensajes; se guardan uno a uno', len(lote), exc_info=True)
+            self._guardar_uno_a_uno(lote)
+        else:
+            for mensaje, futuro in lote:
+                futuro.set_result(mensaje)
+        finally:
+            close_old_connections()
+
+    def _guardar_uno_a_uno(self, lote):
+        for mensaje, futuro in lote:
+            try:
+                self._insertar([mensaje])
+            except Exception as e:
+                logger.warning('Mensaje rechazado en el chat %s: %s', mensaje.chat_id, e)
+                futuro.set_exception(e)
+            else:
+                futuro.set_result(mensaje)
+
+    def _insertar(self, mensajes):
+        from .models import Mensaje
+        from .signals import publicar_mensajes
+
+        with transaction.atomic():
+            # bulk_create no dispara post_save: se publica a los streams a mano
+            creados = Mensaje.objects.bulk_create(mensajes)
+            publicar_mensajes(creados)
+
+
+ingesta = IngestaMensajes()
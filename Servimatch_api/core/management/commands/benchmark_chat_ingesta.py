@@ -0,0 +1,71 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.ingesta import IngestaMensajes
+from core.models import Chat, Mensaje, Usuario
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara mensajes guardados por segundo entre el POST actual '
+        '(un create por mensaje) y la ingesta por lotes. Escribe en la base '
+        'configurada y borra al final los usuarios, el chat y los mensajes de prueba.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mensajes', type=int, default=2000, help='Mensajes por modo.')
+        parser.add_argument('--hilos', type=int, default=8, help='Remitentes concurrentes.')
+        parser.add_argument('--lote', type=int, default=100, help='CHAT_INGESTA_MAXIMO para la prueba.')
+        parser.add_argument('--espera-ms', type=float, default=5, help='CHAT_INGESTA_ESPERA_MS para la prueba.')
+
+    def handle(self, *args, **opts):
+        if opts['mensajes'] <= 0 or opts['hilos'] <= 0:
+            raise CommandError('--mensajes y --hilos deben ser positivos')
+
+        cliente = Usuario.objects.create(username=f'benchmark-cliente-{time.time_ns()}')
+        trabajador = Usuario.objects.create(username=f'benchmark-trabajador-{time.time_ns()}')
+        chat = Chat.objects.create(cliente=cliente, trabajador=trabajador)
+        try:
+            ingesta = IngestaMensajes(maximo=opts['lote'], espera_ms=opts['espera_ms'])
+            modos = [
+                ('directo', lambda i: Mensaje.objects.create(chat=chat, remitente=cliente, contenido=f'm{i}')),
+                ('lotes', lambda i: ingesta.ingerir(chat.id, cliente, f'm{i}')),
+            ]
+            for nombre, escribir in modos:
+                segundos = self._medir(escribir, opts['mensajes'], opts['hilos'])
+                self.stdout.write(
+                    f'{nombre:>8}: {opts["mensajes"]} mensajes en {segundos:.2f}s '
+                    f'({opts["mensajes"] / segundos:.0f} mensajes/s)'
+                )
+        finally:
+            Usuario.objects.filter(pk__in=[cliente.pk, trabajador.pk]).delete()
+
+    def _medir(self, escribir, total, hilos):
+        errores = []
+
+        def remitente(indices):
+            try:
+                for i in indices:
+                    escribir(i)
+            except Exception as e:
+                errores.append(e)
+            finally:
+                connection.close()
+
+        trabajos = [
+            threading.Thread(target=remitente, args=(range(h, total, hilos),))
+            for h in range(hilos)
+        ]
+        inicio = time.perf_counter()
+        for t in trabajos:
+            t.start()
+        for t in trabajos:
+            t.join()
+        segundos = time.perf_counter() - inicio
+
+        if errores:
+            raise CommandError(f'{len(errores)} remitentes fallaron: {errores[0]}')
+        return segundos
@@ -0,0 +1,188 @@
+import json
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from core.geocodificacion import (
+    NO_EN_CACHE, consultar_cache, descartar_sin_direccion, geocodificar, normalizar_direccion,
+)
+from core.models import Solicitud, Trabajador, Usuario
+
+CHECKPOINT_POR_DEFECTO = os.path.join(settings.BASE_DIR, 'geocode_backfill.checkpoint.json')
+
+
+class LimiteTasa:
+    """Espacia las llamadas para no superar `rps` consultas por segundo."""
+
+    def __init__(self, rps):
+        self.intervalo = 1.0 / rps if rps > 0 else 0
+        self._ultima = None
+
+    def esperar(self):
+        if self._ultima is not None:
+            restante = self._ultima + self.intervalo - time.monotonic()
+            if restante > 0:
+                time.sleep(restante)
+        self._ultima = time.monotonic()
+
+
+class Command(BaseCommand):
+    help = (
+        'Geocodifica Solicitudes y Usuarios sin latitud/longitud. '
+        'Guarda un checkpoint por modelo para retomar una corrida interrumpida; '
+        'las filas cuyo geocodificador falló quedan en el checkpoint y se '
+        'reintentan en la siguiente corrida.'
+    )
+
+    # modelo -> campo con la dirección
+    MODELOS = {
+        'solicitudes': (Solicitud, 'ubicacion'),
+        'usuarios': (Usuario, 'direccion'),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modelo', choices=['solicitudes', 'usuarios', 'todos'], default='todos')
+        parser.add_argument('--rps', type=float, default=1.0,
+                            help='Consultas por segundo al geocodificador (Nominatim pide 1).')
+        parser.add_argument('--lote', type=int, default=200, help='Filas por lote.')
+        parser.add_argument('--checkpoint', default=CHECKPOINT_POR_DEFECTO)
+        parser.add_argument('--reiniciar', action='store_true',
+                            help='Ignora el checkpoint y parte desde el principio.')
+
+    def handle(self, *args, **opts):
+        if opts['lote'] <= 0:
+            raise CommandError('--lote debe ser positivo')
+
+        self.ruta_checkpoint = opts['checkpoint']
+        self.checkpoint = {} if opts['reiniciar'] else self._leer_checkpoint()
+        self.limite = LimiteTasa(opts['rps'])
+
+        nombres = list(self.MODELOS) if opts['modelo'] == 'todos' else [opts['modelo']]
+        for nombre in nombres:
+            self._procesar(nombre, opts['lote'])
+
+    # ── Checkpoint ─────────────────────────────────────────────────────
+    def _leer_checkpoint(self):
+        try:
+            with open(self.ruta_checkpoint) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            raise CommandError(f'Checkpoint corrupto: {self.ruta_checkpoint} (usa --reiniciar)')
+
+    def _guardar_checkpoint(self):
+        temporal = f'{self.ruta_checkpoint}.tmp'
+        with open(temporal, 'w') as f:
+            json.dump(self.checkpoint, f)
+        os.replace(temporal, self.ruta_checkpoint)
+
+    def _estado(self, nombre):
+        """{'hasta': último pk recorrido, 'reintentar': [pks con error]}"""
+        estado = self.checkpoint.get(nombre, {})
+        if isinstance(estado, int):
+            # Formato anterior: solo el último pk
+            estado = {'hasta': estado}
+        return {'hasta': estado.get('hasta', 0), 'reintentar': estado.get('reintentar', [])}
+
+    # ── Proceso ────────────────────────────────────────────────────────
+    def _procesar(self, nombre, tamano_lote):
+        modelo, campo = self.MODELOS[nombre]
+        estado = self._estado(nombre)
+        if modelo is Solicitud:
+            descartadas = descartar_sin_direccion()
+            if descartadas:
+                self.stdout.write(f'{nombre}: {descartadas} sin dirección marcadas como fallidas.')
+
+        sin_coordenadas = modelo.objects.filter(latitud__isnull=True).exclude(**{campo: ''})
+        # Las que ya no están pendientes (resueltas por otra vía) salen de la lista
+        reintentar = set(sin_coordenadas.filter(pk__in=estado['reintentar']).values_list('pk', flat=True))
+        qs = sin_coordenadas.filter(Q(pk__gt=estado['hasta']) | Q(pk__in=reintentar)) \
+            .order_by('pk') \
+            .only('pk', campo, 'latitud', 'longitud')
+        filas = qs.iterator(chunk_size=tamano_lote)
+
+        total = resueltas = consultas = 0
+        while True:
+            lote = list(islice(filas, tamano_lote))
+            if not lote:
+                break
+            r, c, errores = self._procesar_lote(modelo, campo, lote)
+            total += len(lote)
+            resueltas += r
+            consultas += c
+
+            # El checkpoint avanza, pero las filas con error quedan para reintentar
+            reintentar = (reintentar - {obj.pk for obj in lote}) | errores
+            estado = {'hasta': max(estado['hasta'], lote[-1].pk), 'reintentar': sorted(reintentar)}
+            self.checkpoint[nombre] = estado
+            self._guardar_checkpoint()
+            self.stdout.write(f'{nombre}: {total} filas, {resueltas} geocodificadas, '
+                              f'{consultas} consultas (hasta pk={estado["hasta"]})')
+
+        mensaje = f'{nombre}: listo. {resueltas}/{total} filas geocodificadas con {consultas} consultas.'
+        if reintentar:
+            mensaje += f' {len(reintentar)} con error quedan para la próxima corrida.'
+        self.stdout.write(self.style.SUCCESS(mensaje))
+
+    def _procesar_lote(self, modelo, campo, lote):
+        # Se deduplica por dirección normalizada: una consulta por dirección distinta
+        por_direccion = {}
+        consultas = 0
+        actualizados, fallidos, errores = [], [], set()
+        for obj in lote:
+            clave = normalizar_direccion(getattr(obj, campo))
+            if clave:
+                por_direccion.setdefault(clave, []).append(obj)
+            else:
+                fallidos.append(obj)
+
+        for objs in por_direccion.values():
+            direccion = getattr(objs[0], campo)
+            coords = consultar_cache(direccion)
+            if coords is NO_EN_CACHE:
+                self.limite.esperar()
+                consultas += 1
+                try:
+                    coords = geocodificar(direccion, propagar_errores=True)
+                except Exception as e:
+                    # Sin caché ni cambios: las filas quedan en el checkpoint para reintentarse
+                    self.stderr.write(f'Error geocodificando {direccion!r}: {e}')
+                    errores.update(obj.pk for obj in objs)
+                    continue
+
+            for obj in objs:
+                if coords:
+                    obj.latitud, obj.longitud = coords
+                    actualizados.append(obj)
+                else:
+                    fallidos.append(obj)
+
+        campos = ['latitud', 'longitud']
+        if modelo is Solicitud:
+            for obj in actualizados:
+                obj.estado_geocodificacion = 'ok'
+            for obj in fallidos:
+                obj.estado_geocodificacion = 'fallida'
+            modelo.objects.bulk_update(actualizados + fallidos, campos + ['estado_geocodificacion'])
+        else:
+            modelo.objects.bulk_update(actualizados, campos)
+
+        if modelo is Usuario and actualizados:
+            self._copiar_a_trabajadores(actualizados)
+
+        return len(actualizados), consultas, errores
+
+    def _copiar_a_trabajadores(self, usuarios):
+        """Los trabajadores sin coordenadas heredan las de su usuario."""
+        coords = {u.pk: (u.latitud, u.longitud) for u in usuarios}
+        trabajadores = list(
+            Trabajador.objects.filter(usuario_id__in=list(coords), latitud__isnull=True).only('pk')
+        )
+        for t in trabajadores:
+            t.latitud, t.longitud = coords[t.pk]
+        Trabajador.objects.bulk_update(trabajadores, ['latitud', 'longitud'])
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.reservas import liberar_vencidas
+
+
+class Command(BaseCommand):
+    help = (
+        'Libera las reservas PENDIENTE cuya retención venció: las marca CANCELADA '
+        '(o las borra con --borrar) en lotes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Filas por transacción.')
+        parser.add_argument('--borrar', action='store_true',
+                            help='Borra las filas en vez de marcarlas CANCELADA.')
+
+    def handle(self, *args, **opts):
+        if opts['lote'] <= 0:
+            raise CommandError('--lote debe ser positivo')
+        total = liberar_vencidas(lote=opts['lote'], borrar=opts['borrar'])
+        accion = 'borradas' if opts['borrar'] else 'canceladas'
+        self.stdout.write(self.style.SUCCESS(f'{total} reservas vencidas {accion}.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.ranking import recalcular_ranking
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye la tabla RankingTrabajador (global, por profesión y por servicio).'
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            media = recalcular_ranking()
+        self.stdout.write(self.style.SUCCESS(f'Ranking recalculado (promedio global {media:.2f}).'))
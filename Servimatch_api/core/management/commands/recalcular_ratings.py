@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.ratings import recalcular_ratings
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye rating_sum, rating_count y el histograma de cada Trabajador desde Calificacion.'
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            total = recalcular_ratings()
+        self.stdout.write(self.style.SUCCESS(f'Ratings recalculados para {total} trabajadores.'))
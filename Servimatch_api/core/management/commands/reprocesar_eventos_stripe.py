@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.webhooks import reprocesar_pendientes
+
+
+class Command(BaseCommand):
+    help = (
+        'Vuelve a procesar los eventos de Stripe recibidos que quedaron sin '
+        'procesar (tarea perdida o fallida). Pensado para correr desde cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutos', type=int, default=5,
+                            help='Solo eventos recibidos hace más de estos minutos.')
+
+    def handle(self, *args, **opts):
+        if opts['minutos'] < 0:
+            raise CommandError('--minutos no puede ser negativo')
+        total = reprocesar_pendientes(timedelta(minutes=opts['minutos']))
+        self.stdout.write(self.style.SUCCESS(f'{total} eventos de Stripe reprocesados.'))
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_solicitud_dia_semana_solicitud_hora_preferida'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='solicitud',
+            index=models.Index(fields=['latitud', 'longitud'], name='solicitud_lat_lng_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trabajador',
+            index=models.Index(fields=['latitud', 'longitud'], name='trabajador_lat_lng_idx'),
+        ),
+    ]
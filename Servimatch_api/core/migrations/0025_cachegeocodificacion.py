@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_indices_lat_lng'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheGeocodificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('direccion', models.CharField(max_length=255, unique=True)),
+                ('latitud', models.FloatField(blank=True, null=True)),
+                ('longitud', models.FloatField(blank=True, null=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:58
+
+from django.db import migrations, models
+
+
+def marcar_geocodificadas(apps, schema_editor):
+    Solicitud = apps.get_model('core', 'Solicitud')
+    Solicitud.objects.filter(latitud__isnull=False, longitud__isnull=False) \
+        .update(estado_geocodificacion='ok')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_cachegeocodificacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='solicitud',
+            name='estado_geocodificacion',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('ok', 'Geocodificada'), ('fallida', 'Sin resultado')], default='pendiente', max_length=10),
+        ),
+        migrations.RunPython(marcar_geocodificadas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:00
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def calcular_agregados(apps, schema_editor):
+    Trabajador = apps.get_model('core', 'Trabajador')
+    Calificacion = apps.get_model('core', 'Calificacion')
+
+    filas = Calificacion.objects.values('trabajador_id').annotate(
+        **{f'n{p}': Count('id', filter=Q(puntuacion=p)) for p in range(1, 6)}
+    )
+    for fila in filas:
+        valores = {f'rating_{p}': fila[f'n{p}'] for p in range(1, 6)}
+        valores['rating_count'] = sum(valores.values())
+        valores['rating_sum'] = sum(p * fila[f'n{p}'] for p in range(1, 6))
+        Trabajador.objects.filter(pk=fila['trabajador_id']).update(**valores)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_solicitud_estado_geocodificacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajador',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trabajador',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trabajador',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trabajador',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trabajador',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trabajador',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trabajador',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(calcular_agregados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+PESO_PREVIO = 5
+
+
+def poblar_ranking(apps, schema_editor):
+    Trabajador = apps.get_model('core', 'Trabajador')
+    RankingTrabajador = apps.get_model('core', 'RankingTrabajador')
+
+    totales = Trabajador.objects.aggregate(suma=Sum('rating_sum'), cantidad=Sum('rating_count'))
+    media = totales['suma'] / totales['cantidad'] if totales['cantidad'] else 3.0
+
+    filas = []
+    for t in Trabajador.objects.prefetch_related('servicios'):
+        puntaje = (PESO_PREVIO * media + t.rating_sum) / (PESO_PREVIO + t.rating_count)
+        segmentos = [('global', 0)]
+        if t.profesion_id:
+            segmentos.append(('profesion', t.profesion_id))
+        segmentos += [('servicio', s.pk) for s in t.servicios.all()]
+        filas += [
+            RankingTrabajador(segmento=seg, segmento_id=seg_id, trabajador=t, puntaje=puntaje)
+            for seg, seg_id in segmentos
+        ]
+    RankingTrabajador.objects.bulk_create(filas)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_trabajador_rating_agregados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingTrabajador',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('segmento', models.CharField(choices=[('global', 'Global'), ('profesion', 'Profesión'), ('servicio', 'Servicio')], max_length=10)),
+                ('segmento_id', models.PositiveIntegerField(default=0)),
+                ('puntaje', models.FloatField()),
+                ('trabajador', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rankings', to='core.trabajador')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['segmento', 'segmento_id', '-puntaje'], name='ranking_segmento_idx')],
+                'unique_together': {('segmento', 'segmento_id', 'trabajador')},
+            },
+        ),
+        migrations.RunPython(poblar_ranking, migrations.RunPython.noop),
+    ]
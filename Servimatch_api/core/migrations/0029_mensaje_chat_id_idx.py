@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_rankingtrabajador'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mensaje',
+            index=models.Index(fields=['chat', 'id'], name='mensaje_chat_id_idx'),
+        ),
+    ]
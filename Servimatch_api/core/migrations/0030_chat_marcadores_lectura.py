@@ -0,0 +1,41 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+def fusionar_chats_duplicados(apps, schema_editor):
+    """Deja un solo Chat por (cliente, trabajador): el más antiguo recibe los mensajes."""
+    Chat = apps.get_model('core', 'Chat')
+    Mensaje = apps.get_model('core', 'Mensaje')
+
+    duplicados = Chat.objects.values('cliente_id', 'trabajador_id') \
+        .annotate(n=models.Count('id')).filter(n__gt=1)
+    for par in duplicados:
+        chats = list(Chat.objects.filter(
+            cliente_id=par['cliente_id'], trabajador_id=par['trabajador_id'],
+        ).order_by('id'))
+        conservado, sobrantes = chats[0], chats[1:]
+        ids_sobrantes = [c.id for c in sobrantes]
+        Mensaje.objects.filter(chat_id__in=ids_sobrantes).update(chat_id=conservado.id)
+        Chat.objects.filter(id__in=ids_sobrantes).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_mensaje_chat_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='ultimo_leido_cliente',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='ultimo_leido_trabajador',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(fusionar_chats_duplicados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:10
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def fusionar_chats_duplicados(apps, schema_editor):
+    # El retrieve anterior creaba el chat con un filter().first()/create() no
+    # atómico: deja un solo chat por par (el más antiguo) con todos los
+    # mensajes y los marcadores de lectura más avanzados.
+    Chat = apps.get_model('core', 'Chat')
+    Mensaje = apps.get_model('core', 'Mensaje')
+    pares = (
+        Chat.objects.values('cliente_id', 'trabajador_id')
+        .annotate(total=Count('id'), primero=Min('id'))
+        .filter(total__gt=1)
+    )
+    for par in pares:
+        duplicados = Chat.objects.filter(
+            cliente_id=par['cliente_id'], trabajador_id=par['trabajador_id'],
+        ).exclude(pk=par['primero'])
+        chat = Chat.objects.get(pk=par['primero'])
+        for otro in duplicados:
+            chat.ultimo_leido_cliente = max(chat.ultimo_leido_cliente, otro.ultimo_leido_cliente)
+            chat.ultimo_leido_trabajador = max(chat.ultimo_leido_trabajador, otro.ultimo_leido_trabajador)
+        chat.save(update_fields=['ultimo_leido_cliente', 'ultimo_leido_trabajador'])
+        Mensaje.objects.filter(chat__in=duplicados).update(chat=chat)
+        duplicados.delete()
+
+
+class Migration(migrations.Migration):
+    # La fusión va en su propia transacción: en PostgreSQL no se puede alterar
+    # la tabla con eventos de claves foráneas pendientes de la misma transacción
+    atomic = False
+
+    dependencies = [
+        ('core', '0030_chat_marcadores_lectura'),
+    ]
+
+    operations = [
+        migrations.RunPython(fusionar_chats_duplicados, migrations.RunPython.noop, atomic=True),
+        migrations.AddConstraint(
+            model_name='chat',
+            constraint=models.UniqueConstraint(fields=('cliente', 'trabajador'), name='chat_unico_cliente_trabajador'),
+        ),
+    ]
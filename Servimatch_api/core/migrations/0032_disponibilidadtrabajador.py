@@ -0,0 +1,96 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:14
+
+import ast
+import json
+import unicodedata
+from datetime import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Copia congelada del parser de core.agenda al momento de esta migración:
+# cambios futuros en ese módulo no deben alterar lo que hace la migración.
+DIAS_SEMANA = ['lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo']
+
+
+def leer_dia_semana(nombre):
+    if str(nombre).strip().isdigit():
+        dia = int(nombre)
+        return dia if 0 <= dia < len(DIAS_SEMANA) else None
+    texto = unicodedata.normalize('NFKD', str(nombre))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).casefold().strip()
+    return DIAS_SEMANA.index(texto) if texto in DIAS_SEMANA else None
+
+
+def leer_hora(texto):
+    try:
+        return datetime.strptime(str(texto).strip(), '%H:%M').time()
+    except ValueError:
+        return None
+
+
+def leer_disponibilidad(texto):
+    if not texto:
+        return {}
+    try:
+        datos = json.loads(texto)
+    except ValueError:
+        try:
+            datos = ast.literal_eval(texto)
+        except (ValueError, SyntaxError):
+            return {}
+    if not isinstance(datos, dict):
+        return {}
+
+    franjas = {}
+    for nombre, lista in datos.items():
+        dia = leer_dia_semana(nombre)
+        if dia is None or not isinstance(lista, list):
+            continue
+        for franja in lista:
+            if not isinstance(franja, dict):
+                continue
+            inicio, fin = leer_hora(franja.get('inicio', '')), leer_hora(franja.get('fin', ''))
+            if inicio and fin and inicio < fin:
+                franjas.setdefault(dia, []).append((inicio, fin))
+    return franjas
+
+
+def cargar_disponibilidades(apps, schema_editor):
+    Trabajador = apps.get_model('core', 'Trabajador')
+    DisponibilidadTrabajador = apps.get_model('core', 'DisponibilidadTrabajador')
+
+    filas = []
+    for trabajador_id, texto in Trabajador.objects.exclude(disponibilidad='') \
+            .values_list('pk', 'disponibilidad').iterator():
+        for dia, franjas in leer_disponibilidad(texto).items():
+            filas.extend(
+                DisponibilidadTrabajador(trabajador_id=trabajador_id, dia_semana=dia, inicio=inicio, fin=fin)
+                for inicio, fin in franjas
+            )
+    DisponibilidadTrabajador.objects.bulk_create(filas, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_chat_unico_cliente_trabajador'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DisponibilidadTrabajador',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia_semana', models.PositiveSmallIntegerField(choices=[(0, 'Lunes'), (1, 'Martes'), (2, 'Miércoles'), (3, 'Jueves'), (4, 'Viernes'), (5, 'Sábado'), (6, 'Domingo')])),
+                ('inicio', models.TimeField()),
+                ('fin', models.TimeField()),
+                ('trabajador', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='disponibilidades', to='core.trabajador')),
+            ],
+            options={
+                'ordering': ['dia_semana', 'inicio'],
+                'indexes': [models.Index(fields=['dia_semana', 'inicio', 'fin'], name='disponibilidad_dia_hora_idx')],
+            },
+        ),
+        migrations.RunPython(cargar_disponibilidades, migrations.RunPython.noop),
+    ]
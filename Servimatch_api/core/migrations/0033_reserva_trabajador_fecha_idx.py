@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:16
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def asignar_trabajador(apps, schema_editor):
+    # Las reservas creadas desde el checkout quedaban sin trabajador
+    Reserva = apps.get_model('core', 'Reserva')
+    PlanServicio = apps.get_model('core', 'PlanServicio')
+    Reserva.objects.filter(trabajador__isnull=True).update(
+        trabajador_id=Subquery(PlanServicio.objects.filter(pk=OuterRef('plan_id')).values('trabajador_id')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_disponibilidadtrabajador'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='reserva',
+            unique_together=set(),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['trabajador', 'fecha', 'hora_inicio', 'hora_fin'], name='reserva_trabajador_fecha_idx'),
+        ),
+        migrations.RunPython(asignar_trabajador, migrations.RunPython.noop),
+    ]
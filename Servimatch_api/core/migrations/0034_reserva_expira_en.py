@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:17
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def retener_pendientes(apps, schema_editor):
+    # Las PENDIENTE con cliente vienen del checkout: se les da el plazo de
+    # retención desde su creación, así las abandonadas se liberan en el primer barrido
+    Reserva = apps.get_model('core', 'Reserva')
+    Reserva.objects.filter(estado='PENDIENTE', cliente__isnull=False, expira_en__isnull=True).update(
+        expira_en=models.ExpressionWrapper(
+            models.F('creado_en') + timedelta(minutes=15), output_field=models.DateTimeField(),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_reserva_trabajador_fecha_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reserva',
+            name='expira_en',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['estado', 'expira_en'], name='reserva_estado_expira_idx'),
+        ),
+        migrations.RunPython(retener_pendientes, migrations.RunPython.noop),
+    ]
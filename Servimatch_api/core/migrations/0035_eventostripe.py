@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0034_reserva_expira_en'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoStripe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('evento_id', models.CharField(max_length=255, unique=True)),
+                ('tipo', models.CharField(max_length=100)),
+                ('datos', models.JSONField()),
+                ('recibido', models.DateTimeField(auto_now_add=True)),
+                ('procesado', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0035_eventostripe'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['direccion'], name='usuario_direccion_idx'),
+        ),
+    ]
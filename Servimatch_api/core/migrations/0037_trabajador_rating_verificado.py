@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:28
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0036_usuario_direccion_idx'),
+    ]
+
+    operations = [
+        # Los trabajadores que ya existían estaban publicados sin verificación:
+        # entran como verificados. Los nuevos registros parten sin verificar.
+        migrations.AddField(
+            model_name='trabajador',
+            name='estado_verificado',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AlterField(
+            model_name='trabajador',
+            name='estado_verificado',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='trabajador',
+            name='rating_promedio',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(rating_count=0, then=models.Value(0.0)), default=django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast('rating_sum', models.FloatField()), '/', models.F('rating_count'))), output_field=models.FloatField()),
+        ),
+        migrations.AddIndex(
+            model_name='trabajador',
+            index=models.Index(fields=['rating_promedio'], name='trabajador_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trabajador',
+            index=models.Index(condition=models.Q(('estado_verificado', False)), fields=['profesion'], name='trabajador_pendiente_idx'),
+        ),
+    ]
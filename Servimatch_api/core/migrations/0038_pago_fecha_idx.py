@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0037_trabajador_rating_verificado'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['fecha_pago', 'monto', 'liberado'], name='pago_fecha_idx'),
+        ),
+    ]
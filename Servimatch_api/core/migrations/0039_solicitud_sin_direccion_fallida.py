@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:48
+
+from django.db import migrations
+from django.db.models import Q
+
+
+def descartar_sin_direccion(apps, schema_editor):
+    # Las solicitudes pendientes sin dirección nunca se van a geocodificar
+    Solicitud = apps.get_model('core', 'Solicitud')
+    Solicitud.objects.filter(
+        Q(ubicacion__isnull=True) | Q(ubicacion__regex=r'^\s*$'),
+        estado_geocodificacion='pendiente',
+    ).update(estado_geocodificacion='fallida')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0038_pago_fecha_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(descartar_sin_direccion, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Cast
 from django.utils import timezone
 
 class Usuario(AbstractUser):
@@ -25,6 +27,12 @@ class Usuario(AbstractUser):
 
     rol = models.CharField(max_length=20, choices=ROL_CHOICES, default='cliente')
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Facetas de comuna (core.facetas): GROUP BY direccion sin recorrer la tabla
+            models.Index(fields=['direccion'], name='usuario_direccion_idx'),
+        ]
+
     def __str__(self):
         return self.username
 
@@ -64,9 +72,101 @@ class Trabajador(models.Model):
        related_name='trabajadores'
    )
 
+    # Agregados de Calificacion, mantenidos por core.ratings (no editar a mano)
+    rating_sum   = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_1     = models.PositiveIntegerField(default=0)
+    rating_2     = models.PositiveIntegerField(default=0)
+    rating_3     = models.PositiveIntegerField(default=0)
+    rating_4     = models.PositiveIntegerField(default=0)
+    rating_5     = models.PositiveIntegerField(default=0)
+    # Promedio calculado por la base desde los agregados, para filtrar e indexar por rating
+    rating_promedio = models.GeneratedField(
+        expression=Case(
+            When(rating_count=0, then=Value(0.0)),
+            default=Cast('rating_sum', models.FloatField()) / F('rating_count'),
+        ),
+        output_field=models.FloatField(),
+        db_persist=True,
+    )
+
+    estado_verificado = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # Prefiltro por rectángulo en las búsquedas por cercanía
+            models.Index(fields=['latitud', 'longitud'], name='trabajador_lat_lng_idx'),
+            # Filtro ?rating_min= del listado
+            models.Index(fields=['rating_promedio'], name='trabajador_rating_idx'),
+            # Cola de verificación: índice parcial solo con los pendientes, que son pocos
+            models.Index(fields=['profesion'], condition=models.Q(estado_verificado=False),
+                         name='trabajador_pendiente_idx'),
+        ]
+
     def __str__(self):
         return self.usuario.username
 
+    @property
+    def rating(self):
+        if not self.rating_count:
+            return 0
+        return round(self.rating_sum / self.rating_count, 1)
+
+    @property
+    def rating_histograma(self):
+        return {n: getattr(self, f'rating_{n}') for n in range(1, 6)}
+
+class DisponibilidadTrabajador(models.Model):
+    """
+    Una franja de la disponibilidad semanal de un trabajador. Se deriva de
+    Trabajador.disponibilidad al guardarlo (ver core.agenda.sincronizar_disponibilidad).
+    """
+    DIAS = [
+        (0, 'Lunes'), (1, 'Martes'), (2, 'Miércoles'), (3, 'Jueves'),
+        (4, 'Viernes'), (5, 'Sábado'), (6, 'Domingo'),
+    ]
+
+    trabajador = models.ForeignKey(Trabajador, on_delete=models.CASCADE, related_name='disponibilidades')
+    dia_semana = models.PositiveSmallIntegerField(choices=DIAS)
+    inicio     = models.TimeField()
+    fin        = models.TimeField()
+
+    class Meta:
+        ordering = ['dia_semana', 'inicio']
+        indexes = [
+            # "¿Quién trabaja el sábado a las 10:00?"
+            models.Index(fields=['dia_semana', 'inicio', 'fin'], name='disponibilidad_dia_hora_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.trabajador} {self.get_dia_semana_display()} {self.inicio:%H:%M}-{self.fin:%H:%M}'
+
+class RankingTrabajador(models.Model):
+    """
+    Puntaje de ranking precalculado por segmento (ver core.ranking).
+    segmento_id es el id de la Profesion o del Servicio; 0 en el ranking global.
+    """
+    SEGMENTOS = [
+        ('global', 'Global'),
+        ('profesion', 'Profesión'),
+        ('servicio', 'Servicio'),
+    ]
+
+    segmento    = models.CharField(max_length=10, choices=SEGMENTOS)
+    segmento_id = models.PositiveIntegerField(default=0)
+    trabajador  = models.ForeignKey(Trabajador, on_delete=models.CASCADE, related_name='rankings')
+    puntaje     = models.FloatField()
+
+    class Meta:
+        unique_together = ('segmento', 'segmento_id', 'trabajador')
+        indexes = [
+            # Top-N por segmento: lectura ordenada directa del índice
+            models.Index(fields=['segmento', 'segmento_id', '-puntaje'], name='ranking_segmento_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.trabajador} ({self.segmento} {self.segmento_id}): {self.puntaje:.2f}"
+
 class ExperienciaProfesional(models.Model):
     trabajador         = models.ForeignKey(Trabajador, on_delete=models.CASCADE, related_name='experiencias')
     profesion          = models.ForeignKey(Profesion, on_delete=models.CASCADE, related_name='experiencias')
@@ -98,6 +198,17 @@ class Solicitud(models.Model):
     # Nuevos campos para coordenadas
     latitud             = models.FloatField(null=True, blank=True)
     longitud            = models.FloatField(null=True, blank=True)
+    # Las coordenadas se calculan en segundo plano (core.geocodificacion)
+    ESTADOS_GEOCODIFICACION = [
+        ('pendiente', 'Pendiente'),
+        ('ok', 'Geocodificada'),
+        ('fallida', 'Sin resultado'),
+    ]
+    estado_geocodificacion = models.CharField(
+        max_length=10,
+        choices=ESTADOS_GEOCODIFICACION,
+        default='pendiente'
+    )
     class DiaSemana(models.IntegerChoices):
         LUNES     = 1, 'Lunes'
         MARTES    = 2, 'Martes'
@@ -139,6 +250,11 @@ class Solicitud(models.Model):
 
     aceptada            = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['latitud', 'longitud'], name='solicitud_lat_lng_idx'),
+        ]
+
     def __str__(self):
         return f"Solicitud de {self.cliente} para {self.servicio}"
 
@@ -149,6 +265,13 @@ class Pago(models.Model):
     liberado = models.BooleanField(default=False)
     # Otros detalles del pago
 
+    class Meta:
+        indexes = [
+            # ?desde=&hasta= de /api/pagos/: rango por fecha, y con monto y liberado
+            # en el índice los totales de la ventana no leen la tabla
+            models.Index(fields=['fecha_pago', 'monto', 'liberado'], name='pago_fecha_idx'),
+        ]
+
     def __str__(self):
         return f"Pago de {self.monto} para {self.solicitud}"
 
@@ -242,9 +365,16 @@ class Reserva(models.Model):
         default='PENDIENTE'
     )
     creado_en = models.DateTimeField(auto_now_add=True)
+    # Plazo de la retención mientras está PENDIENTE de pago (ver core.reservas)
+    expira_en = models.DateTimeField(null=True, blank=True)
 
     class Meta:
-        unique_together = ('plan', 'fecha', 'hora_inicio')
+        indexes = [
+            # Choques de horario por trabajador y día (ver core.reservas)
+            models.Index(fields=['trabajador', 'fecha', 'hora_inicio', 'hora_fin'], name='reserva_trabajador_fecha_idx'),
+            # Barrido de retenciones vencidas
+            models.Index(fields=['estado', 'expira_en'], name='reserva_estado_expira_idx'),
+        ]
 
     def __str__(self):
         return f"Reserva {self.plan.nombre} {self.fecha} {self.hora_inicio}"
@@ -271,6 +401,14 @@ class Chat(models.Model):
         related_name='chats_como_trabajador'
     )
     creado = models.DateTimeField(auto_now_add=True)
+    # Marcadores de lectura: id del último Mensaje que vio cada participante
+    ultimo_leido_cliente = models.PositiveBigIntegerField(default=0)
+    ultimo_leido_trabajador = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cliente', 'trabajador'], name='chat_unico_cliente_trabajador'),
+        ]
 
     def __str__(self):
         return f'Chat entre {self.cliente} y {self.trabajador}'
@@ -282,7 +420,46 @@ class Mensaje(models.Model):
     contenido = models.TextField()
     enviado = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Sincronización incremental: ?after=/?before= por id dentro del chat
+            models.Index(fields=['chat', 'id'], name='mensaje_chat_id_idx'),
+        ]
+
     def __str__(self):
         return f'{self.remitente}: {self.contenido[:30]}'
 
 
+
+
+class CacheGeocodificacion(models.Model):
+    # Dirección normalizada (ver core.geocodificacion.normalizar_direccion)
+    direccion   = models.CharField(max_length=255, unique=True)
+    # NULL en ambas = la dirección no se pudo geocodificar (resultado negativo)
+    latitud     = models.FloatField(null=True, blank=True)
+    longitud    = models.FloatField(null=True, blank=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    @property
+    def coordenadas(self):
+        if self.latitud is None or self.longitud is None:
+            return None
+        return self.latitud, self.longitud
+
+    def __str__(self):
+        return self.direccion
+
+
+class EventoStripe(models.Model):
+    """
+    Eventos de webhook de Stripe ya recibidos. El id único hace que los
+    reintentos de Stripe de un evento ya procesado sean un no-op (ver core.webhooks).
+    """
+    evento_id = models.CharField(max_length=255, unique=True)
+    tipo      = models.CharField(max_length=100)
+    datos     = models.JSONField()
+    recibido  = models.DateTimeField(auto_now_add=True)
+    procesado = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.evento_id} ({self.tipo})'
@@ -0,0 +1,19 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class PaginacionCursor(CursorPagination):
+    """
+    Paginación por cursor sobre la clave primaria (creciente con la creación),
+    así cada página es un rango indexado y no cambia si entran filas nuevas.
+    Respuesta: {"next": url|null, "previous": url|null, "results": [...]}.
+    """
+    page_size = getattr(settings, 'PAGINACION_TAMANO', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'PAGINACION_TAMANO_MAXIMO', 200)
+    ordering = '-pk'
+
+
+class PaginacionPorFechaPago(PaginacionCursor):
+    """Pagos del más reciente al más antiguo, sobre el índice pago_fecha_idx."""
+    ordering = ('-fecha_pago', '-pk')
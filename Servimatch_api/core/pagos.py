@@ -0,0 +1,51 @@
+"""
+Liberación de pagos a los trabajadores.
+
+Un pago queda pendiente (liberado=False) hasta que el administrador lo paga
+al trabajador. liberar_pagos marca de una vez todos los pagos pedidos con un
+solo UPDATE condicional, dentro de una transacción, y retorna cuánto se
+liquidó a cada trabajador.
+"""
+from django.db import transaction
+
+
+def liberar_pagos(pago_ids=None, trabajador_id=None):
+    """
+    Libera los pagos pendientes de `pago_ids`, los de `trabajador_id`, o los
+    que cumplan ambos filtros. Los ya liberados se ignoran, así que repetir la
+    llamada no liquida dos veces.
+
+    Retorna {'total', 'cantidad', 'trabajadores': [{'id', 'total', 'cantidad'}, ...]}
+    con solo lo que esta llamada liberó.
+    """
+    from .models import Pago
+
+    if pago_ids is None and trabajador_id is None:
+        raise ValueError('Indica los pagos o el trabajador a liberar.')
+
+    pendientes = Pago.objects.filter(liberado=False)
+    if pago_ids is not None:
+        pendientes = pendientes.filter(pk__in=pago_ids)
+    if trabajador_id is not None:
+        pendientes = pendientes.filter(solicitud__trabajador_asignado=trabajador_id)
+
+    with transaction.atomic():
+        # Bloquea las filas a liberar para que otra liberación simultánea no
+        # las cuente también (en SQLite la escritura ya es exclusiva)
+        filas = list(
+            pendientes.select_for_update(of=('self',))
+            .values_list('pk', 'solicitud__trabajador_asignado', 'monto')
+        )
+        if filas:
+            Pago.objects.filter(pk__in=[pk for pk, _, _ in filas], liberado=False).update(liberado=True)
+
+    trabajadores = {}
+    for _, trabajador, monto in filas:
+        t = trabajadores.setdefault(trabajador, {'id': trabajador, 'total': 0, 'cantidad': 0})
+        t['total'] += monto
+        t['cantidad'] += 1
+    return {
+        'total': sum((t['total'] for t in trabajadores.values()), 0),
+        'cantidad': len(filas),
+        'trabajadores': list(trabajadores.values()),
+    }
@@ -0,0 +1,177 @@
+"""
+Cliente HTTP compartido para las pasarelas de pago (Flow y Stripe).
+
+Cada pasarela usa una requests.Session propia con pool de conexiones
+keep-alive, así las llamadas no vuelven a abrir TCP + TLS cada vez. Toda
+llamada lleva timeout de conexión y de lectura (PASARELAS_TIMEOUT), de modo
+que una pasarela lenta no deja un worker colgado.
+
+Reintentos (hasta PASARELAS_REINTENTOS, con espera exponencial desde
+PASARELAS_BACKOFF segundos):
+  - timeout de conexión: siempre, la solicitud no alcanzó a salir;
+  - otros errores de red, timeout de lectura y respuestas 429/502/503/504:
+    solo si la llamada es idempotente (GET, o POST con clave de idempotencia).
+Crear un pago en Flow no es idempotente, así que ahí solo se reintenta lo
+que nunca llegó a la pasarela.
+
+Cada llamada suma a metricas_pasarelas(): cantidad, errores, reintentos y
+latencia total / máxima en milisegundos por pasarela.
+"""
+import logging
+import threading
+import time
+
+import requests
+import stripe
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+PASARELAS_TIMEOUT = getattr(settings, 'PASARELAS_TIMEOUT', (3.05, 10))
+PASARELAS_REINTENTOS = getattr(settings, 'PASARELAS_REINTENTOS', 2)
+PASARELAS_BACKOFF = getattr(settings, 'PASARELAS_BACKOFF', 0.5)
+PASARELAS_POOL = getattr(settings, 'PASARELAS_POOL', 10)
+
+METODOS_IDEMPOTENTES = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+ESTADOS_REINTENTABLES = {429, 502, 503, 504}
+
+
+class _Metricas:
+    def __init__(self):
+        self._datos = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, pasarela, ms, error=False, reintento=False):
+        with self._lock:
+            m = self._datos.setdefault(pasarela, {
+                'llamadas': 0, 'errores': 0, 'reintentos': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            })
+            m['llamadas'] += 1
+            m['errores'] += error
+            m['reintentos'] += reintento
+            m['total_ms'] += ms
+            m['max_ms'] = max(m['max_ms'], ms)
+
+    def resumen(self):
+        with self._lock:
+            return {
+                pasarela: dict(m, promedio_ms=m['total_ms'] / m['llamadas'])
+                for pasarela, m in self._datos.items()
+            }
+
+    def reiniciar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+metricas = _Metricas()
+
+
+def metricas_pasarelas():
+    return metricas.resumen()
+
+
+def crear_sesion(pool=PASARELAS_POOL):
+    sesion = requests.Session()
+    # Los reintentos los maneja ClientePasarela, no urllib3
+    adaptador = HTTPAdapter(pool_connections=pool, pool_maxsize=pool, max_retries=0)
+    sesion.mount('https://', adaptador)
+    sesion.mount('http://', adaptador)
+    return sesion
+
+
+class ClientePasarela:
+    def __init__(self, nombre, base_url='', timeout=PASARELAS_TIMEOUT,
+                 reintentos=PASARELAS_REINTENTOS, backoff=PASARELAS_BACKOFF, pool=PASARELAS_POOL):
+        self.nombre = nombre
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.reintentos = reintentos
+        self.backoff = backoff
+        self.sesion = crear_sesion(pool)
+
+    def solicitar(self, metodo, ruta, idempotente=None, **kwargs):
+        """
+        Hace la llamada con timeout y reintentos. Retorna la Response (también
+        las de error, salvo que se agoten los reintentos sobre una reintentable,
+        en cuyo caso retorna la última) o lanza la excepción de requests.
+        """
+        metodo = metodo.upper()
+        if idempotente is None:
+            idempotente = metodo in METODOS_IDEMPOTENTES
+        url = ruta if ruta.startswith(('http://', 'https://')) else f'{self.base_url}/{ruta.lstrip("/")}'
+        kwargs.setdefault('timeout', self.timeout)
+
+        intento = 0
+        while True:
+            reintentar = intento < self.reintentos
+            inicio = time.monotonic()
+            try:
+                respuesta = self.sesion.request(metodo, url, **kwargs)
+            except requests.ConnectTimeout:
+                self._registrar(inicio, error=True, reintento=reintentar)
+                if not reintentar:
+                    raise
+            except (requests.ConnectionError, requests.Timeout):
+                reintentar = reintentar and idempotente
+                self._registrar(inicio, error=True, reintento=reintentar)
+                if not reintentar:
+                    raise
+            else:
+                reintentar = reintentar and idempotente and respuesta.status_code in ESTADOS_REINTENTABLES
+                self._registrar(inicio, error=respuesta.status_code >= 500, reintento=reintentar)
+                if not reintentar:
+                    return respuesta
+            logger.warning('Reintentando %s %s en %s (intento %s)', metodo, url, self.nombre, intento + 1)
+            time.sleep(self.backoff * 2 ** intento)
+            intento += 1
+
+    def get(self, ruta, **kwargs):
+        return self.solicitar('GET', ruta, **kwargs)
+
+    def post(self, ruta, **kwargs):
+        return self.solicitar('POST', ruta, **kwargs)
+
+    def _registrar(self, inicio, error, reintento):
+        ms = (time.monotonic() - inicio) * 1000
+        metricas.registrar(self.nombre, ms, error=error, reintento=reintento)
+        logger.info('Pasarela %s respondió en %.0f ms%s', self.nombre, ms, ' (error)' if error else '')
+
+
+class ClienteStripe(stripe.RequestsClient):
+    """
+    Cliente HTTP de la librería de Stripe sobre una sesión con pool y con los
+    mismos timeouts y métricas. Los reintentos quedan en manos de la librería
+    (stripe.max_network_retries), que agrega la clave de idempotencia a los POST.
+    """
+    def __init__(self, timeout=PASARELAS_TIMEOUT, pool=PASARELAS_POOL, **kwargs):
+        super().__init__(timeout=timeout, session=crear_sesion(pool), **kwargs)
+
+    def request(self, method, url, headers, post_data=None):
+        inicio = time.monotonic()
+        try:
+            contenido, estado, cabeceras = super().request(method, url, headers, post_data)
+        except Exception:
+            metricas.registrar('stripe', (time.monotonic() - inicio) * 1000, error=True)
+            raise
+        metricas.registrar('stripe', (time.monotonic() - inicio) * 1000, error=estado >= 500)
+        return contenido, estado, cabeceras
+
+
+_clientes = {}
+_clientes_lock = threading.Lock()
+
+
+def cliente_flow():
+    url = settings.FLOW_API_URL
+    with _clientes_lock:
+        if ('flow', url) not in _clientes:
+            _clientes['flow', url] = ClientePasarela('flow', url)
+        return _clientes['flow', url]
+
+
+def configurar_stripe():
+    """Instala ClienteStripe como cliente por defecto de la librería."""
+    stripe.default_http_client = ClienteStripe()
+    stripe.max_network_retries = PASARELAS_REINTENTOS
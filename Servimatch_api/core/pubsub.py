@@ -0,0 +1,129 @@
+"""
+Pub/sub para empujar eventos (mensajes de chat) a conexiones abiertas.
+
+settings.PUBSUB_BACKEND elige la implementación (ruta con puntos):
+  - 'core.pubsub.MemoriaPubSub' (defecto): dentro del proceso, sin
+    infraestructura extra. Solo ve lo que se publica en el mismo proceso.
+  - 'core.pubsub.RedisPubSub': comparte los eventos entre varios procesos
+    workers a través de Redis (settings.PUBSUB_REDIS_URL).
+
+Un backend expone:
+  publicar(canal, datos)          síncrono, se llama desde las vistas
+  suscribir(canal)                context manager asíncrono que entrega una
+                                  suscripción con `await recibir(timeout)`
+`recibir` retorna el texto publicado, o None si pasó `timeout` sin eventos,
+y lanza SuscripcionDesbordada si el suscriptor quedó atrás y perdió eventos.
+"""
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+PUBSUB_BACKEND = getattr(settings, 'PUBSUB_BACKEND', 'core.pubsub.MemoriaPubSub')
+PUBSUB_COLA_MAXIMA = getattr(settings, 'PUBSUB_COLA_MAXIMA', 100)
+
+
+class SuscripcionDesbordada(Exception):
+    pass
+
+
+class _SuscripcionMemoria:
+    def __init__(self, loop, maximo):
+        self.loop = loop
+        self.cola = asyncio.Queue(maxsize=maximo)
+        self.desbordada = False
+
+    def _entregar(self, datos):
+        # Corre en el loop del suscriptor (ver MemoriaPubSub.publicar)
+        try:
+            self.cola.put_nowait(datos)
+        except asyncio.QueueFull:
+            self.desbordada = True
+
+    async def recibir(self, timeout):
+        if self.desbordada:
+            raise SuscripcionDesbordada()
+        try:
+            return await asyncio.wait_for(self.cola.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class MemoriaPubSub:
+    def __init__(self, cola_maxima=PUBSUB_COLA_MAXIMA):
+        self.cola_maxima = cola_maxima
+        self._suscripciones = {}   # canal -> set de _SuscripcionMemoria
+        self._lock = threading.Lock()
+
+    def publicar(self, canal, datos):
+        with self._lock:
+            suscripciones = list(self._suscripciones.get(canal, ()))
+        for s in suscripciones:
+            # Las vistas síncronas publican desde otro hilo que el del loop
+            s.loop.call_soon_threadsafe(s._entregar, datos)
+
+    @asynccontextmanager
+    async def suscribir(self, canal):
+        s = _SuscripcionMemoria(asyncio.get_running_loop(), self.cola_maxima)
+        with self._lock:
+            self._suscripciones.setdefault(canal, set()).add(s)
+        try:
+            yield s
+        finally:
+            with self._lock:
+                restantes = self._suscripciones.get(canal)
+                restantes.discard(s)
+                if not restantes:
+                    del self._suscripciones[canal]
+
+
+class _SuscripcionRedis:
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    async def recibir(self, timeout):
+        mensaje = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if mensaje is None:
+            return None
+        datos = mensaje['data']
+        return datos.decode() if isinstance(datos, bytes) else datos
+
+
+class RedisPubSub:
+    def __init__(self, url=None):
+        import redis
+        import redis.asyncio
+        self.url = url or getattr(settings, 'PUBSUB_REDIS_URL', 'redis://localhost:6379/0')
+        self._cliente = redis.Redis.from_url(self.url)
+        self._redis_asyncio = redis.asyncio
+
+    def publicar(self, canal, datos):
+        self._cliente.publish(canal, datos)
+
+    @asynccontextmanager
+    async def suscribir(self, canal):
+        cliente = self._redis_asyncio.Redis.from_url(self.url)
+        pubsub = cliente.pubsub()
+        await pubsub.subscribe(canal)
+        try:
+            yield _SuscripcionRedis(pubsub)
+        finally:
+            await pubsub.unsubscribe(canal)
+            await pubsub.aclose()
+            await cliente.aclose()
+
+
+_backends = {}
+
+
+def obtener_pubsub(ruta=None):
+    ruta = ruta or getattr(settings, 'PUBSUB_BACKEND', PUBSUB_BACKEND)
+    if ruta not in _backends:
+        _backends[ruta] = import_string(ruta)()
+    return _backends[ruta]
+
+
+def canal_chat(chat_id):
+    return f'chat:{chat_id}'
@@ -0,0 +1,120 @@
+"""
+Ranking de trabajadores con promedio bayesiano.
+
+    puntaje = (C * m + rating_sum) / (C + rating_count)
+
+donde m es el promedio global de todas las calificaciones y C
+(RANKING_PESO_PREVIO) cuántas calificaciones "promedio" se suman a cada
+trabajador. Así un único 5 no supera a 200 calificaciones con promedio 4,9.
+
+Los puntajes se guardan en RankingTrabajador por segmento (global, profesión
+y cada servicio). Las señales refrescan solo las filas del trabajador que
+cambió, usando el m vigente; `manage.py recalcular_ranking` reconstruye todo
+(conviene correrlo periódicamente para que todos usen el mismo m).
+
+m no se suma sobre toda la tabla en cada calificación: la suma y la cantidad
+globales quedan en la caché de Django y cada calificación les aplica su
+diferencia al confirmarse (ajustar_media). Solo se vuelven a sumar desde la
+base al vencer RANKING_MEDIA_TTL o en recalcular_ranking.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import RankingTrabajador, Trabajador
+
+RANKING_PESO_PREVIO = getattr(settings, 'RANKING_PESO_PREVIO', 5)
+RANKING_MEDIA_TTL = getattr(settings, 'RANKING_MEDIA_TTL', 3600)
+MEDIA_SIN_DATOS = 3.0
+CLAVE_SUMA = 'core:ranking:suma'
+CLAVE_CANTIDAD = 'core:ranking:cantidad'
+
+
+def _media(suma, cantidad):
+    return suma / cantidad if cantidad else MEDIA_SIN_DATOS
+
+
+def media_global():
+    """Suma toda la tabla y deja los totales en caché al confirmar."""
+    totales = Trabajador.objects.aggregate(suma=Sum('rating_sum'), cantidad=Sum('rating_count'))
+    suma, cantidad = totales['suma'] or 0, totales['cantidad'] or 0
+    transaction.on_commit(lambda: cache.set_many(
+        {CLAVE_SUMA: suma, CLAVE_CANTIDAD: cantidad}, RANKING_MEDIA_TTL,
+    ))
+    return _media(suma, cantidad)
+
+
+def media_vigente():
+    """m desde la caché; solo recurre a media_global si no hay totales guardados."""
+    totales = cache.get_many([CLAVE_SUMA, CLAVE_CANTIDAD])
+    if len(totales) < 2:
+        return media_global()
+    return _media(totales[CLAVE_SUMA], totales[CLAVE_CANTIDAD])
+
+
+def ajustar_media(puntuacion, signo=1):
+    """Suma (signo=1) o resta (signo=-1) una calificación a los totales en caché."""
+    def ajustar():
+        try:
+            cache.incr(CLAVE_SUMA, signo * puntuacion)
+            cache.incr(CLAVE_CANTIDAD, signo)
+        except ValueError:
+            # Faltaba alguno de los dos: la próxima lectura vuelve a sumar
+            invalidar_media()
+    transaction.on_commit(ajustar)
+
+
+def invalidar_media():
+    cache.delete_many([CLAVE_SUMA, CLAVE_CANTIDAD])
+
+
+def puntaje(rating_sum, rating_count, media, peso=RANKING_PESO_PREVIO):
+    return (peso * media + rating_sum) / (peso + rating_count)
+
+
+def _filas(trabajador, servicios_ids, media):
+    valor = puntaje(trabajador.rating_sum, trabajador.rating_count, media)
+    filas = [RankingTrabajador(segmento='global', segmento_id=0, trabajador=trabajador, puntaje=valor)]
+    if trabajador.profesion_id:
+        filas.append(RankingTrabajador(
+            segmento='profesion', segmento_id=trabajador.profesion_id,
+            trabajador=trabajador, puntaje=valor,
+        ))
+    for servicio_id in servicios_ids:
+        filas.append(RankingTrabajador(
+            segmento='servicio', segmento_id=servicio_id,
+            trabajador=trabajador, puntaje=valor,
+        ))
+    return filas
+
+
+def actualizar_ranking(trabajador_id):
+    """Reemplaza las filas de ranking de un trabajador."""
+    trabajador = Trabajador.objects.filter(pk=trabajador_id) \
+        .only('pk', 'profesion_id', 'rating_sum', 'rating_count').first()
+    RankingTrabajador.objects.filter(trabajador_id=trabajador_id).delete()
+    if trabajador is None:
+        return
+    servicios_ids = trabajador.servicios.values_list('pk', flat=True)
+    RankingTrabajador.objects.bulk_create(_filas(trabajador, servicios_ids, media_vigente()))
+
+
+def recalcular_ranking(tamano_lote=500):
+    """Reconstruye la tabla completa con el promedio global recién sumado."""
+    media = media_global()
+    relaciones = {}
+    for trabajador_id, servicio_id in Trabajador.servicios.through.objects \
+            .values_list('trabajador_id', 'servicio_id'):
+        relaciones.setdefault(trabajador_id, []).append(servicio_id)
+
+    RankingTrabajador.objects.all().delete()
+    filas = []
+    qs = Trabajador.objects.only('pk', 'profesion_id', 'rating_sum', 'rating_count')
+    for trabajador in qs.iterator(chunk_size=tamano_lote):
+        filas.extend(_filas(trabajador, relaciones.get(trabajador.pk, []), media))
+        if len(filas) >= tamano_lote:
+            RankingTrabajador.objects.bulk_create(filas)
+            filas = []
+    RankingTrabajador.objects.bulk_create(filas)
+    return media
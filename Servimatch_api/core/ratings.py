@@ -0,0 +1,56 @@
+"""
+Agregados de calificaciones guardados en Trabajador (rating_sum, rating_count
+y el histograma rating_1..rating_5). Se actualizan con expresiones F desde las
+señales de Calificacion, así el serializer y el ranking no agregan por fila.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import Calificacion, Trabajador
+from .ranking import ajustar_media, invalidar_media
+
+PUNTUACIONES = range(1, 6)
+
+
+def aplicar_calificacion(trabajador_id, puntuacion, signo=1):
+    """Suma (signo=1) o resta (signo=-1) una calificación a los agregados."""
+    actualizados = Trabajador.objects.filter(pk=trabajador_id).update(**{
+        'rating_sum': F('rating_sum') + signo * puntuacion,
+        'rating_count': F('rating_count') + signo,
+        f'rating_{puntuacion}': F(f'rating_{puntuacion}') + signo,
+    })
+    if actualizados:
+        ajustar_media(puntuacion, signo)
+
+
+def agregados_desde_calificaciones(calificaciones):
+    """{trabajador_id: {campo: valor}} calculado con una sola consulta agrupada."""
+    filas = calificaciones.values('trabajador_id').annotate(
+        total=Count('id'),
+        **{f'n{p}': Count('id', filter=Q(puntuacion=p)) for p in PUNTUACIONES},
+    )
+    agregados = {}
+    for fila in filas:
+        valores = {f'rating_{p}': fila[f'n{p}'] for p in PUNTUACIONES}
+        valores['rating_count'] = fila['total']
+        valores['rating_sum'] = sum(p * fila[f'n{p}'] for p in PUNTUACIONES)
+        agregados[fila['trabajador_id']] = valores
+    return agregados
+
+
+CAMPOS = ['rating_sum', 'rating_count'] + [f'rating_{p}' for p in PUNTUACIONES]
+
+
+def recalcular_ratings(tamano_lote=500):
+    """Reconstruye los agregados de todos los trabajadores desde Calificacion."""
+    agregados = agregados_desde_calificaciones(Calificacion.objects.all())
+    vacio = {campo: 0 for campo in CAMPOS}
+
+    trabajadores = []
+    for t in Trabajador.objects.only('pk').iterator(chunk_size=tamano_lote):
+        for campo, valor in agregados.get(t.pk, vacio).items():
+            setattr(t, campo, valor)
+        trabajadores.append(t)
+    Trabajador.objects.bulk_update(trabajadores, CAMPOS, batch_size=tamano_lote)
+    transaction.on_commit(invalidar_media)
+    return len(trabajadores)
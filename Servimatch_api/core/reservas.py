@@ -0,0 +1,170 @@
+"""
+Creación de reservas sin choques de horario.
+
+Dos reservas del mismo trabajador chocan si el mismo día sus intervalos
+[hora_inicio, hora_fin) se traslapan, aunque sean de planes distintos. La
+verificación y el insert van en la misma transacción, con la fila del
+trabajador bloqueada, así dos reservas simultáneas no pueden pasar ambas la
+verificación. La consulta de choque recorre el índice
+(trabajador, fecha, hora_inicio, hora_fin), por lo que su costo no depende
+de cuántas reservas acumule el trabajador.
+
+Las reservas PENDIENTE del checkout son retenciones: llevan `expira_en` y,
+vencidas, dejan de bloquear el horario aunque sigan en la tabla hasta que
+las limpie liberar_vencidas (comando liberar_reservas_vencidas o el barrido
+periódico de RESERVAS_BARRIDO_INTERVALO).
+
+El barrido periódico es opcional y solo corre en los procesos que atienden
+solicitudes: iniciar_barrido escucha request_started y arranca el hilo con
+la primera solicitud, así migrate, shell, las pruebas y los demás comandos
+no lo levantan.
+"""
+import threading
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+ESTADOS_INACTIVOS = ['CANCELADA']
+RESERVA_RETENCION = getattr(settings, 'RESERVA_RETENCION', timedelta(minutes=15))
+
+
+class ReservaEnConflicto(Exception):
+    pass
+
+
+def hora_fin_de(plan, fecha, hora_inicio):
+    return (datetime.combine(fecha, hora_inicio) + plan.duracion_estimado).time()
+
+
+def vencimiento_retencion():
+    return timezone.now() + RESERVA_RETENCION
+
+
+def vencidas(ahora=None):
+    """Retenciones PENDIENTE cuyo plazo ya pasó."""
+    return Q(estado='PENDIENTE', expira_en__lte=ahora or timezone.now())
+
+
+def vigentes(ahora=None):
+    """Reservas que bloquean su horario."""
+    from .models import Reserva
+
+    return Reserva.objects.exclude(estado__in=ESTADOS_INACTIVOS).exclude(vencidas(ahora))
+
+
+def choques(trabajador_id, fecha, hora_inicio, hora_fin):
+    return vigentes().filter(
+        trabajador_id=trabajador_id, fecha=fecha,
+        hora_inicio__lt=hora_fin, hora_fin__gt=hora_inicio,
+    )
+
+
+def reservar(plan, fecha, hora_inicio, hora_fin=None, **campos):
+    """
+    Crea la Reserva del plan si el trabajador está libre en ese intervalo.
+    Lanza ReservaEnConflicto si choca con otra reserva vigente y ValueError
+    si el intervalo no es válido.
+    """
+    from .models import Reserva, Trabajador
+
+    hora_fin = hora_fin or hora_fin_de(plan, fecha, hora_inicio)
+    if hora_fin <= hora_inicio:
+        raise ValueError('La reserva debe terminar el mismo día en que empieza.')
+
+    with transaction.atomic():
+        # Serializa las reservas del trabajador (en SQLite la escritura ya es exclusiva)
+        Trabajador.objects.select_for_update().only('pk').get(pk=plan.trabajador_id)
+        if choques(plan.trabajador_id, fecha, hora_inicio, hora_fin).exists():
+            raise ReservaEnConflicto('Esa franja ya está reservada. Elige otra.')
+        return Reserva.objects.create(
+            plan=plan, trabajador_id=plan.trabajador_id,
+            fecha=fecha, hora_inicio=hora_inicio, hora_fin=hora_fin, **campos,
+        )
+
+
+def reprogramar(reserva, plan, fecha, hora_inicio, hora_fin):
+    """
+    Mueve la reserva a otro plan u horario con la misma verificación de
+    reservar, sin contar la propia reserva como choque.
+    """
+    from .models import Trabajador
+
+    if hora_fin <= hora_inicio:
+        raise ValueError('La reserva debe terminar el mismo día en que empieza.')
+
+    with transaction.atomic():
+        Trabajador.objects.select_for_update().only('pk').get(pk=plan.trabajador_id)
+        if choques(plan.trabajador_id, fecha, hora_inicio, hora_fin).exclude(pk=reserva.pk).exists():
+            raise ReservaEnConflicto('Esa franja ya está reservada. Elige otra.')
+        reserva.plan, reserva.trabajador_id = plan, plan.trabajador_id
+        reserva.fecha, reserva.hora_inicio, reserva.hora_fin = fecha, hora_inicio, hora_fin
+        reserva.save(update_fields=['plan', 'trabajador', 'fecha', 'hora_inicio', 'hora_fin'])
+        return reserva
+
+
+def confirmar(reserva_id):
+    """
+    Pasa una reserva pagada a CONFIRMADA. Si su retención ya venció (o el
+    barrido la canceló) se confirma igual mientras el horario siga libre;
+    si otra reserva lo tomó entre medio lanza ReservaEnConflicto.
+    """
+    from .models import Reserva, Trabajador
+
+    with transaction.atomic():
+        reserva = Reserva.objects.filter(pk=reserva_id).first()
+        if reserva is None or reserva.estado == 'CONFIRMADA':
+            return reserva
+        Trabajador.objects.select_for_update().only('pk').get(pk=reserva.trabajador_id)
+        if choques(reserva.trabajador_id, reserva.fecha, reserva.hora_inicio, reserva.hora_fin) \
+                .exclude(pk=reserva.pk).exists():
+            raise ReservaEnConflicto(f'El horario de la reserva {reserva.pk} ya fue tomado.')
+        reserva.estado = 'CONFIRMADA'
+        reserva.expira_en = None
+        reserva.save(update_fields=['estado', 'expira_en'])
+        return reserva
+
+
+def liberar_vencidas(lote=500, borrar=False, ahora=None):
+    """
+    Cancela (o borra, con `borrar`) las retenciones vencidas en lotes de
+    `lote` filas, cada uno en su propia transacción corta. Retorna cuántas liberó.
+    """
+    from .models import Reserva
+
+    ahora = ahora or timezone.now()
+    total = 0
+    while True:
+        ids = list(Reserva.objects.filter(vencidas(ahora)).order_by('expira_en')
+                   .values_list('pk', flat=True)[:lote])
+        if not ids:
+            return total
+        with transaction.atomic():
+            qs = Reserva.objects.filter(vencidas(ahora), pk__in=ids)
+            if borrar:
+                qs.delete()
+            else:
+                qs.update(estado='CANCELADA')
+        total += len(ids)
+
+
+_barrido = None
+_barrido_lock = threading.Lock()
+
+
+def iniciar_barrido(**kwargs):
+    """
+    Receptor de request_started: arranca el barrido periódico una sola vez
+    por proceso y se desconecta. Retorna el Event que lo detiene.
+    """
+    from django.core.signals import request_started
+    from .tareas import programar_periodica
+
+    global _barrido
+    with _barrido_lock:
+        if _barrido is None:
+            _barrido = programar_periodica(liberar_vencidas, settings.RESERVAS_BARRIDO_INTERVALO)
+    request_started.disconnect(iniciar_barrido, dispatch_uid='core.iniciar_barrido')
+    return _barrido
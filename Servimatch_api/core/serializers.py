@@ -3,9 +3,67 @@ from .models import (
     Usuario, Cliente, Servicio, Profesion, Trabajador, ExperienciaProfesional,
     FotoTrabajador, Calificacion, Solicitud, Pago, Etiqueta,
     EtiquetaCalificacion, PlanServicio, Reserva, )
-from django.db.models import Avg 
 import json   
 
+
+def leer_lista(request, parametro):
+    """'?expand=a,b' → {'a', 'b'}; None si el parámetro no vino."""
+    if request is None or parametro not in request.query_params:
+        return None
+    valor = request.query_params.get(parametro, '')
+    return {v.strip() for v in valor.split(',') if v.strip()}
+
+
+def relaciones_solicitadas(request, serializer_class):
+    """
+    Relaciones de `serializer_class.expandibles` que hay que serializar anidadas
+    (y por lo tanto cargar). None = todas, el comportamiento sin ?expand=.
+    """
+    expandir = leer_lista(request, 'expand')
+    campos = leer_lista(request, 'fields')
+    if expandir is None and campos is None:
+        return None
+    if expandir is None:
+        expandir = set(serializer_class.expandibles)
+    if campos is not None:
+        expandir &= campos
+    return expandir
+
+
+def expandida(expandir, relacion):
+    return expandir is None or relacion in expandir
+
+
+class CamposDinamicosMixin:
+    """
+    Permite al cliente recortar la respuesta:
+      ?fields=id,monto      solo esos campos.
+      ?expand=solicitud     las relaciones de `expandibles` van como ids, salvo
+                            las listadas. ?expand= vacío deja todo plano.
+    Sin ?expand= las relaciones siguen anidadas como siempre (compatibilidad
+    con la app). Solo aplica al serializer raíz de la vista.
+    """
+    # campo -> kwargs del PrimaryKeyRelatedField que lo reemplaza cuando no se expande
+    expandibles = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+
+        campos = leer_lista(request, 'fields')
+        if campos is not None:
+            for nombre in set(self.fields) - campos:
+                self.fields.pop(nombre)
+
+        expandir = relaciones_solicitadas(request, type(self))
+        if expandir is None:
+            return
+        for nombre, opciones in self.expandibles.items():
+            if nombre in self.fields and nombre not in expandir:
+                self.fields[nombre] = serializers.PrimaryKeyRelatedField(read_only=True, **opciones)
+
 # 1) Serializer de Profesión
 class ProfesionSerializer(serializers.ModelSerializer):
     class Meta:
@@ -33,7 +91,7 @@ class ServicioSerializer(serializers.ModelSerializer):
         model = Servicio
         fields = ['id', 'nombre', 'descripcion']
 
-class TrabajadorSerializer(serializers.ModelSerializer):
+class TrabajadorSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     id           = serializers.IntegerField(source='usuario.id', read_only=True)
     nombre       = serializers.CharField(source='usuario.nombre', required=False, allow_blank=True)
     apellido     = serializers.CharField(source='usuario.apellido', required=False, allow_blank=True)
@@ -53,12 +111,25 @@ class TrabajadorSerializer(serializers.ModelSerializer):
           'nombre', 'apellido', 'foto_perfil', 'biografia',
           'profesion', 'rating',
           'disponibilidad', 'latitud', 'longitud', 'servicios',
-          'galeria',
+          'galeria', 'estado_verificado',
         ]
+        read_only_fields = ['estado_verificado']
+
+    # Relaciones que lee este serializer; `prefijo` permite cargarlas cuando va anidado
+    # (p. ej. 'trabajador__' desde CalificacionSerializer)
+    expandibles = {
+        'galeria': {'source': 'fotos', 'many': True},
+        'servicios': {'many': True},
+    }
+
+    @staticmethod
+    def optimizar_queryset(queryset, prefijo='', expandir=None):
+        # galeria y servicios se precargan igual: planos también necesitan los ids
+        return queryset.select_related(f'{prefijo}usuario', f'{prefijo}profesion') \
+            .prefetch_related(f'{prefijo}fotos', f'{prefijo}servicios')
 
     def get_rating(self, obj):
-        agg = obj.calificaciones_recibidas.aggregate(avg=Avg('puntuacion'))
-        return round(agg['avg'] or 0, 1)
+        return obj.rating
 
     def create(self, validated_data):
         usuario_data = validated_data.pop('usuario', {})
@@ -228,13 +299,21 @@ class UsuarioSerializer(serializers.ModelSerializer):
         return instance
 
 
-class ClienteSerializer(serializers.ModelSerializer):
+class ClienteSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     usuario = UsuarioSerializer(read_only=True)
 
     class Meta:
         model = Cliente
         fields = ['usuario']
 
+    expandibles = {'usuario': {}}
+
+    @staticmethod
+    def optimizar_queryset(queryset, prefijo='', expandir=None):
+        if expandida(expandir, 'usuario'):
+            queryset = queryset.select_related(f'{prefijo}usuario')
+        return queryset
+
     def create(self, validated_data):
         usuario_data = validated_data.pop('usuario')
         usuario_instance = UsuarioSerializer.create(UsuarioSerializer(), validated_data=usuario_data)
@@ -285,7 +364,7 @@ class ExperienciaProfesionalSerializer(serializers.ModelSerializer):
 
 
 
-class SolicitudSerializer(serializers.ModelSerializer):
+class SolicitudSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     cliente     = ClienteSerializer(read_only=True)
     servicio    = ServicioSerializer(read_only=True)
     servicio_id = serializers.PrimaryKeyRelatedField(
@@ -307,6 +386,7 @@ class SolicitudSerializer(serializers.ModelSerializer):
             'ubicacion',
             'latitud',
             'longitud',
+            'estado_geocodificacion',
             'fecha_creacion',
             'fecha_preferida',
             'trabajador_asignado',
@@ -317,13 +397,24 @@ class SolicitudSerializer(serializers.ModelSerializer):
             'servicio',
             'latitud',
             'longitud',
+            'estado_geocodificacion',
             'fecha_creacion',
             'trabajador_asignado',
             'aceptada',
         ]
 
+    expandibles = {'cliente': {}, 'servicio': {}}
+
+    @staticmethod
+    def optimizar_queryset(queryset, prefijo='', expandir=None):
+        if expandida(expandir, 'cliente'):
+            queryset = queryset.select_related(f'{prefijo}cliente__usuario')
+        if expandida(expandir, 'servicio'):
+            queryset = queryset.select_related(f'{prefijo}servicio')
+        return queryset
 
-class PagoSerializer(serializers.ModelSerializer):
+
+class PagoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     solicitud = SolicitudSerializer(read_only=True)
 
     class Meta:
@@ -331,7 +422,15 @@ class PagoSerializer(serializers.ModelSerializer):
         fields = ['id', 'solicitud', 'monto', 'fecha_pago', 'liberado']
         read_only_fields = ['solicitud']
 
-class CalificacionSerializer(serializers.ModelSerializer):
+    expandibles = {'solicitud': {}}
+
+    @staticmethod
+    def optimizar_queryset(queryset, prefijo='', expandir=None):
+        if expandida(expandir, 'solicitud'):
+            queryset = SolicitudSerializer.optimizar_queryset(queryset, f'{prefijo}solicitud__')
+        return queryset
+
+class CalificacionSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     cliente = ClienteSerializer(read_only=True)
     trabajador = TrabajadorSerializer(read_only=True)
     solicitud = SolicitudSerializer(read_only=True)
@@ -341,12 +440,24 @@ class CalificacionSerializer(serializers.ModelSerializer):
         fields = ['id', 'cliente', 'trabajador', 'solicitud', 'puntuacion', 'comentario', 'fecha_creacion']
         read_only_fields = ['cliente', 'trabajador', 'solicitud']
 
+    expandibles = {'cliente': {}, 'trabajador': {}, 'solicitud': {}}
+
+    @staticmethod
+    def optimizar_queryset(queryset, prefijo='', expandir=None):
+        if expandida(expandir, 'cliente'):
+            queryset = ClienteSerializer.optimizar_queryset(queryset, f'{prefijo}cliente__')
+        if expandida(expandir, 'trabajador'):
+            queryset = TrabajadorSerializer.optimizar_queryset(queryset, f'{prefijo}trabajador__')
+        if expandida(expandir, 'solicitud'):
+            queryset = SolicitudSerializer.optimizar_queryset(queryset, f'{prefijo}solicitud__')
+        return queryset
+
 class EtiquetaSerializer(serializers.ModelSerializer):
     class Meta:
         model = Etiqueta
         fields = ['id', 'nombre']
 
-class EtiquetaCalificacionSerializer(serializers.ModelSerializer):
+class EtiquetaCalificacionSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     calificacion = CalificacionSerializer(read_only=True)
     etiqueta = EtiquetaSerializer(read_only=True)
 
@@ -355,13 +466,31 @@ class EtiquetaCalificacionSerializer(serializers.ModelSerializer):
         fields = ['id', 'calificacion', 'etiqueta']
         read_only_fields = ['calificacion', 'etiqueta']
 
-class PlanServicioSerializer(serializers.ModelSerializer):
+    expandibles = {'calificacion': {}, 'etiqueta': {}}
+
+    @staticmethod
+    def optimizar_queryset(queryset, prefijo='', expandir=None):
+        if expandida(expandir, 'etiqueta'):
+            queryset = queryset.select_related(f'{prefijo}etiqueta')
+        if expandida(expandir, 'calificacion'):
+            queryset = CalificacionSerializer.optimizar_queryset(queryset, f'{prefijo}calificacion__')
+        return queryset
+
+class PlanServicioSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     trabajador = serializers.SerializerMethodField()
 
     class Meta:
         model = PlanServicio
         fields = ['id', 'nombre', 'descripcion', 'duracion_estimado', 'precio', 'incluye', 'trabajador']
 
+    expandibles = {'trabajador': {}}
+
+    @staticmethod
+    def optimizar_queryset(queryset, prefijo='', expandir=None):
+        if expandida(expandir, 'trabajador'):
+            queryset = queryset.select_related(f'{prefijo}trabajador__usuario', f'{prefijo}trabajador__profesion')
+        return queryset
+
     def get_trabajador(self, obj):
         if obj.trabajador:
             return {
@@ -399,6 +528,10 @@ class MensajeSerializer(serializers.ModelSerializer):
         fields = ['id', 'chat', 'remitente', 'contenido', 'enviado']
         read_only_fields = ['remitente', 'enviado', 'chat']
 
+    @staticmethod
+    def optimizar_queryset(queryset, prefijo='', expandir=None):
+        return queryset.select_related(f'{prefijo}remitente')
+
 
 class ChatSerializer(serializers.ModelSerializer):
     cliente = UsuarioSimpleSerializer(read_only=True)
@@ -407,3 +540,38 @@ class ChatSerializer(serializers.ModelSerializer):
     class Meta:
         model = Chat
         fields = ['id', 'cliente', 'trabajador', 'creado']
+
+    @staticmethod
+    def optimizar_queryset(queryset, prefijo='', expandir=None):
+        return queryset.select_related(f'{prefijo}cliente', f'{prefijo}trabajador')
+
+
+class ChatBandejaSerializer(serializers.ModelSerializer):
+    """
+    Una fila de la bandeja de chats. Espera el queryset anotado de
+    ChatViewSet.list (ultimo_id, ultimo_contenido, ultimo_enviado,
+    ultimo_remitente_id y no_leidos) y 'request' en el contexto.
+    """
+    contraparte = serializers.SerializerMethodField()
+    ultimo_mensaje = serializers.SerializerMethodField()
+    no_leidos = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Chat
+        fields = ['id', 'contraparte', 'ultimo_mensaje', 'no_leidos', 'creado']
+
+    def get_contraparte(self, obj):
+        usuario = self.context['request'].user
+        otro = obj.trabajador if obj.cliente_id == usuario.id else obj.cliente
+        return UsuarioSimpleSerializer(otro, context=self.context).data
+
+    def get_ultimo_mensaje(self, obj):
+        if obj.ultimo_id is None:
+            return None
+        return {
+            'id': obj.ultimo_id,
+            'contenido': obj.ultimo_contenido,
+            'enviado': serializers.DateTimeField().to_representation(obj.ultimo_enviado),
+            'remitente': obj.ultimo_remitente_id,
+        }
+
@@ -0,0 +1,104 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from rest_framework.renderers import JSONRenderer
+
+from .models import Trabajador, Calificacion, RankingTrabajador, Mensaje
+from .directorio import directorio
+from .ratings import aplicar_calificacion
+from .ranking import actualizar_ranking
+from .pubsub import canal_chat, obtener_pubsub
+from .agenda import sincronizar_disponibilidad
+
+
+def _refrescar_directorio(trabajador_id):
+    transaction.on_commit(lambda: directorio.actualizar(trabajador_id))
+
+
+def _trabajador_cambiado(trabajador_id):
+    actualizar_ranking(trabajador_id)
+    _refrescar_directorio(trabajador_id)
+
+
+@receiver(post_save, sender=Trabajador)
+def trabajador_guardado(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'disponibilidad' in update_fields:
+        sincronizar_disponibilidad(instance)
+    _trabajador_cambiado(instance.pk)
+
+
+@receiver(post_delete, sender=Trabajador)
+def trabajador_eliminado(sender, instance, **kwargs):
+    trabajador_id = instance.pk
+    transaction.on_commit(lambda: directorio.quitar(trabajador_id))
+
+
+@receiver(m2m_changed, sender=Trabajador.servicios.through)
+def servicios_trabajador_cambiados(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        _trabajador_cambiado(instance.pk)
+    elif pk_set:
+        for trabajador_id in pk_set:
+            _trabajador_cambiado(trabajador_id)
+    else:
+        # servicio.trabajadores.clear(): no sabemos qué filas cambiaron
+        RankingTrabajador.objects.filter(segmento='servicio', segmento_id=instance.pk).delete()
+        transaction.on_commit(directorio.invalidar)
+
+
+@receiver(pre_save, sender=Calificacion)
+def calificacion_por_guardar(sender, instance, **kwargs):
+    # Recordar la versión guardada para aplicar solo la diferencia
+    instance._anterior = None
+    if instance.pk:
+        instance._anterior = Calificacion.objects.filter(pk=instance.pk) \
+            .values_list('trabajador_id', 'puntuacion').first()
+
+
+@receiver(post_save, sender=Calificacion)
+def calificacion_guardada(sender, instance, created, **kwargs):
+    actual = (instance.trabajador_id, instance.puntuacion)
+    anterior = None if created else getattr(instance, '_anterior', None)
+    if anterior == actual:
+        return
+    if anterior:
+        aplicar_calificacion(*anterior, signo=-1)
+        _trabajador_cambiado(anterior[0])
+    aplicar_calificacion(*actual)
+    _trabajador_cambiado(instance.trabajador_id)
+
+
+@receiver(post_delete, sender=Calificacion)
+def calificacion_eliminada(sender, instance, **kwargs):
+    trabajador_id = instance.trabajador_id
+    aplicar_calificacion(trabajador_id, instance.puntuacion, signo=-1)
+    # Puede venir en cascada del borrado del propio trabajador: el ranking
+    # se refresca al confirmar, cuando ya se sabe si el trabajador sigue existiendo
+    transaction.on_commit(lambda: actualizar_ranking(trabajador_id))
+    _refrescar_directorio(trabajador_id)
+
+
+def publicar_mensajes(mensajes):
+    """Empuja los mensajes a los streams abiertos de su chat al confirmar."""
+    from .serializers import MensajeSerializer
+
+    datos = [
+        (m.chat_id, JSONRenderer().render(MensajeSerializer(m).data).decode())
+        for m in mensajes
+    ]
+
+    def publicar():
+        pubsub = obtener_pubsub()
+        for chat_id, json_mensaje in datos:
+            pubsub.publicar(canal_chat(chat_id), json_mensaje)
+
+    transaction.on_commit(publicar)
+
+
+@receiver(post_save, sender=Mensaje)
+def mensaje_guardado(sender, instance, created, **kwargs):
+    if created:
+        publicar_mensajes([instance])
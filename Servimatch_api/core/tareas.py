@@ -0,0 +1,68 @@
+"""
+Ejecución de tareas en segundo plano.
+
+settings.TAREAS_BACKEND elige cómo se corren:
+  - 'hilos'    (defecto): pool de hilos del proceso, sin infraestructura extra.
+  - 'sincrono': se ejecutan en el mismo hilo; útil en pruebas y scripts.
+Las tareas se encolan al confirmar la transacción actual, así nunca ven filas
+que todavía no existen para otras conexiones. programar_periodica corre una
+función cada cierto intervalo en un hilo del proceso.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+TAREAS_HILOS = getattr(settings, 'TAREAS_HILOS', 4)
+
+_pool = None
+
+
+def _obtener_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=TAREAS_HILOS, thread_name_prefix='tareas')
+    return _pool
+
+
+def _ejecutar(funcion, args, kwargs, en_hilo):
+    try:
+        funcion(*args, **kwargs)
+    except Exception:
+        logger.exception('Falló la tarea %s', funcion.__name__)
+    finally:
+        if en_hilo:
+            # Cada hilo del pool abre su propia conexión; no dejarla colgando
+            close_old_connections()
+
+
+def ejecutar_ahora(funcion, *args, **kwargs):
+    backend = getattr(settings, 'TAREAS_BACKEND', 'hilos')
+    if backend == 'sincrono':
+        _ejecutar(funcion, args, kwargs, en_hilo=False)
+    else:
+        _obtener_pool().submit(_ejecutar, funcion, args, kwargs, True)
+
+
+def encolar(funcion, *args, **kwargs):
+    """Programa `funcion(*args, **kwargs)` para cuando se confirme la transacción."""
+    transaction.on_commit(lambda: ejecutar_ahora(funcion, *args, **kwargs))
+
+
+def programar_periodica(funcion, intervalo, *args, **kwargs):
+    """
+    Corre `funcion(*args, **kwargs)` cada `intervalo` segundos en un hilo
+    demonio. Retorna un threading.Event: al activarlo se detiene el ciclo.
+    """
+    detener = threading.Event()
+
+    def ciclo():
+        while not detener.wait(intervalo):
+            _ejecutar(funcion, args, kwargs, en_hilo=True)
+
+    threading.Thread(target=ciclo, name=f'periodica-{funcion.__name__}', daemon=True).start()
+    return detener
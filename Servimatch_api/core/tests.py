@@ -1,3 +1,1776 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+import hashlib
+import hmac
+import json
+import math
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time as pytime
+import unittest
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+import stripe
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import (
+    LiveServerTestCase, RequestFactory, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import (
+    Usuario, Cliente, Servicio, Profesion, Solicitud, Trabajador, Calificacion, Pago,
+    Etiqueta, EtiquetaCalificacion, FotoTrabajador, PlanServicio, Reserva, Chat, Mensaje,
+    CacheGeocodificacion, EventoStripe,
+)
+from . import geocodificacion
+from .agenda import calcular_slots, leer_disponibilidad
+from .management.commands.geocode_backfill import LimiteTasa
+from .directorio import directorio
+from .geo import (
+    RADIO_BUSQUEDA_KM, RADIO_MAXIMO_KM, RADIO_TIERRA_KM, bounding_box, filtrar_cercanos, haversine,
+    leer_radio,
+)
+from .ingesta import IngestaMensajes
+from .pagination import PaginacionCursor
+from .pasarelas import ClientePasarela, metricas, metricas_pasarelas
+from .ranking import media_global, media_vigente, recalcular_ranking
+from .ratings import recalcular_ratings
+from .reservas import ReservaEnConflicto, choques, liberar_vencidas, reservar
+from .tareas import programar_periodica
+
+
+class GeocodificadorFalso:
+    """Geocodificador local para pruebas: no sale a la red y cuenta llamadas."""
+    direcciones = {
+        'av. providencia 1234, providencia': (-33.4263, -70.6200),
+        'irarrazaval 3000, nunoa': (-33.4542, -70.5930),
+    }
+    llamadas = []
+    caidas = set()   # direcciones normalizadas que lanzan un error de red
+
+    def geocodificar(self, direccion):
+        GeocodificadorFalso.llamadas.append(direccion)
+        clave = geocodificacion.normalizar_direccion(direccion)
+        if clave in self.caidas:
+            raise ConnectionError('geocodificador caído')
+        return self.direcciones.get(clave)
+
+
+@override_settings(GEOCODIFICADOR='core.tests.GeocodificadorFalso', TAREAS_BACKEND='sincrono')
+class GeocodificacionTests(TestCase):
+    def setUp(self):
+        geocodificacion.limpiar_cache_local()
+        GeocodificadorFalso.llamadas = []
+
+    def test_normalizar_direccion(self):
+        self.assertEqual(
+            geocodificacion.normalizar_direccion('  Av.  Providencia 1234 ,PROVIDENCIA  '),
+            'av. providencia 1234, providencia',
+        )
+        self.assertEqual(geocodificacion.normalizar_direccion('Ñuñoa'), 'nunoa')
+
+    def test_direccion_repetida_no_llama_al_geocodificador(self):
+        coords = geocodificacion.geocodificar('Av. Providencia 1234, Providencia')
+        self.assertEqual(coords, (-33.4263, -70.6200))
+        self.assertEqual(geocodificacion.geocodificar('av. providencia 1234,  PROVIDENCIA'), coords)
+        self.assertEqual(len(GeocodificadorFalso.llamadas), 1)
+
+        # Sin LRU en memoria se resuelve desde la tabla
+        geocodificacion._lru.limpiar()
+        with self.assertNumQueries(1):
+            self.assertEqual(geocodificacion.geocodificar('Av. Providencia 1234, Providencia'), coords)
+        self.assertEqual(len(GeocodificadorFalso.llamadas), 1)
+
+    def test_resultado_negativo_se_guarda(self):
+        self.assertIsNone(geocodificacion.geocodificar('Calle que no existe 1'))
+        self.assertIsNone(geocodificacion.geocodificar('calle que no existe 1'))
+        self.assertEqual(len(GeocodificadorFalso.llamadas), 1)
+        self.assertIsNone(CacheGeocodificacion.objects.get().coordenadas)
+
+    def test_crear_solicitud_usa_cache(self):
+        usuario = Usuario.objects.create(username='cliente')
+        Cliente.objects.create(usuario=usuario)
+        servicio = Servicio.objects.create(nombre='Gasfiter', descripcion='')
+        client = APIClient()
+        client.force_authenticate(usuario)
+
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                res = client.post('/api/solicitudes/', {
+                    'servicio_id': servicio.id,
+                    'descripcion': 'Fuga',
+                    'ubicacion': 'Av. Providencia 1234, Providencia',
+                })
+            self.assertEqual(res.status_code, 201)
+
+        self.assertEqual(len(GeocodificadorFalso.llamadas), 1)
+        self.assertEqual(
+            list(Solicitud.objects.values_list('latitud', 'longitud')),
+            [(-33.4263, -70.6200)] * 2,
+        )
+
+
+@override_settings(GEOCODIFICADOR='core.tests.GeocodificadorFalso', TAREAS_BACKEND='sincrono')
+class GeocodificacionAsincronaTests(TestCase):
+    def setUp(self):
+        geocodificacion.limpiar_cache_local()
+        GeocodificadorFalso.llamadas = []
+        self.usuario = Usuario.objects.create(username='cliente')
+        Cliente.objects.create(usuario=self.usuario)
+        self.servicio = Servicio.objects.create(nombre='Gasfiter', descripcion='')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def cercanas(self):
+        res = self.client.get('/api/solicitudes/cercanas/', {'lat': -33.4263, 'lng': -70.6200})
+        return [s['id'] for s in res.json()]
+
+    def test_solicitud_aparece_en_cercanas_al_geocodificarse(self):
+        with self.captureOnCommitCallbacks() as tareas:
+            res = self.client.post('/api/solicitudes/', {
+                'servicio_id': self.servicio.id,
+                'descripcion': 'Fuga',
+                'ubicacion': 'Av. Providencia 1234, Providencia',
+            })
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.data['estado_geocodificacion'], 'pendiente')
+        self.assertEqual(GeocodificadorFalso.llamadas, [])
+        self.assertEqual(self.cercanas(), [])
+
+        for tarea in tareas:
+            tarea()
+        solicitud = Solicitud.objects.get()
+        self.assertEqual(solicitud.estado_geocodificacion, 'ok')
+        self.assertEqual(self.cercanas(), [solicitud.id])
+
+    def test_direccion_desconocida_queda_fallida(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/solicitudes/', {
+                'servicio_id': self.servicio.id,
+                'descripcion': 'Fuga',
+                'ubicacion': 'Calle que no existe 1',
+            })
+        solicitud = Solicitud.objects.get()
+        self.assertEqual(solicitud.estado_geocodificacion, 'fallida')
+        self.assertIsNone(solicitud.latitud)
+
+    def test_sin_direccion_queda_fallida(self):
+        cliente = Cliente.objects.get(usuario=self.usuario)
+        for ubicacion in ('', '   '):
+            solicitud = Solicitud.objects.create(
+                cliente=cliente, servicio=self.servicio, descripcion='', ubicacion=ubicacion,
+            )
+            geocodificacion.geocodificar_solicitud(solicitud.pk)
+            solicitud.refresh_from_db()
+            self.assertEqual(solicitud.estado_geocodificacion, 'fallida')
+        self.assertEqual(GeocodificadorFalso.llamadas, [])
+
+
+@override_settings(GEOCODIFICADOR='core.tests.GeocodificadorFalso')
+class GeocodeBackfillTests(TestCase):
+    def setUp(self):
+        geocodificacion.limpiar_cache_local()
+        GeocodificadorFalso.llamadas = []
+        GeocodificadorFalso.caidas = set()
+        self.cliente = Cliente.objects.create(usuario=Usuario.objects.create(username='cliente'))
+        self.servicio = Servicio.objects.create(nombre='Gasfiter', descripcion='')
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.checkpoint = os.path.join(directorio.name, 'checkpoint.json')
+
+    def solicitud(self, ubicacion):
+        return Solicitud.objects.create(
+            cliente=self.cliente, servicio=self.servicio, descripcion='', ubicacion=ubicacion,
+        )
+
+    def backfill(self, **opciones):
+        opciones = {'modelo': 'solicitudes', 'rps': 0, 'lote': 2, 'checkpoint': self.checkpoint, **opciones}
+        salida, errores = StringIO(), StringIO()
+        call_command('geocode_backfill', stdout=salida, stderr=errores, **opciones)
+        return salida.getvalue(), errores.getvalue()
+
+    def leer_checkpoint(self):
+        with open(self.checkpoint) as f:
+            return json.load(f)['solicitudes']
+
+    def test_deduplica_direcciones(self):
+        self.solicitud('Av. Providencia 1234, Providencia')
+        self.solicitud('av. providencia 1234,PROVIDENCIA')
+        self.solicitud('Calle que no existe 1')
+        self.backfill(lote=10)
+
+        self.assertEqual(len(GeocodificadorFalso.llamadas), 2)
+        self.assertEqual(
+            sorted(Solicitud.objects.values_list('estado_geocodificacion', flat=True)),
+            ['fallida', 'ok', 'ok'],
+        )
+
+    def test_filas_con_error_se_reintentan(self):
+        ok = self.solicitud('Av. Providencia 1234, Providencia')
+        caida = self.solicitud('Irarrázaval 3000, Ñuñoa')
+        ultima = self.solicitud('Calle que no existe 1')
+        GeocodificadorFalso.caidas = {'irarrazaval 3000, nunoa'}
+
+        _, errores = self.backfill()
+        self.assertIn('geocodificador caído', errores)
+        self.assertEqual(self.leer_checkpoint(), {'hasta': ultima.pk, 'reintentar': [caida.pk]})
+        self.assertIsNone(Solicitud.objects.get(pk=caida.pk).latitud)
+
+        # La siguiente corrida retoma desde el checkpoint: solo la fila con error
+        GeocodificadorFalso.caidas = set()
+        GeocodificadorFalso.llamadas = []
+        self.solicitud('Av. Providencia 1234, Providencia')
+        self.backfill()
+        self.assertEqual(GeocodificadorFalso.llamadas, ['Irarrázaval 3000, Ñuñoa'])
+        self.assertEqual(Solicitud.objects.get(pk=caida.pk).latitud, -33.4542)
+        self.assertEqual(self.leer_checkpoint()['reintentar'], [])
+        self.assertEqual(Solicitud.objects.get(pk=ok.pk).estado_geocodificacion, 'ok')
+
+    def test_sin_direccion_queda_fallida(self):
+        vacia = self.solicitud('')
+        espacios = self.solicitud('   ')
+        self.backfill()
+        self.assertEqual(GeocodificadorFalso.llamadas, [])
+        self.assertEqual(
+            set(Solicitud.objects.filter(pk__in=[vacia.pk, espacios.pk])
+                .values_list('estado_geocodificacion', flat=True)),
+            {'fallida'},
+        )
+
+    def test_checkpoint_antiguo_y_reiniciar(self):
+        primera = self.solicitud('Av. Providencia 1234, Providencia')
+        self.solicitud('Irarrázaval 3000, Ñuñoa')
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'solicitudes': primera.pk}, f)
+
+        self.backfill()
+        self.assertEqual(GeocodificadorFalso.llamadas, ['Irarrázaval 3000, Ñuñoa'])
+        self.backfill(reiniciar=True)
+        self.assertEqual(len(GeocodificadorFalso.llamadas), 2)
+
+    def test_limite_de_tasa(self):
+        limite = LimiteTasa(rps=2)
+        with mock.patch('core.management.commands.geocode_backfill.time') as reloj:
+            reloj.monotonic.return_value = 100.0
+            limite.esperar()
+            limite.esperar()
+        reloj.sleep.assert_called_once_with(0.5)
+        self.assertEqual(LimiteTasa(rps=0).intervalo, 0)
+
+
+def punto_a(lat, lng, distancia_km, rumbo):
+    """Punto a `distancia_km` de (lat, lng) en el rumbo dado (grados desde el norte)."""
+    d = distancia_km / RADIO_TIERRA_KM
+    fi, la, theta = math.radians(lat), math.radians(lng), math.radians(rumbo)
+    fi2 = math.asin(math.sin(fi) * math.cos(d) + math.cos(fi) * math.sin(d) * math.cos(theta))
+    la2 = la + math.atan2(math.sin(theta) * math.sin(d) * math.cos(fi),
+                          math.cos(d) - math.sin(fi) * math.sin(fi2))
+    return math.degrees(fi2), (math.degrees(la2) + 540) % 360 - 180
+
+
+class GeoTests(TestCase):
+    def test_bounding_box_contiene_el_borde_del_radio(self):
+        for lat in (-33.45, 0, 60, 85):
+            for radio in (1, 10, 50):
+                (lat_min, lat_max), (lng_min, lng_max) = bounding_box(lat, -70.66, radio)
+                for rumbo in range(0, 360, 5):
+                    p_lat, p_lng = punto_a(lat, -70.66, radio * 0.9999, rumbo)
+                    self.assertAlmostEqual(haversine(lat, -70.66, p_lat, p_lng), radio * 0.9999, places=6)
+                    self.assertTrue(lat_min <= p_lat <= lat_max, (lat, radio, rumbo))
+                    self.assertTrue(lng_min <= p_lng <= lng_max, (lat, radio, rumbo))
+
+    def test_bounding_box_cerca_de_los_polos(self):
+        (lat_min, lat_max), rango_lng = bounding_box(89.95, 10, 10)
+        self.assertIsNone(rango_lng)
+        self.assertEqual(lat_max, 90)
+        (lat_min, lat_max), rango_lng = bounding_box(-89.99, 10, 5)
+        self.assertIsNone(rango_lng)
+        self.assertEqual(lat_min, -90)
+
+    def test_bounding_box_en_el_antimeridiano(self):
+        self.assertIsNone(bounding_box(-17.0, 179.99, 10)[1])
+        self.assertIsNone(bounding_box(-17.0, -179.99, 10)[1])
+        self.assertIsNotNone(bounding_box(-17.0, 179.0, 10)[1])
+
+    def test_filtrar_cercanos_cruza_el_antimeridiano_y_el_polo(self):
+        def trabajador(nombre, lat, lng):
+            return Trabajador.objects.create(usuario=Usuario.objects.create(username=nombre),
+                                             latitud=lat, longitud=lng)
+
+        este = trabajador('este', -17.0, 179.97)
+        oeste = trabajador('oeste', -17.0, -179.97)
+        trabajador('lejos', -17.0, 178.0)
+        cercanos = filtrar_cercanos(Trabajador.objects.all(), -17.0, 179.99, 10)
+        self.assertEqual([t for t, _ in cercanos], [este, oeste])
+
+        polo = trabajador('polo', 89.98, -100.0)
+        cercanos = filtrar_cercanos(Trabajador.objects.all(), 89.97, 80.0, 10)
+        self.assertEqual([t for t, _ in cercanos], [polo])
+
+    def test_leer_radio(self):
+        self.assertEqual(leer_radio(None), RADIO_BUSQUEDA_KM)
+        self.assertEqual(leer_radio(''), RADIO_BUSQUEDA_KM)
+        self.assertEqual(leer_radio('2.5'), 2.5)
+        self.assertEqual(leer_radio('1000'), RADIO_MAXIMO_KM)
+        for invalido in ('0', '-3', 'abc', 'nan'):
+            with self.assertRaises(ValueError, msg=invalido):
+                leer_radio(invalido)
+
+
+class DirectorioTests(TestCase):
+    """Actualización incremental de la foto en memoria desde las señales."""
+
+    def setUp(self):
+        self.gasfiter = Servicio.objects.create(nombre='Gasfiter', descripcion='')
+        self.electricista = Servicio.objects.create(nombre='Electricista', descripcion='')
+        directorio.recargar()
+        self.addCleanup(directorio.invalidar)
+
+    def crear(self, nombre, lat, lng, *servicios):
+        with self.captureOnCommitCallbacks(execute=True):
+            trabajador = Trabajador.objects.create(
+                usuario=Usuario.objects.create(username=nombre), latitud=lat, longitud=lng,
+            )
+            trabajador.servicios.add(*servicios)
+        return trabajador
+
+    def buscar(self, servicio=None):
+        # Sin consultas: la foto se actualizó por fila, no se recargó
+        with self.assertNumQueries(0):
+            return [pk for pk, _ in directorio.buscar(-33.45, -70.66, 10, servicio and servicio.pk)]
+
+    def test_alta(self):
+        cerca = self.crear('cerca', -33.46, -70.65, self.gasfiter)
+        self.crear('lejos', -34.5, -70.66, self.gasfiter)
+        self.crear('sin_ubicacion', None, None, self.gasfiter)
+
+        self.assertEqual(self.buscar(), [cerca.pk])
+        self.assertEqual(self.buscar(self.gasfiter), [cerca.pk])
+        self.assertEqual(self.buscar(self.electricista), [])
+
+    def test_modificacion(self):
+        trabajador = self.crear('ana', -33.46, -70.65, self.gasfiter)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            trabajador.servicios.set([self.electricista])
+        self.assertEqual(self.buscar(self.gasfiter), [])
+        self.assertEqual(self.buscar(self.electricista), [trabajador.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            trabajador.latitud = -34.5
+            trabajador.save()
+        self.assertEqual(self.buscar(), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            trabajador.latitud = -33.45
+            trabajador.save()
+        self.assertEqual(self.buscar(self.electricista), [trabajador.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            trabajador.latitud = None
+            trabajador.save()
+        self.assertEqual(self.buscar(), [])
+
+    def test_baja(self):
+        primero = self.crear('primero', -33.45, -70.66, self.gasfiter)
+        segundo = self.crear('segundo', -33.46, -70.66, self.electricista)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            primero.delete()
+        self.assertEqual(self.buscar(), [segundo.pk])
+        self.assertEqual(self.buscar(self.gasfiter), [])
+
+        # Las filas se reindexan al quitar: el que queda se sigue actualizando bien
+        with self.captureOnCommitCallbacks(execute=True):
+            segundo.servicios.add(self.gasfiter)
+        self.assertEqual(self.buscar(self.gasfiter), [segundo.pk])
+
+
+class RatingAgregadosTests(TestCase):
+    def setUp(self):
+        usuario = Usuario.objects.create(username='cliente')
+        self.cliente = Cliente.objects.create(usuario=usuario)
+        self.trabajador = Trabajador.objects.create(usuario=Usuario.objects.create(username='trabajador'))
+        servicio = Servicio.objects.create(nombre='Gasfiter', descripcion='')
+        self.solicitud = Solicitud.objects.create(
+            cliente=self.cliente, servicio=servicio, descripcion='', ubicacion='',
+            trabajador_asignado=self.trabajador,
+        )
+
+    def calificar(self, puntuacion):
+        return Calificacion.objects.create(
+            cliente=self.cliente, trabajador=self.trabajador,
+            solicitud=self.solicitud, puntuacion=puntuacion,
+        )
+
+    def test_agregados_se_mantienen_al_crear_editar_y_borrar(self):
+        self.calificar(5)
+        c = self.calificar(2)
+        c.puntuacion = 4
+        c.save()
+        self.trabajador.refresh_from_db()
+        self.assertEqual((self.trabajador.rating_sum, self.trabajador.rating_count), (9, 2))
+        self.assertEqual(self.trabajador.rating_histograma, {1: 0, 2: 0, 3: 0, 4: 1, 5: 1})
+        self.assertEqual(self.trabajador.rating, 4.5)
+
+        c.delete()
+        self.trabajador.refresh_from_db()
+        self.assertEqual((self.trabajador.rating_sum, self.trabajador.rating_count), (5, 1))
+        self.assertEqual(self.trabajador.rating_4, 0)
+
+    def test_recalcular_ratings(self):
+        self.calificar(3)
+        self.calificar(5)
+        Trabajador.objects.update(rating_sum=0, rating_count=0, rating_3=0, rating_5=0)
+        call_command('recalcular_ratings', stdout=StringIO())
+        self.trabajador.refresh_from_db()
+        self.assertEqual((self.trabajador.rating_sum, self.trabajador.rating_count), (8, 2))
+        self.assertEqual(self.trabajador.rating_histograma, {1: 0, 2: 0, 3: 1, 4: 0, 5: 1})
+
+
+class RankingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cliente = Cliente.objects.create(usuario=Usuario.objects.create(username='cliente'))
+        self.servicio = Servicio.objects.create(nombre='Gasfiter', descripcion='')
+
+    def trabajador_con(self, nombre, puntuaciones):
+        trabajador = Trabajador.objects.create(usuario=Usuario.objects.create(username=nombre))
+        trabajador.servicios.add(self.servicio)
+        solicitud = Solicitud.objects.create(
+            cliente=self.cliente, servicio=self.servicio, descripcion='', ubicacion='',
+            trabajador_asignado=trabajador,
+        )
+        Calificacion.objects.bulk_create([
+            Calificacion(cliente=self.cliente, trabajador=trabajador, solicitud=solicitud, puntuacion=p)
+            for p in puntuaciones
+        ])
+        return trabajador
+
+    def test_muchas_buenas_calificaciones_superan_a_un_solo_cinco(self):
+        uno = self.trabajador_con('uno', [])
+        muchos = self.trabajador_con('muchos', [5] * 18 + [4] * 2)
+        regular = self.trabajador_con('regular', [3] * 20)
+        recalcular_ratings()
+        recalcular_ranking()
+        Calificacion.objects.create(
+            cliente=self.cliente, trabajador=uno, puntuacion=5,
+            solicitud=Solicitud.objects.filter(trabajador_asignado=uno).get(),
+        )
+
+        res = APIClient().get('/api/ranking/trabajadores/', {'servicio': self.servicio.id, 'limit': 1})
+        self.assertEqual([t['id'] for t in res.json()], [muchos.pk])
+        res = APIClient().get('/api/ranking/trabajadores/')
+        self.assertEqual([t['id'] for t in res.json()], [muchos.pk, uno.pk, regular.pk])
+
+    def test_media_global_se_ajusta_sin_sumar_la_tabla(self):
+        ana = self.trabajador_con('ana', [4, 2])
+        with self.captureOnCommitCallbacks(execute=True):
+            recalcular_ratings()
+            recalcular_ranking()
+        self.assertEqual(media_vigente(), 3.0)
+
+        with CaptureQueriesContext(connection) as consultas, self.captureOnCommitCallbacks(execute=True):
+            calificacion = Calificacion.objects.create(
+                cliente=self.cliente, trabajador=ana, puntuacion=5,
+                solicitud=Solicitud.objects.get(trabajador_asignado=ana),
+            )
+        self.assertFalse([q for q in consultas.captured_queries if 'SUM(' in q['sql']])
+        self.assertAlmostEqual(media_vigente(), 11 / 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            calificacion.puntuacion = 2
+            calificacion.save()
+            Calificacion.objects.filter(puntuacion=4).get().delete()
+        self.assertEqual(media_vigente(), 2.0)
+        self.assertEqual(media_vigente(), media_global())
+
+
+class ConsultasConstantesTests(TestCase):
+    """
+    Cada listado debe costar el mismo número de consultas con N o 2N filas:
+    si un serializer anidado vuelve a consultar por fila, estas pruebas fallan.
+    """
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(username='cliente')
+        self.cliente = Cliente.objects.create(usuario=self.usuario)
+        self.profesion = Profesion.objects.create(nombre='Gasfitería')
+        self.etiqueta = Etiqueta.objects.create(nombre='Puntual')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.sembradas = 0
+
+    def sembrar(self, cantidad):
+        for _ in range(cantidad):
+            i = self.sembradas = self.sembradas + 1
+            servicio = Servicio.objects.create(nombre=f'Servicio {i}', descripcion='')
+            trabajador = Trabajador.objects.create(
+                usuario=Usuario.objects.create(username=f'trabajador{i}'),
+                profesion=self.profesion, latitud=-33.45, longitud=-70.66,
+            )
+            trabajador.servicios.add(servicio)
+            FotoTrabajador.objects.create(trabajador=trabajador, imagen=f'galeria_trabajadores/{i}.jpg')
+            solicitud = Solicitud.objects.create(
+                cliente=self.cliente, servicio=servicio, descripcion='', ubicacion='',
+                latitud=-33.45, longitud=-70.66, trabajador_asignado=trabajador,
+            )
+            Pago.objects.create(solicitud=solicitud, monto=1000)
+            calificacion = Calificacion.objects.create(
+                cliente=self.cliente, trabajador=trabajador, solicitud=solicitud, puntuacion=5,
+            )
+            EtiquetaCalificacion.objects.create(calificacion=calificacion, etiqueta=self.etiqueta)
+            plan = PlanServicio.objects.create(
+                trabajador=self.trabajador_fijo, nombre=f'Plan {i}', descripcion='',
+                duracion_estimado=timedelta(hours=1), precio=1000,
+            )
+            Reserva.objects.create(
+                trabajador=trabajador, cliente=self.cliente, plan=plan,
+                fecha=date(2030, 1, 1), hora_inicio=time(9), hora_fin=time(10),
+            )
+            Mensaje.objects.create(chat=self.chat, remitente=trabajador.usuario, contenido='hola')
+
+    @property
+    def trabajador_fijo(self):
+        if not hasattr(self, '_trabajador_fijo'):
+            self._trabajador_fijo = Trabajador.objects.create(
+                usuario=Usuario.objects.create(username='fijo'), profesion=self.profesion,
+            )
+        return self._trabajador_fijo
+
+    @property
+    def chat(self):
+        if not hasattr(self, '_chat'):
+            self._chat = Chat.objects.create(cliente=self.usuario, trabajador=self.trabajador_fijo.usuario)
+        return self._chat
+
+    def contar_consultas(self, url, params=None):
+        with CaptureQueriesContext(connection) as consultas:
+            res = self.client.get(url, params)
+        self.assertEqual(res.status_code, 200, res.content)
+        return len(consultas)
+
+    def assertConsultasConstantes(self, url, params=None):
+        self.sembrar(3)
+        con_pocas = self.contar_consultas(url, params)
+        self.sembrar(3)
+        self.assertEqual(self.contar_consultas(url, params), con_pocas, url)
+
+    def test_listados(self):
+        for url in [
+            '/api/usuarios/', '/api/clientes/', '/api/trabajadores/', '/api/solicitudes/',
+            '/api/pagos/', '/api/calificaciones/', '/api/etiquetas-calificaciones/',
+            '/api/reservas/', '/api/ranking/trabajadores/',
+        ]:
+            with self.subTest(url=url):
+                self.assertConsultasConstantes(url)
+
+    def test_planes_de_un_trabajador(self):
+        self.assertConsultasConstantes('/api/planes/', {'trabajador': self.trabajador_fijo.pk})
+
+    def test_mensajes_de_un_chat(self):
+        self.assertConsultasConstantes(f'/api/chats/{self.chat.pk}/mensajes/')
+
+    def test_solicitudes_cercanas(self):
+        self.assertConsultasConstantes('/api/solicitudes/cercanas/', {'lat': -33.45, 'lng': -70.66})
+
+    def test_trabajadores_cercanos(self):
+        # El directorio en memoria se recarga fuera de la medición
+        sembrar = self.sembrar
+
+        def sembrar_y_recargar(cantidad):
+            sembrar(cantidad)
+            directorio.recargar()
+
+        self.sembrar = sembrar_y_recargar
+        self.assertConsultasConstantes('/api/trabajadores-cercanos/', {'lat': -33.45, 'lon': -70.66})
+
+
+class CamposDinamicosTests(TestCase):
+    def setUp(self):
+        usuario = Usuario.objects.create(username='cliente')
+        cliente = Cliente.objects.create(usuario=usuario)
+        self.servicio = Servicio.objects.create(nombre='Gasfiter', descripcion='')
+        self.solicitud = Solicitud.objects.create(
+            cliente=cliente, servicio=self.servicio, descripcion='', ubicacion='',
+        )
+        self.pago = Pago.objects.create(solicitud=self.solicitud, monto=1000)
+        self.client = APIClient()
+        self.client.force_authenticate(usuario)
+
+    def test_sin_parametros_mantiene_el_anidado(self):
+        res = self.client.get('/api/pagos/')
+        self.assertEqual(res.json()['results'][0]['solicitud']['servicio']['nombre'], 'Gasfiter')
+
+    def test_expand_vacio_deja_ids(self):
+        with self.assertNumQueries(1):
+            res = self.client.get('/api/pagos/', {'expand': ''})
+        self.assertEqual(res.json()['results'][0]['solicitud'], self.solicitud.id)
+
+    def test_expand_y_fields(self):
+        res = self.client.get('/api/pagos/', {'expand': 'solicitud', 'fields': 'id,solicitud'})
+        pago = res.json()['results'][0]
+        self.assertEqual(set(pago), {'id', 'solicitud'})
+        self.assertEqual(pago['solicitud']['servicio']['id'], self.servicio.id)
+
+        res = self.client.get('/api/pagos/', {'fields': 'id,monto'})
+        self.assertEqual(set(res.json()['results'][0]), {'id', 'monto'})
+
+
+class MensajesIncrementalesTests(TestCase):
+    def setUp(self):
+        self.cliente = Usuario.objects.create(username='cliente')
+        self.trabajador = Usuario.objects.create(username='trabajador')
+        self.chat = Chat.objects.create(cliente=self.cliente, trabajador=self.trabajador)
+        self.ids = [
+            Mensaje.objects.create(chat=self.chat, remitente=self.cliente, contenido=f'm{i}').id
+            for i in range(5)
+        ]
+        self.url = f'/api/chats/{self.chat.pk}/mensajes/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.cliente)
+
+    def ids_de(self, res):
+        self.assertEqual(res.status_code, 200, res.content)
+        return [m['id'] for m in res.json()]
+
+    def test_after_trae_solo_los_nuevos(self):
+        res = self.client.get(self.url, {'after': self.ids[2]})
+        self.assertEqual(self.ids_de(res), self.ids[3:])
+
+    def test_polling_sin_novedades_es_una_consulta(self):
+        with self.assertNumQueries(1):
+            res = self.client.get(self.url, {'after': self.ids[-1]})
+        self.assertEqual(res.json(), [])
+
+    def test_before_pagina_hacia_atras(self):
+        res = self.client.get(self.url, {'limit': 2})
+        self.assertEqual(self.ids_de(res), self.ids[3:])
+        res = self.client.get(self.url, {'before': self.ids[3], 'limit': 2})
+        self.assertEqual(self.ids_de(res), self.ids[1:3])
+
+    def test_cursor_invalido(self):
+        self.assertEqual(self.client.get(self.url, {'after': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/chats/999999/mensajes/').status_code, 404)
+
+
+class StreamMensajesTests(TestCase):
+    def setUp(self):
+        self.cliente = Usuario.objects.create(username='cliente')
+        self.trabajador = Usuario.objects.create(username='trabajador')
+        self.chat = Chat.objects.create(cliente=self.cliente, trabajador=self.trabajador)
+        self.primero = Mensaje.objects.create(chat=self.chat, remitente=self.cliente, contenido='hola')
+        self.segundo = Mensaje.objects.create(chat=self.chat, remitente=self.cliente, contenido='¿está?')
+        self.url = f'/api/chats/{self.chat.pk}/stream/'
+        token = RefreshToken.for_user(self.trabajador).access_token
+        self.auth = {'Authorization': f'Bearer {token}'}
+
+    def enviar(self, contenido):
+        client = APIClient()
+        client.force_authenticate(self.trabajador)
+        with self.captureOnCommitCallbacks(execute=True):
+            res = client.post(f'/api/chats/{self.chat.pk}/mensajes/', {'contenido': contenido})
+        return res.json()['id']
+
+    def test_bajo_wsgi_responde_501(self):
+        res = self.client.get(self.url, headers=self.auth)
+        self.assertEqual(res.status_code, 501)
+        self.assertIn('ASGI', res.json()['error'])
+
+    @mock.patch('core.views.SSE_LATIDO', 0.05)
+    @mock.patch('core.views.SSE_DURACION_MAXIMA', 0.5)
+    async def test_se_pone_al_dia_y_empuja_los_nuevos(self):
+        res = await self.async_client.get(self.url, {'after': self.primero.pk}, headers=self.auth)
+        self.assertEqual(res['Content-Type'], 'text/event-stream')
+        eventos = res.streaming_content
+        self.assertIn(f'id: {self.segundo.pk}\n', (await anext(eventos)).decode())
+
+        nuevo = await sync_to_async(self.enviar)('voy en camino')
+        evento = (await anext(eventos)).decode()
+        self.assertIn(f'id: {nuevo}\n', evento)
+        self.assertIn('voy en camino', evento)
+
+        # Sin novedades solo hay latidos, hasta que se cumple la duración máxima
+        resto = [evento async for evento in eventos]
+        self.assertTrue(resto)
+        self.assertTrue(all(evento == b': ping\n\n' for evento in resto))
+
+    @mock.patch('core.views.MENSAJES_LIMITE_MAXIMO', 2)
+    @mock.patch('core.views.SSE_LATIDO', 0.05)
+    @mock.patch('core.views.SSE_DURACION_MAXIMA', 0.2)
+    async def test_atraso_mayor_que_una_pagina(self):
+        atrasados = await sync_to_async(Mensaje.objects.bulk_create)([
+            Mensaje(chat=self.chat, remitente=self.cliente, contenido=f'm{i}') for i in range(5)
+        ])
+        res = await self.async_client.get(self.url, {'after': self.primero.pk}, headers=self.auth)
+        eventos = [evento.decode() async for evento in res.streaming_content]
+        recibidos = [int(e.split('\n')[0][4:]) for e in eventos if e.startswith('id: ')]
+        self.assertEqual(recibidos, [self.segundo.pk] + [m.pk for m in atrasados])
+
+    async def test_requiere_ser_participante(self):
+        res = await self.async_client.get(self.url)
+        self.assertEqual(res.status_code, 401)
+
+        otro = await sync_to_async(Usuario.objects.create)(username='otro')
+        token = RefreshToken.for_user(otro).access_token
+        res = await self.async_client.get(self.url, headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(res.status_code, 401)
+
+
+class BandejaChatsTests(TestCase):
+    def setUp(self):
+        self.yo = Usuario.objects.create(username='cliente', nombre='Ana')
+        self.client = APIClient()
+        self.client.force_authenticate(self.yo)
+
+    def abrir_chat(self, nombre):
+        otro = Usuario.objects.create(username=nombre, nombre=nombre)
+        return Chat.objects.create(cliente=self.yo, trabajador=otro), otro
+
+    def test_bandeja_en_una_consulta(self):
+        chat_a, juan = self.abrir_chat('juan')
+        chat_b, pedro = self.abrir_chat('pedro')
+        self.abrir_chat('sin_mensajes')
+        Mensaje.objects.create(chat=chat_a, remitente=juan, contenido='hola')
+        Mensaje.objects.create(chat=chat_b, remitente=pedro, contenido='uno')
+        Mensaje.objects.create(chat=chat_b, remitente=self.yo, contenido='dos')
+        ultimo = Mensaje.objects.create(chat=chat_b, remitente=pedro, contenido='tres')
+
+        with self.assertNumQueries(1):
+            res = self.client.get('/api/chats/')
+        bandeja = res.json()
+
+        self.assertEqual([c['id'] for c in bandeja][:2], [chat_b.id, chat_a.id])
+        self.assertIsNone(bandeja[2]['ultimo_mensaje'])
+        self.assertEqual(bandeja[0]['contraparte']['nombre'], 'pedro')
+        self.assertEqual(bandeja[0]['ultimo_mensaje']['id'], ultimo.id)
+        self.assertEqual(bandeja[0]['ultimo_mensaje']['contenido'], 'tres')
+        # Los mensajes propios no cuentan como no leídos
+        self.assertEqual(bandeja[0]['no_leidos'], 2)
+        self.assertEqual(bandeja[1]['no_leidos'], 1)
+
+    def test_marcar_leido(self):
+        chat, juan = self.abrir_chat('juan')
+        primero = Mensaje.objects.create(chat=chat, remitente=juan, contenido='a')
+        Mensaje.objects.create(chat=chat, remitente=juan, contenido='b')
+
+        self.client.post(f'/api/chats/{chat.pk}/leido/', {'mensaje_id': primero.id})
+        self.assertEqual(self.client.get('/api/chats/').json()[0]['no_leidos'], 1)
+
+        self.client.post(f'/api/chats/{chat.pk}/leido/')
+        self.assertEqual(self.client.get('/api/chats/').json()[0]['no_leidos'], 0)
+
+        # Una marca atrasada no hace retroceder el marcador
+        self.client.post(f'/api/chats/{chat.pk}/leido/', {'mensaje_id': primero.id})
+        self.assertEqual(self.client.get('/api/chats/').json()[0]['no_leidos'], 0)
+
+        # La contraparte tiene su propio marcador
+        otro_cliente = APIClient()
+        otro_cliente.force_authenticate(juan)
+        self.assertEqual(otro_cliente.get('/api/chats/').json()[0]['no_leidos'], 0)
+
+    def test_abrir_chat_no_duplica(self):
+        trabajador = Usuario.objects.create(username='trabajador')
+        primero = self.client.get(f'/api/chats/{trabajador.pk}/').json()['id']
+        segundo = self.client.get(f'/api/chats/{trabajador.pk}/').json()['id']
+        self.assertEqual(primero, segundo)
+        self.assertEqual(Chat.objects.filter(cliente=self.yo, trabajador=trabajador).count(), 1)
+
+
+@override_settings(CHAT_INGESTA_LOTES=True)
+class IngestaMensajesTests(TransactionTestCase):
+    def setUp(self):
+        self.cliente = Usuario.objects.create(username='cliente')
+        self.trabajador = Usuario.objects.create(username='trabajador')
+        self.chat = Chat.objects.create(cliente=self.cliente, trabajador=self.trabajador)
+        self.client = APIClient()
+        self.client.force_authenticate(self.cliente)
+
+    def test_post_devuelve_el_id_y_respeta_el_orden(self):
+        ids = [
+            self.client.post(f'/api/chats/{self.chat.pk}/mensajes/', {'contenido': f'm{i}'}).json()['id']
+            for i in range(5)
+        ]
+        guardados = list(Mensaje.objects.filter(chat=self.chat).order_by('id').values_list('id', 'contenido'))
+        self.assertEqual(guardados, [(id, f'm{i}') for i, id in enumerate(ids)])
+
+    def test_lote_concurrente(self):
+        ingesta = IngestaMensajes(maximo=10, espera_ms=50)
+        resultados = {}
+
+        def enviar(i):
+            resultados[i] = ingesta.ingerir(self.chat.id, self.cliente, f'm{i}')
+            connection.close()
+
+        hilos = [threading.Thread(target=enviar, args=(i,)) for i in range(10)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+
+        self.assertEqual(len({m.id for m in resultados.values()}), 10)
+        self.assertEqual(Mensaje.objects.filter(chat=self.chat).count(), 10)
+
+    def test_mensaje_invalido_no_tumba_el_lote(self):
+        ingesta = IngestaMensajes(maximo=10, espera_ms=50)
+        resultados = {}
+
+        def enviar(i, chat_id):
+            try:
+                resultados[i] = ingesta.ingerir(chat_id, self.cliente, f'm{i}')
+            except Exception as e:
+                resultados[i] = e
+            connection.close()
+
+        with self.assertLogs('core.ingesta', 'WARNING') as logs:
+            hilos = [
+                threading.Thread(target=enviar, args=(i, self.chat.id if i != 2 else self.chat.id + 1000))
+                for i in range(5)
+            ]
+            for h in hilos:
+                h.start()
+            for h in hilos:
+                h.join()
+
+        self.assertIsInstance(resultados.pop(2), Exception)
+        self.assertTrue(all(m.id for m in resultados.values()))
+        self.assertEqual(
+            set(Mensaje.objects.filter(chat=self.chat).values_list('contenido', flat=True)),
+            {'m0', 'm1', 'm3', 'm4'},
+        )
+        self.assertTrue(any('rechazado' in linea for linea in logs.output))
+
+    def test_cola_atascada_guarda_directo_sin_duplicar(self):
+        ingesta = IngestaMensajes(maximo=10, espera_ms=5, timeout=0.05)
+        # Sin hilo que vacíe la cola, el POST agota el timeout
+        with mock.patch('core.views.ingesta', ingesta), \
+                mock.patch.object(ingesta, '_asegurar_hilo'), \
+                self.assertLogs('core.ingesta', 'WARNING'):
+            res = self.client.post(f'/api/chats/{self.chat.pk}/mensajes/', {'contenido': 'hola'})
+        self.assertEqual(res.status_code, 201)
+        self.assertTrue(Mensaje.objects.filter(pk=res.json()['id'], contenido='hola').exists())
+
+        # Cuando el hilo arranca, descarta el mensaje retirado de la cola
+        ingesta._asegurar_hilo()
+        ingesta.ingerir(self.chat.id, self.cliente, 'siguiente')
+        self.assertEqual(
+            list(Mensaje.objects.filter(chat=self.chat).values_list('contenido', flat=True)),
+            ['hola', 'siguiente'],
+        )
+
+    def test_benchmark(self):
+        salida = StringIO()
+        # Un solo hilo emisor: dos escritores sobre la base SQLite en memoria
+        # de las pruebas pueden chocar con 'table is locked'
+        call_command('benchmark_chat_ingesta', mensajes=20, hilos=1, stdout=salida)
+        self.assertIn('directo', salida.getvalue())
+        self.assertIn('lotes', salida.getvalue())
+        self.assertFalse(Usuario.objects.filter(username__startswith='benchmark-').exists())
+
+
+class SlotsTests(TestCase):
+    def setUp(self):
+        profesion = Profesion.objects.create(nombre='Gasfitería')
+        self.trabajador = Trabajador.objects.create(
+            usuario=Usuario.objects.create(username='trabajador'), profesion=profesion,
+            disponibilidad='{"lunes": [{"inicio": "08:00", "fin": "12:00"}], "mi\\u00e9rcoles": []}',
+        )
+        self.plan = self.crear_plan('Instalación', timedelta(hours=1))
+        self.otro_plan = self.crear_plan('Revisión', timedelta(minutes=90))
+        self.lunes = date(2030, 1, 7)
+        self.client = APIClient()
+
+    def crear_plan(self, nombre, duracion):
+        return PlanServicio.objects.create(
+            trabajador=self.trabajador, nombre=nombre, descripcion='',
+            duracion_estimado=duracion, precio=1000,
+        )
+
+    def reservar(self, plan, inicio, fin, estado='CONFIRMADA'):
+        Reserva.objects.create(
+            plan=plan, trabajador=self.trabajador, fecha=self.lunes,
+            hora_inicio=inicio, hora_fin=fin, estado=estado,
+        )
+
+    def slots(self, **params):
+        res = self.client.get(f'/api/planes/{self.plan.pk}/slots/', params)
+        self.assertEqual(res.status_code, 200, res.content)
+        return res.json()['slots']
+
+    def test_descuenta_reservas_de_todos_los_planes(self):
+        self.reservar(self.otro_plan, time(9), time(10, 30))
+        self.reservar(self.plan, time(11), time(12), estado='CANCELADA')
+
+        slots = self.slots(desde='2030-01-07', hasta='2030-01-13')
+        self.assertEqual(list(slots), ['2030-01-07'])
+        self.assertEqual(
+            [s['hora_inicio'] for s in slots['2030-01-07']], ['08:00', '10:30', '11:00'],
+        )
+        self.assertEqual(slots['2030-01-07'][0]['hora_fin'], '09:00')
+
+    def test_consultas_constantes_en_el_rango(self):
+        with self.assertNumQueries(3):
+            semana = self.slots(desde='2030-01-07', hasta='2030-01-13')
+        with self.assertNumQueries(3):
+            meses = self.slots(desde='2030-01-07', hasta='2030-03-03')
+        self.assertEqual(len(semana), 1)
+        self.assertEqual(len(meses), 8)
+
+    def test_parametros_invalidos(self):
+        url = f'/api/planes/{self.plan.pk}/slots/'
+        self.assertEqual(self.client.get(url, {'desde': '07-01-2030'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'desde': '2030-01-07', 'hasta': '2030-01-01'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'desde': '2030-01-01', 'hasta': '2031-01-01'}).status_code, 400)
+
+    def test_leer_disponibilidad_acepta_repr_de_python(self):
+        franjas = leer_disponibilidad("{'Sábado': [{'inicio': '13:00', 'fin': '16:00'}, {'inicio': '13:00', 'fin': '13:00'}]}")
+        self.assertEqual(franjas, {5: [(time(13), time(16))]})
+        self.assertEqual(leer_disponibilidad('no es json'), {})
+
+    def test_omite_horarios_pasados(self):
+        franjas = {0: [(time(8), time(12))]}
+        slots = calcular_slots(
+            franjas, timedelta(hours=1), {}, self.lunes, self.lunes,
+            ahora=datetime(2030, 1, 7, 9, 10),
+        )
+        self.assertEqual([i for i, _ in slots[self.lunes]], [time(9, 30), time(10), time(10, 30), time(11)])
+
+
+class DisponibilidadTrabajadorTests(TestCase):
+    def setUp(self):
+        self.profesion = Profesion.objects.create(nombre='Gasfitería')
+        self.client = APIClient()
+
+    def crear(self, username, disponibilidad):
+        return Trabajador.objects.create(
+            usuario=Usuario.objects.create(username=username), profesion=self.profesion,
+            disponibilidad=disponibilidad,
+        )
+
+    def filtrar(self, **params):
+        res = self.client.get('/api/trabajadores/', params)
+        self.assertEqual(res.status_code, 200, res.content)
+        return {t['id'] for t in res.json()['results']}
+
+    def test_guardar_sincroniza_las_franjas(self):
+        trabajador = self.crear('ana', '{"lunes": [{"inicio": "08:00", "fin": "12:00"}]}')
+        self.assertEqual(
+            list(trabajador.disponibilidades.values_list('dia_semana', 'inicio', 'fin')),
+            [(0, time(8), time(12))],
+        )
+
+        trabajador.disponibilidad = '{"sábado": [{"inicio": "10:00", "fin": "14:00"}], "lunes": []}'
+        trabajador.save()
+        self.assertEqual(
+            list(trabajador.disponibilidades.values_list('dia_semana', 'inicio', 'fin')),
+            [(5, time(10), time(14))],
+        )
+
+    def test_filtro_por_dia_y_hora(self):
+        sabado = self.crear('ana', '{"sábado": [{"inicio": "09:00", "fin": "13:00"}, {"inicio": "15:00", "fin": "18:00"}]}')
+        manana = self.crear('beto', '{"lunes": [{"inicio": "08:00", "fin": "10:00"}]}')
+        self.crear('carla', '')
+
+        self.assertEqual(self.filtrar(disponible_dia='sabado', disponible_hora='10:00'), {sabado.pk})
+        self.assertEqual(self.filtrar(disponible_dia=5, disponible_hora='13:00'), set())
+        self.assertEqual(self.filtrar(disponible_dia='lunes'), {manana.pk})
+        self.assertEqual(self.filtrar(disponible_hora='09:30'), {sabado.pk, manana.pk})
+
+    def test_filtro_invalido(self):
+        self.assertEqual(self.client.get('/api/trabajadores/', {'disponible_dia': 'feriado'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/trabajadores/', {'disponible_hora': '25:00'}).status_code, 400)
+
+
+class ReservaConflictosTests(TestCase):
+    def setUp(self):
+        profesion = Profesion.objects.create(nombre='Gasfitería')
+        self.usuario = Usuario.objects.create(username='trabajador')
+        self.trabajador = Trabajador.objects.create(usuario=self.usuario, profesion=profesion)
+        self.largo = self.crear_plan('Instalación', timedelta(hours=2))
+        self.corto = self.crear_plan('Revisión', timedelta(hours=1))
+        self.fecha = date(2030, 1, 7)
+
+    def crear_plan(self, nombre, duracion):
+        return PlanServicio.objects.create(
+            trabajador=self.trabajador, nombre=nombre, descripcion='',
+            duracion_estimado=duracion, precio=1000,
+        )
+
+    def test_choque_entre_planes_del_mismo_trabajador(self):
+        reserva = reservar(self.largo, self.fecha, time(10))
+        self.assertEqual((reserva.trabajador_id, reserva.hora_fin), (self.trabajador.pk, time(12)))
+
+        with self.assertRaises(ReservaEnConflicto):
+            reservar(self.corto, self.fecha, time(11))
+        with self.assertRaises(ReservaEnConflicto):
+            reservar(self.corto, self.fecha, time(9, 30))
+
+        # Contiguas no chocan, y una cancelada libera su horario
+        reservar(self.corto, self.fecha, time(12))
+        reservar(self.corto, self.fecha, time(9))
+        reserva.estado = 'CANCELADA'
+        reserva.save()
+        reservar(self.corto, self.fecha, time(10, 30))
+
+    def test_consulta_de_choque_usa_el_indice(self):
+        plan = choques(self.trabajador.pk, self.fecha, time(10), time(11)).explain()
+        self.assertIn('reserva_trabajador_fecha_idx', plan)
+
+    def test_crear_por_api_rechaza_el_choque(self):
+        client = APIClient()
+        client.force_authenticate(self.usuario)
+        datos = {'plan': self.largo.pk, 'fecha': '2030-01-07', 'hora_inicio': '10:00', 'hora_fin': '12:00'}
+        self.assertEqual(client.post('/api/reservas/', datos).status_code, 201)
+        datos.update(plan=self.corto.pk, hora_inicio='11:00', hora_fin='12:00')
+        self.assertEqual(client.post('/api/reservas/', datos).status_code, 400)
+
+    def test_crear_por_api_rechaza_planes_ajenos(self):
+        otro = Usuario.objects.create(username='otro')
+        Trabajador.objects.create(usuario=otro, profesion=self.trabajador.profesion)
+        datos = {'plan': self.largo.pk, 'fecha': '2030-01-07', 'hora_inicio': '10:00', 'hora_fin': '12:00'}
+        client = APIClient()
+        for usuario in (otro, Usuario.objects.create(username='cliente')):
+            client.force_authenticate(usuario)
+            self.assertEqual(client.post('/api/reservas/', datos).status_code, 403)
+        self.assertFalse(Reserva.objects.exists())
+
+    def test_modificar_por_api_rechaza_el_choque(self):
+        ocupada = reservar(self.largo, self.fecha, time(10))
+        libre = reservar(self.corto, self.fecha, time(14))
+        client = APIClient()
+        client.force_authenticate(self.usuario)
+
+        res = client.patch(f'/api/reservas/{libre.pk}/', {'hora_inicio': '11:00', 'hora_fin': '12:00'})
+        self.assertEqual(res.status_code, 400)
+        datos = {'plan': self.largo.pk, 'fecha': '2030-01-07', 'hora_inicio': '10:00', 'hora_fin': '12:00'}
+        self.assertEqual(client.put(f'/api/reservas/{libre.pk}/', datos).status_code, 400)
+        libre.refresh_from_db()
+        self.assertEqual(libre.hora_inicio, time(14))
+
+        # Moverse dentro de su propio horario no choca consigo misma
+        res = client.patch(f'/api/reservas/{ocupada.pk}/', {'hora_inicio': '10:30', 'hora_fin': '12:30'})
+        self.assertEqual(res.status_code, 200)
+        ocupada.refresh_from_db()
+        self.assertEqual((ocupada.hora_inicio, ocupada.hora_fin), (time(10, 30), time(12, 30)))
+
+    def test_modificar_por_api_rechaza_usuarios_ajenos(self):
+        reserva = reservar(self.corto, self.fecha, time(14))
+        otro = Usuario.objects.create(username='otro')
+        ajeno = Trabajador.objects.create(usuario=otro, profesion=self.trabajador.profesion)
+        plan_ajeno = PlanServicio.objects.create(
+            trabajador=ajeno, nombre='Otro', descripcion='', duracion_estimado=timedelta(hours=1), precio=1000,
+        )
+        client = APIClient()
+        for usuario in (otro, Usuario.objects.create(username='cliente')):
+            client.force_authenticate(usuario)
+            self.assertEqual(client.patch(f'/api/reservas/{reserva.pk}/', {'hora_inicio': '15:00'}).status_code, 403)
+        # El dueño tampoco puede pasar su reserva a un plan ajeno
+        client.force_authenticate(self.usuario)
+        self.assertEqual(client.patch(f'/api/reservas/{reserva.pk}/', {'plan': plan_ajeno.pk}).status_code, 403)
+        reserva.refresh_from_db()
+        self.assertEqual((reserva.plan, reserva.hora_inicio), (self.corto, time(14)))
+
+
+class RetencionReservasTests(TestCase):
+    def setUp(self):
+        profesion = Profesion.objects.create(nombre='Gasfitería')
+        self.trabajador = Trabajador.objects.create(
+            usuario=Usuario.objects.create(username='trabajador'), profesion=profesion,
+            disponibilidad='{"lunes": [{"inicio": "10:00", "fin": "12:00"}]}',
+        )
+        self.plan = PlanServicio.objects.create(
+            trabajador=self.trabajador, nombre='Revisión', descripcion='',
+            duracion_estimado=timedelta(hours=1), precio=1000,
+        )
+        self.fecha = date(2030, 1, 7)
+
+    def retener(self, hora, expira_en):
+        return reservar(self.plan, self.fecha, time(hora), estado='PENDIENTE', expira_en=expira_en)
+
+    def test_retencion_vencida_no_bloquea(self):
+        vencida = self.retener(10, timezone.now() - timedelta(minutes=1))
+        self.retener(11, timezone.now() + timedelta(minutes=10))
+
+        res = APIClient().get(f'/api/planes/{self.plan.pk}/slots/', {'desde': '2030-01-07', 'hasta': '2030-01-07'})
+        self.assertEqual([s['hora_inicio'] for s in res.json()['slots']['2030-01-07']], ['10:00'])
+
+        nueva = reservar(self.plan, self.fecha, time(10))
+        self.assertNotEqual(nueva.pk, vencida.pk)
+        with self.assertRaises(ReservaEnConflicto):
+            reservar(self.plan, self.fecha, time(11))
+
+    def test_comando_libera_en_lotes(self):
+        for hora in (8, 9, 10):
+            self.retener(hora, timezone.now() - timedelta(minutes=1))
+        vigente = self.retener(11, timezone.now() + timedelta(minutes=10))
+        confirmada = reservar(self.plan, self.fecha, time(12), estado='CONFIRMADA')
+
+        salida = StringIO()
+        call_command('liberar_reservas_vencidas', lote=2, stdout=salida)
+        self.assertIn('3 reservas vencidas canceladas', salida.getvalue())
+        self.assertEqual(Reserva.objects.filter(estado='CANCELADA').count(), 3)
+
+        Reserva.objects.filter(estado='CANCELADA').update(estado='PENDIENTE')
+        self.assertEqual(liberar_vencidas(borrar=True), 3)
+        self.assertEqual(set(Reserva.objects.values_list('pk', flat=True)), {vigente.pk, confirmada.pk})
+
+    def test_barrido_periodico(self):
+        corridas = threading.Event()
+        detener = programar_periodica(corridas.set, 0.01)
+        try:
+            self.assertTrue(corridas.wait(2))
+        finally:
+            detener.set()
+
+    @override_settings(RESERVAS_BARRIDO_INTERVALO=60)
+    def test_barrido_arranca_con_la_primera_solicitud(self):
+        from django.core.signals import request_started
+        from . import reservas
+
+        self.assertIsNone(reservas._barrido)
+        request_started.connect(reservas.iniciar_barrido, dispatch_uid='core.iniciar_barrido')
+        detener = threading.Event()
+        try:
+            with mock.patch('core.tareas.programar_periodica', return_value=detener) as programar:
+                self.client.get('/api/profesiones/')
+                self.client.get('/api/profesiones/')
+            programar.assert_called_once_with(reservas.liberar_vencidas, 60)
+        finally:
+            reservas._barrido = None
+            request_started.disconnect(dispatch_uid='core.iniciar_barrido')
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='whsec_prueba', TAREAS_BACKEND='sincrono')
+class StripeWebhookTests(TestCase):
+    def setUp(self):
+        profesion = Profesion.objects.create(nombre='Gasfitería')
+        self.trabajador = Trabajador.objects.create(
+            usuario=Usuario.objects.create(username='trabajador'), profesion=profesion,
+        )
+        self.plan = PlanServicio.objects.create(
+            trabajador=self.trabajador, nombre='Revisión', descripcion='',
+            duracion_estimado=timedelta(hours=1), precio=1000,
+        )
+        self.reserva = reservar(
+            self.plan, date(2030, 1, 7), time(10), estado='PENDIENTE',
+            expira_en=timezone.now() + timedelta(minutes=15),
+        )
+
+    def evento(self, tipo='checkout.session.completed', evento_id='evt_1', pago='paid'):
+        return {
+            'id': evento_id, 'type': tipo,
+            'data': {'object': {
+                'id': 'cs_1', 'payment_status': pago,
+                'metadata': {'reserva_id': str(self.reserva.pk)},
+            }},
+        }
+
+    def enviar(self, evento, secreto='whsec_prueba'):
+        """Firma el payload como lo hace Stripe (t=<timestamp>,v1=<hmac-sha256>)."""
+        payload = json.dumps(evento)
+        t = int(pytime.time())
+        firma = hmac.new(secreto.encode(), f'{t}.{payload}'.encode(), hashlib.sha256).hexdigest()
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                '/api/stripe/webhook/', payload, content_type='application/json',
+                HTTP_STRIPE_SIGNATURE=f't={t},v1={firma}',
+            )
+
+    def test_confirma_la_reserva(self):
+        self.assertEqual(self.enviar(self.evento()).status_code, 200)
+        self.reserva.refresh_from_db()
+        self.assertEqual(self.reserva.estado, 'CONFIRMADA')
+        self.assertIsNone(self.reserva.expira_en)
+        self.assertIsNotNone(EventoStripe.objects.get(evento_id='evt_1').procesado)
+
+    def test_reintento_es_un_no_op(self):
+        self.enviar(self.evento())
+        Reserva.objects.filter(pk=self.reserva.pk).update(estado='CANCELADA')
+
+        # El INSERT que choca con el índice único (más el savepoint que lo
+        # envuelve) y la consulta que confirma que ya está procesado
+        with self.assertNumQueries(5):
+            res = self.enviar(self.evento())
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(Reserva.objects.get(pk=self.reserva.pk).estado, 'CANCELADA')
+        self.assertEqual(EventoStripe.objects.count(), 1)
+
+    def test_reintento_tras_tarea_perdida(self):
+        # El evento quedó registrado pero la tarea nunca corrió
+        EventoStripe.objects.create(evento_id='evt_1', tipo='checkout.session.completed', datos=self.evento())
+
+        self.assertEqual(self.enviar(self.evento()).status_code, 200)
+        self.assertEqual(Reserva.objects.get(pk=self.reserva.pk).estado, 'CONFIRMADA')
+        self.assertIsNotNone(EventoStripe.objects.get(evento_id='evt_1').procesado)
+
+    def test_reintento_tras_tarea_fallida(self):
+        manejador = mock.Mock(side_effect=RuntimeError('caída'))
+        with mock.patch.dict('core.webhooks.MANEJADORES', {'checkout.session.completed': manejador}), \
+                self.assertLogs('core.tareas', 'ERROR'):
+            self.enviar(self.evento())
+        self.assertIsNone(EventoStripe.objects.get(evento_id='evt_1').procesado)
+        self.assertEqual(Reserva.objects.get(pk=self.reserva.pk).estado, 'PENDIENTE')
+
+        self.enviar(self.evento())
+        self.assertEqual(Reserva.objects.get(pk=self.reserva.pk).estado, 'CONFIRMADA')
+        self.assertIsNotNone(EventoStripe.objects.get(evento_id='evt_1').procesado)
+
+    def test_comando_reprocesa_eventos_atascados(self):
+        EventoStripe.objects.create(evento_id='evt_1', tipo='checkout.session.completed', datos=self.evento())
+        EventoStripe.objects.create(evento_id='evt_2', tipo='checkout.session.completed',
+                                    datos=self.evento(evento_id='evt_2'))
+        # Solo evt_1 es lo bastante viejo; evt_2 puede tener su tarea en curso
+        EventoStripe.objects.filter(evento_id='evt_1').update(recibido=timezone.now() - timedelta(minutes=10))
+
+        salida = StringIO()
+        call_command('reprocesar_eventos_stripe', minutos=5, stdout=salida)
+        self.assertIn('1 eventos', salida.getvalue())
+        self.assertEqual(Reserva.objects.get(pk=self.reserva.pk).estado, 'CONFIRMADA')
+        self.assertIsNone(EventoStripe.objects.get(evento_id='evt_2').procesado)
+
+    def test_firma_invalida(self):
+        self.assertEqual(self.enviar(self.evento(), secreto='otro').status_code, 400)
+        self.assertFalse(EventoStripe.objects.exists())
+
+    def test_sesion_expirada_cancela(self):
+        self.enviar(self.evento(tipo='checkout.session.expired'))
+        self.assertEqual(Reserva.objects.get(pk=self.reserva.pk).estado, 'CANCELADA')
+
+    def test_pago_tras_vencer_la_retencion(self):
+        # El barrido canceló la retención y otro cliente tomó el horario
+        Reserva.objects.filter(pk=self.reserva.pk).update(estado='CANCELADA')
+        reservar(self.plan, date(2030, 1, 7), time(10), estado='CONFIRMADA')
+
+        with self.assertLogs('core.webhooks', 'ERROR'):
+            self.enviar(self.evento())
+        self.assertEqual(Reserva.objects.get(pk=self.reserva.pk).estado, 'CANCELADA')
+
+
+class PasarelaFalsa:
+    """
+    Servidor HTTP local que hace de Flow o Stripe en las pruebas. Responde en
+    orden las `respuestas` encoladas (estado, cuerpo, demora en segundos) y
+    anota cada solicitud y cada conexión TCP nueva.
+    """
+
+    def __init__(self):
+        self.respuestas = []
+        self.solicitudes = []
+        self.conexiones = 0
+        falsa = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                falsa.conexiones += 1
+                super().setup()
+
+            def responder(self):
+                largo = int(self.headers.get('Content-Length') or 0)
+                falsa.solicitudes.append((self.command, self.path, self.rfile.read(largo)))
+                estado, cuerpo, demora = falsa.respuestas.pop(0) if falsa.respuestas else (200, {}, 0)
+                pytime.sleep(demora)
+                datos = json.dumps(cuerpo).encode()
+                self.send_response(estado)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(datos)))
+                self.end_headers()
+                try:
+                    self.wfile.write(datos)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass   # el cliente ya cortó por timeout
+
+            do_GET = do_POST = responder
+
+            def log_message(self, *args):
+                pass
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), Manejador)
+        self.servidor.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.servidor.server_port}'
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def cerrar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+def puerto_cerrado():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class ClientePasarelaTests(TestCase):
+    def setUp(self):
+        self.falsa = PasarelaFalsa()
+        self.addCleanup(self.falsa.cerrar)
+        self.cliente = ClientePasarela('prueba', self.falsa.url, timeout=(1, 0.3), backoff=0)
+        metricas.reiniciar()
+
+    def test_reutiliza_la_conexion(self):
+        for _ in range(3):
+            self.assertEqual(self.cliente.get('estado').status_code, 200)
+        self.assertEqual(len(self.falsa.solicitudes), 3)
+        self.assertEqual(self.falsa.conexiones, 1)
+
+    def test_reintenta_get_ante_503(self):
+        self.falsa.respuestas = [(503, {}, 0), (503, {}, 0), (200, {'ok': True}, 0)]
+        with self.assertLogs('core.pasarelas', 'WARNING'):
+            self.assertEqual(self.cliente.get('estado').json(), {'ok': True})
+        m = metricas_pasarelas()['prueba']
+        self.assertEqual((m['llamadas'], m['reintentos'], m['errores']), (3, 2, 2))
+
+    def test_no_reintenta_post_ni_timeout_de_lectura(self):
+        self.falsa.respuestas = [(503, {}, 0)]
+        self.assertEqual(self.cliente.post('payment/create', data={'a': 1}).status_code, 503)
+
+        self.falsa.respuestas = [(200, {}, 1)]
+        with self.assertRaises(requests.ReadTimeout):
+            self.cliente.post('payment/create', data={'a': 1})
+        self.assertEqual(len(self.falsa.solicitudes), 2)
+        self.assertEqual(metricas_pasarelas()['prueba']['reintentos'], 0)
+
+    def test_conexion_rechazada_get(self):
+        cliente = ClientePasarela('caida', f'http://127.0.0.1:{puerto_cerrado()}', reintentos=1, backoff=0)
+        with self.assertLogs('core.pasarelas', 'WARNING'), self.assertRaises(requests.ConnectionError):
+            cliente.get('estado')
+        self.assertEqual(metricas_pasarelas()['caida']['llamadas'], 2)
+
+
+class PasarelasVistasTests(TestCase):
+    def setUp(self):
+        self.falsa = PasarelaFalsa()
+        self.addCleanup(self.falsa.cerrar)
+        self.usuario = Usuario.objects.create(username='cliente', email='cliente@example.com')
+        self.cliente = Cliente.objects.create(usuario=self.usuario)
+        profesion = Profesion.objects.create(nombre='Gasfitería')
+        trabajador = Trabajador.objects.create(
+            usuario=Usuario.objects.create(username='trabajador'), profesion=profesion,
+        )
+        self.plan = PlanServicio.objects.create(
+            trabajador=trabajador, nombre='Revisión', descripcion='',
+            duracion_estimado=timedelta(hours=1), precio=1000,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        metricas.reiniciar()
+
+    def test_flow_usa_el_cliente_compartido(self):
+        solicitud = Solicitud.objects.create(
+            cliente=self.cliente, servicio=Servicio.objects.create(nombre='Gasfitería', descripcion=''),
+            descripcion='', ubicacion='', latitud=0, longitud=0,
+        )
+        self.falsa.respuestas = [(200, {'url': 'https://flow.test/pago', 'token': 't'}, 0)]
+        with override_settings(FLOW_API_URL=self.falsa.url):
+            res = self.client.post('/api/flow/iniciar-pago/', {'solicitud_id': solicitud.pk, 'monto': 1000})
+        self.assertEqual(res.json(), {'url': 'https://flow.test/pago'})
+        self.assertEqual(self.falsa.solicitudes[0][:2], ('POST', '/payment/create'))
+        self.assertEqual(metricas_pasarelas()['flow']['llamadas'], 1)
+
+    def crear_checkout(self):
+        return self.client.post('/api/stripe/create-checkout-session/', {
+            'plan_id': self.plan.pk, 'fecha': '2030-01-07', 'hora_inicio': '10:00',
+        })
+
+    def test_stripe_usa_el_cliente_compartido(self):
+        self.falsa.respuestas = [(200, {
+            'id': 'cs_1', 'object': 'checkout.session', 'url': 'https://stripe.test/cs_1',
+        }, 0)]
+        with mock.patch.object(stripe, 'api_key', 'sk_test_prueba'), \
+                mock.patch.object(stripe, 'api_base', self.falsa.url):
+            res = self.crear_checkout()
+        self.assertEqual(res.json(), {'url': 'https://stripe.test/cs_1'})
+        self.assertEqual(self.falsa.solicitudes[0][:2], ('POST', '/v1/checkout/sessions'))
+        self.assertEqual(metricas_pasarelas()['stripe']['llamadas'], 1)
+
+    def test_stripe_caido_suelta_la_retencion(self):
+        with mock.patch.object(stripe, 'api_key', 'sk_test_prueba'), \
+                mock.patch.object(stripe, 'api_base', f'http://127.0.0.1:{puerto_cerrado()}'), \
+                mock.patch.object(stripe, 'max_network_retries', 0):
+            res = self.crear_checkout()
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(Reserva.objects.get().estado, 'CANCELADA')
+        self.assertEqual(metricas_pasarelas()['stripe']['errores'], 1)
+
+
+class SembrarPagosMixin:
+    def setUp(self):
+        self.cliente = Cliente.objects.create(usuario=Usuario.objects.create(
+            username='cliente', nombre='Ana', apellido='Pérez',
+        ))
+        self.servicio = Servicio.objects.create(nombre='Gasfitería', descripcion='')
+        self.client = APIClient()
+
+    def pagar(self, trabajador, monto, liberado=False):
+        solicitud = Solicitud.objects.create(
+            cliente=self.cliente, servicio=self.servicio, descripcion='', ubicacion='Providencia',
+            latitud=0, longitud=0, trabajador_asignado=trabajador,
+        )
+        return Pago.objects.create(solicitud=solicitud, monto=monto, liberado=liberado)
+
+    def sembrar(self, cantidad):
+        for i in range(cantidad):
+            trabajador = Trabajador.objects.create(usuario=Usuario.objects.create(
+                username=f'trabajador{Trabajador.objects.count()}', nombre='Juan',
+            ))
+            self.pagar(trabajador, 1000)
+            self.pagar(trabajador, 500 * (i + 1))
+            self.pagar(trabajador, 9999, liberado=True)
+
+
+class PagosPendientesPorTrabajadorTests(SembrarPagosMixin, TestCase):
+    def test_agrupa_con_totales(self):
+        self.sembrar(2)
+        self.pagar(None, 7777)
+        data = self.client.get('/api/pagos/pendientes-por-trabajador/').json()
+
+        self.assertEqual(data['cantidad'], 4)
+        self.assertEqual(data['total'], 3500)
+        primero = data['trabajadores'][0]
+        self.assertEqual((primero['total'], primero['cantidad'], primero['nombre']), (2000, 2, 'Juan'))
+        self.assertEqual([c['monto'] for c in primero['citas_pendientes']], [1000, 1000])
+        self.assertEqual(primero['citas_pendientes'][0]['cliente'], 'Ana Pérez')
+
+    def test_consultas_constantes(self):
+        self.sembrar(2)
+        with CaptureQueriesContext(connection) as con_pocos:
+            self.client.get('/api/pagos/pendientes-por-trabajador/')
+        self.sembrar(6)
+        with CaptureQueriesContext(connection) as con_muchos:
+            res = self.client.get('/api/pagos/pendientes-por-trabajador/')
+        self.assertEqual(len(res.json()['trabajadores']), 8)
+        self.assertEqual(len(con_pocos), 2)
+        self.assertEqual(len(con_muchos), 2)
+
+
+class LiberarPagosTests(SembrarPagosMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(Usuario.objects.create(username='admin', is_staff=True))
+        self.sembrar(3)
+        self.juan = Trabajador.objects.order_by('pk').first()
+
+    def test_libera_todo_el_trabajador_en_un_update(self):
+        with CaptureQueriesContext(connection) as consultas:
+            res = self.client.post('/api/pagos/liberar/', {'trabajador': self.juan.pk}, format='json')
+        self.assertEqual(res.json(), {
+            'total': 1500, 'cantidad': 2,
+            'trabajadores': [{'id': self.juan.pk, 'total': 1500, 'cantidad': 2}],
+        })
+        self.assertEqual(sum(q['sql'].startswith('UPDATE') for q in consultas), 1)
+        self.assertFalse(Pago.objects.filter(solicitud__trabajador_asignado=self.juan, liberado=False).exists())
+        self.assertEqual(Pago.objects.filter(liberado=False).count(), 4)
+
+    def test_lista_de_pagos_y_repeticion(self):
+        ids = list(Pago.objects.filter(liberado=False).values_list('pk', flat=True))
+        data = self.client.post('/api/pagos/liberar/', {'pagos': ids}, format='json').json()
+        self.assertEqual((data['total'], data['cantidad'], len(data['trabajadores'])), (6000, 6, 3))
+
+        # Los ya liberados no se vuelven a liquidar
+        data = self.client.post('/api/pagos/liberar/', {'pagos': ids}, format='json').json()
+        self.assertEqual((data['total'], data['cantidad']), (0, 0))
+
+    def test_requiere_admin_y_datos(self):
+        self.assertEqual(self.client.post('/api/pagos/liberar/', {}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/pagos/liberar/', {'pagos': '12'}, format='json').status_code, 400)
+        self.client.force_authenticate(self.cliente.usuario)
+        res = self.client.post('/api/pagos/liberar/', {'trabajador': self.juan.pk}, format='json')
+        self.assertEqual(res.status_code, 403)
+
+
+RUTA_PANEL = os.path.join(os.path.dirname(settings.BASE_DIR), 'Servimatch_admin')
+
+
+def vistas_panel():
+    """adminpanel.views del proyecto Servimatch_admin, que vive junto a esta API en el repo."""
+    if RUTA_PANEL not in sys.path:
+        sys.path.append(RUTA_PANEL)
+    from adminpanel import views
+    return views
+
+
+@unittest.skipUnless(os.path.isdir(RUTA_PANEL), 'Sin el proyecto Servimatch_admin')
+class PanelAdminContraAPITests(SembrarPagosMixin, LiveServerTestCase):
+    """Las vistas del panel llaman a la API real y tienen que pasar sus permisos de staff."""
+
+    def setUp(self):
+        super().setUp()
+        self.vistas = vistas_panel()
+        Usuario.objects.create_user(username='staff', password='clave-staff', is_staff=True)
+        Usuario.objects.create_user(username='comun', password='clave-comun')
+        self.sembrar(1)
+        self.trabajador = Trabajador.objects.get()
+
+    def panel(self, usuario='staff', clave='clave-staff'):
+        api = self.vistas.ClienteAPI(f'{self.live_server_url}/api', usuario=usuario, clave=clave)
+        self.addCleanup(api._hilos.shutdown)
+        return mock.patch.object(self.vistas, 'api', api)
+
+    def liberar(self):
+        solicitud = RequestFactory().post(
+            '/admin/pagos/liberar/', json.dumps({'trabajador': self.trabajador.pk}),
+            content_type='application/json',
+        )
+        return self.vistas.liberar_pagos(solicitud)
+
+    def test_libera_con_la_credencial_staff(self):
+        with self.panel():
+            res = self.liberar()
+        self.assertEqual(res.status_code, 200, res.content)
+        self.assertEqual(json.loads(res.content)['cantidad'], 2)
+        self.assertFalse(Pago.objects.filter(liberado=False).exists())
+
+        pago = self.pagar(self.trabajador, 300)
+        with self.panel():
+            res = self.vistas.liberar_pago(RequestFactory().patch('/'), pago.pk)
+        self.assertEqual(res.status_code, 200, res.content)
+        pago.refresh_from_db()
+        self.assertTrue(pago.liberado)
+
+    def test_sin_staff_no_libera(self):
+        for usuario, clave in (('comun', 'clave-comun'), ('staff', 'otra'), ('', '')):
+            with self.panel(usuario, clave), self.assertLogs('adminpanel.cliente_api', 'INFO'):
+                self.assertEqual(self.liberar().status_code, 400)
+        self.assertEqual(Pago.objects.filter(liberado=False).count(), 2)
+
+    def test_verifica_trabajador(self):
+        def verificar(estado):
+            solicitud = RequestFactory().patch('/', json.dumps({'estado': estado}), content_type='application/json')
+            return self.vistas.verificar_trabajador(solicitud, self.trabajador.pk)
+
+        with self.panel():
+            self.assertEqual(verificar(True).status_code, 200)
+            self.trabajador.refresh_from_db()
+            self.assertTrue(self.trabajador.estado_verificado)
+            self.assertEqual(verificar(False).status_code, 200)
+        self.trabajador.refresh_from_db()
+        self.assertFalse(self.trabajador.estado_verificado)
+
+        with self.panel('comun', 'clave-comun'), self.assertLogs('adminpanel.cliente_api', 'INFO'):
+            self.assertEqual(verificar(True).status_code, 400)
+        self.trabajador.refresh_from_db()
+        self.assertFalse(self.trabajador.estado_verificado)
+
+    def test_renueva_el_access_vencido(self):
+        with self.panel():
+            self.vistas.api._tokens = {
+                'access': 'vencido', 'refresh': str(RefreshToken.for_user(Usuario.objects.get(username='staff'))),
+            }
+            self.assertEqual(self.liberar().status_code, 200)
+            self.assertNotEqual(self.vistas.api._tokens['access'], 'vencido')
+
+    def test_api_caida_responde_502(self):
+        def json_post(datos):
+            return RequestFactory().post('/', json.dumps(datos), content_type='application/json')
+
+        llamadas = [
+            lambda: self.vistas.liberar_pago(RequestFactory().patch('/'), 1),
+            lambda: self.vistas.liberar_pagos(json_post({'trabajador': self.trabajador.pk})),
+            lambda: self.vistas.responder_feedback(json_post({'respuesta': 'Gracias'}), 1),
+            lambda: self.vistas.verificar_trabajador(
+                RequestFactory().patch('/', json.dumps({'estado': True}), content_type='application/json'),
+                self.trabajador.pk,
+            ),
+        ]
+        with self.panel(), mock.patch.object(self.vistas.api, 'solicitar', side_effect=requests.Timeout):
+            for llamada in llamadas:
+                res = llamada()
+                self.assertEqual((res.status_code, json.loads(res.content)), (502, {'ok': False}))
+
+            # Las plantillas del panel no están en esta API: basta ver qué se renderiza
+            with mock.patch.object(self.vistas, 'render') as render:
+                self.vistas.trabajador_historial(RequestFactory().get('/'), self.trabajador.pk)
+        self.assertEqual(render.call_args.args[2]['data'], [])
+        self.assertEqual(render.call_args.kwargs['status'], 502)
+
+
+class FacetasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        gasfiteria = Profesion.objects.create(nombre='Gasfitería')
+        Profesion.objects.create(nombre='Electricidad')
+        servicio = Servicio.objects.create(nombre='Destape', descripcion='')
+        for i, comuna in enumerate(['Ñuñoa', 'Ñuñoa', 'Providencia', '']):
+            t = Trabajador.objects.create(
+                usuario=Usuario.objects.create(username=f't{i}', direccion=comuna), profesion=gasfiteria,
+            )
+            t.servicios.add(servicio)
+        self.client = APIClient()
+
+    def test_conteos_y_cache(self):
+        with self.assertNumQueries(3):
+            data = self.client.get('/api/facetas/').json()
+        self.assertEqual(data['comunas'], [
+            {'nombre': 'Providencia', 'cantidad': 1}, {'nombre': 'Ñuñoa', 'cantidad': 2},
+        ])
+        self.assertEqual([(p['nombre'], p['trabajadores']) for p in data['profesiones']],
+                         [('Electricidad', 0), ('Gasfitería', 4)])
+        self.assertEqual(data['servicios'][0]['trabajadores'], 4)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/facetas/').json(), data)
+
+    def test_comunas_usan_el_indice(self):
+        plan = Usuario.objects.exclude(direccion='').values('direccion') \
+            .annotate(n=Count('pk')).order_by('direccion').explain()
+        self.assertIn('usuario_direccion_idx', plan)
+
+
+class FiltrosTrabajadorTests(TestCase):
+    def setUp(self):
+        self.gasfiteria = Profesion.objects.create(nombre='Gasfitería')
+        electricidad = Profesion.objects.create(nombre='Electricidad')
+        self.destape = Servicio.objects.create(nombre='Destape', descripcion='')
+        self.cliente = Cliente.objects.create(usuario=Usuario.objects.create(username='cliente'))
+
+        def crear(username, profesion, comuna, puntuaciones, verificado=False, servicio=None):
+            t = Trabajador.objects.create(
+                usuario=Usuario.objects.create(username=username, direccion=comuna),
+                profesion=profesion, estado_verificado=verificado,
+            )
+            if servicio:
+                t.servicios.add(servicio)
+            for p in puntuaciones:
+                Calificacion.objects.create(
+                    cliente=self.cliente, trabajador=t, puntuacion=p,
+                    solicitud=Solicitud.objects.create(
+                        cliente=self.cliente, servicio=self.destape, descripcion='', ubicacion='',
+                        latitud=0, longitud=0, trabajador_asignado=t,
+                    ),
+                )
+            return t
+
+        self.ana = crear('ana', self.gasfiteria, 'Ñuñoa', [5, 4], verificado=True, servicio=self.destape)
+        self.beto = crear('beto', self.gasfiteria, 'Ñuñoa', [3], servicio=self.destape)
+        self.caro = crear('caro', electricidad, 'Providencia', [5], verificado=True)
+        self.client = APIClient()
+
+    def ids(self, **params):
+        res = self.client.get('/api/trabajadores/', params)
+        self.assertEqual(res.status_code, 200, res.content)
+        return {t['id'] for t in res.json()['results']}
+
+    def test_filtros_combinados(self):
+        pks = lambda *ts: {t.pk for t in ts}
+        self.assertEqual(self.ids(profesion=self.gasfiteria.pk), pks(self.ana, self.beto))
+        self.assertEqual(self.ids(servicio=self.destape.pk, comuna='Ñuñoa'), pks(self.ana, self.beto))
+        self.assertEqual(self.ids(rating_min=4), pks(self.ana, self.caro))
+        self.assertEqual(self.ids(rating_min=4, estado_verificado='true', comuna='Ñuñoa'), pks(self.ana))
+        self.assertEqual(self.ids(estado_verificado='false'), pks(self.beto))
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get('/api/trabajadores/', {'rating_min': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/trabajadores/', {'rating_min': 7}).status_code, 400)
+
+    def test_usan_indices(self):
+        self.assertIn('trabajador_rating_idx', Trabajador.objects.filter(rating_promedio__gte=4).explain())
+        self.assertIn('trabajador_pendiente_idx',
+                      Trabajador.objects.filter(estado_verificado=False).explain())
+
+    def test_verificar_solo_staff(self):
+        url = f'/api/trabajadores/{self.beto.pk}/verificar/'
+        self.client.force_authenticate(self.beto.usuario)
+        self.assertEqual(self.client.patch(url, {'estado_verificado': True}, format='json').status_code, 403)
+
+        self.client.force_authenticate(Usuario.objects.create(username='admin', is_staff=True))
+        res = self.client.patch(url, {'estado_verificado': True}, format='json')
+        self.assertEqual(res.status_code, 200, res.content)
+        self.beto.refresh_from_db()
+        self.assertTrue(self.beto.estado_verificado)
+        self.assertEqual(self.ids(estado_verificado='false'), set())
+
+        self.assertEqual(self.client.patch(url, {'estado_verificado': 'x'}, format='json').status_code, 400)
+
+
+class PagosPorFechaTests(SembrarPagosMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.sembrar(2)
+        # Fechas fijas: 1, 10, 20 y 31 de enero (y dos liberados el 15)
+        dias = [1, 10, 20, 31, 15, 15]
+        for pago, dia in zip(Pago.objects.order_by('pk'), dias):
+            Pago.objects.filter(pk=pago.pk).update(fecha_pago=datetime(2030, 1, dia, 23, 30, tzinfo=dt_timezone.utc))
+
+    def test_ventana_inclusive_con_totales(self):
+        data = self.client.get('/api/pagos/', {'desde': '2030-01-10', 'hasta': '2030-01-20'}).json()
+        fechas = [p['fecha_pago'][:10] for p in data['results']]
+        self.assertEqual(fechas, ['2030-01-20', '2030-01-15', '2030-01-15', '2030-01-10'])
+        self.assertEqual(data['totales'], {'total': 21498, 'pendiente': 1500, 'cantidad': 4})
+
+    def test_totales_cubren_toda_la_ventana(self):
+        data = self.client.get('/api/pagos/', {'desde': '2030-01-01', 'page_size': 2}).json()
+        self.assertEqual(len(data['results']), 2)
+        self.assertEqual(data['totales']['cantidad'], 6)
+        self.assertNotIn('totales', self.client.get('/api/pagos/').json())
+
+    def test_fecha_invalida(self):
+        self.assertEqual(self.client.get('/api/pagos/', {'desde': '2030-13-01'}).status_code, 400)
+
+    def test_rango_por_indice(self):
+        qs = Pago.objects.filter(
+            fecha_pago__gte=datetime(2030, 1, 10, tzinfo=dt_timezone.utc),
+            fecha_pago__lt=datetime(2030, 1, 21, tzinfo=dt_timezone.utc),
+        )
+        self.assertIn('pago_fecha_idx', qs.order_by('-fecha_pago', '-pk').explain())
+        # Los totales leen monto y liberado desde el mismo índice
+        self.assertIn('COVERING INDEX pago_fecha_idx', qs.values_list('monto', 'liberado').explain())
+
+
+class PaginacionTests(TestCase):
+    def setUp(self):
+        self.servicios = [
+            Servicio.objects.create(nombre=f'Servicio {i}', descripcion='') for i in range(5)
+        ]
+        self.client = APIClient()
+
+    def test_recorre_todas_las_paginas_por_cursor(self):
+        vistos = []
+        url, params = '/api/servicios/', {'page_size': 2}
+        while url:
+            res = self.client.get(url, params)
+            self.assertEqual(res.status_code, 200)
+            data = res.json()
+            self.assertLessEqual(len(data['results']), 2)
+            vistos += [s['id'] for s in data['results']]
+            url, params = data['next'], None
+        self.assertEqual(vistos, sorted((s.id for s in self.servicios), reverse=True))
+
+    def test_page_size_tiene_tope(self):
+        with mock.patch.object(PaginacionCursor, 'max_page_size', 3):
+            res = self.client.get('/api/servicios/', {'page_size': 100})
+        self.assertEqual(len(res.json()['results']), 3)
+        self.assertIsNotNone(res.json()['next'])
+
+    def test_solicitudes_del_cliente_por_paginas(self):
+        # La pantalla de solicitudes de la app recorre `next` sobre su propio listado
+        propio = Cliente.objects.create(usuario=Usuario.objects.create(username='cliente'))
+        ajeno = Cliente.objects.create(usuario=Usuario.objects.create(username='otro'))
+        for cliente, cantidad in ((propio, 5), (ajeno, 3)):
+            for _ in range(cantidad):
+                Solicitud.objects.create(cliente=cliente, servicio=self.servicios[0], descripcion='', ubicacion='')
+        self.client.force_authenticate(propio.usuario)
+
+        vistos, url, params = [], '/api/solicitudes/', {'page_size': 2}
+        while url:
+            data = self.client.get(url, params).json()
+            vistos += [s['id'] for s in data['results']]
+            url, params = data['next'], None
+        self.assertEqual(sorted(vistos), sorted(propio.solicitudes.values_list('pk', flat=True)))
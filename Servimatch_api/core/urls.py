@@ -42,11 +42,14 @@ urlpatterns = [
     path('stripe/create-checkout-session/', CreateCheckoutSessionView.as_view(), name='create-checkout-session'),
     path('stripe/success/', StripeRedirectView.as_view(), name='stripe-redirect-success'),
     path('stripe/cancel/', StripeCancelRedirectView.as_view(), name='stripe-redirect-cancel'),
+    path('stripe/webhook/', views.stripe_webhook, name='stripe-webhook'),
     path('usuarios/register/', UsuarioViewSet.as_view({'post': 'register'}), name='usuario-register'),
     path('solicitudes/<int:pk>/aceptar/', views.SolicitudViewSet.as_view({'post': 'aceptar'}), name='solicitud-aceptar'),
     path('trabajadores-cercanos/', views.trabajadores_cercanos, name='trabajadores-cercanos'),
     path('usuarios/actualizar-perfil/', views.ActualizarPerfilView.as_view(), name='actualizar-perfil'),
     path('ranking/trabajadores/', views.top_trabajadores, name='top-trabajadores'),
+    path('facetas/', views.facetas_view, name='facetas'),
+    path('chats/<int:chat_id>/stream/', views.stream_mensajes, name='chat-stream'),
     path('', include(router.urls)),
 ]
 
@@ -1,11 +1,9 @@
 from rest_framework import viewsets, permissions, generics, status
 from rest_framework.response import Response
-from django.db.models import Q
-from django.db.models import Avg
+from django.db.models import Count, Exists, OuterRef, Q, Sum
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action, api_view
-from math import radians, sin, cos, sqrt, atan2
 from django.shortcuts import get_object_or_404
 from rest_framework_simplejwt.tokens import RefreshToken
 from .models import *
@@ -16,8 +14,7 @@ from django.db import IntegrityError
 from django.shortcuts import redirect
 from django.views import View
 from django.http import HttpResponse
-import math
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.permissions import AllowAny
 from rest_framework.decorators import api_view, permission_classes
 from django.contrib.auth import get_user_model
@@ -27,14 +24,61 @@ import json  # ← asegúrate de tenerlo al inicio del archivo
 
 
 
-from geopy.geocoders import Nominatim
+from .geo import leer_radio, filtrar_cercanos
+from .directorio import directorio
+from .geocodificacion import geocodificar_solicitud
+from .tareas import encolar
+from .pubsub import SuscripcionDesbordada, canal_chat, obtener_pubsub
+from .ingesta import ingesta, ingesta_activa
+from .facetas import facetas
+from .filtros import PagoFiltro, TrabajadorFiltro
+from .pagination import PaginacionPorFechaPago
+from .pagos import liberar_pagos
+from .reservas import ReservaEnConflicto, reprogramar, reservar, vencimiento_retencion, vigentes
+from .webhooks import procesar_evento_stripe, registrar_evento_stripe
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .agenda import (
+    SLOTS_PASO_MINUTOS, SLOTS_RANGO_MAXIMO_DIAS, calcular_slots, franjas_guardadas, leer_dia_semana, leer_hora,
+)
+
+import time
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
 
 #Para pasarela de pago
+import hashlib
+import hmac
+import requests
 import stripe
+from .pasarelas import cliente_flow, configurar_stripe
 from django.conf import settings
 from datetime import datetime, timedelta
+from django.utils import timezone
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
+configurar_stripe()
+
+RANKING_LIMITE = 10
+RANKING_LIMITE_MAXIMO = 100
+MENSAJES_LIMITE = 50
+MENSAJES_LIMITE_MAXIMO = 200
+SSE_LATIDO = getattr(settings, 'SSE_LATIDO', 15)
+SSE_DURACION_MAXIMA = getattr(settings, 'SSE_DURACION_MAXIMA', 300)
+
+class ExpansionMixin:
+    """Precarga solo las relaciones que se van a serializar (ver ?expand= y ?fields=)."""
+
+    def get_queryset(self):
+        serializer_class = self.get_serializer_class()
+        return serializer_class.optimizar_queryset(
+            super().get_queryset(),
+            expandir=relaciones_solicitadas(self.request, serializer_class),
+        )
+
 
 class UsuarioViewSet(viewsets.ModelViewSet):
     queryset = Usuario.objects.all()
@@ -143,23 +187,59 @@ class ProfesionViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Profesion.objects.all()
     serializer_class = ProfesionSerializer
 
-class ClienteViewSet(viewsets.ModelViewSet):
+class ClienteViewSet(ExpansionMixin, viewsets.ModelViewSet):
     queryset = Cliente.objects.all()
     serializer_class = ClienteSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
-class TrabajadorViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset         = Trabajador.objects.select_related('usuario', 'profesion').all()
+class TrabajadorViewSet(ExpansionMixin, viewsets.ReadOnlyModelViewSet):
+    queryset         = Trabajador.objects.all()
     serializer_class = TrabajadorSerializer
     filter_backends  = [DjangoFilterBackend]
-    filterset_fields = ['profesion']    # ahora filtra por ?profesion=<id>
+    filterset_class  = TrabajadorFiltro   # ?profesion, ?servicio, ?comuna, ?rating_min, ?estado_verificado
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+
+        # ?disponible_dia=<0-6 | lunes..domingo>&disponible_hora=HH:MM, resuelto en SQL
+        dia = self.request.query_params.get('disponible_dia')
+        hora = self.request.query_params.get('disponible_hora')
+        if dia is None and hora is None:
+            return qs
+
+        franjas = DisponibilidadTrabajador.objects.filter(trabajador=OuterRef('pk'))
+        if dia is not None:
+            dia_semana = leer_dia_semana(dia)
+            if dia_semana is None:
+                raise ValidationError({'disponible_dia': 'Usa 0-6 (0 = lunes) o el nombre del día.'})
+            franjas = franjas.filter(dia_semana=dia_semana)
+        if hora is not None:
+            hora = leer_hora(hora)
+            if hora is None:
+                raise ValidationError({'disponible_hora': 'Usa el formato HH:MM.'})
+            franjas = franjas.filter(inicio__lte=hora, fin__gt=hora)
+        return qs.filter(Exists(franjas))
+
+    @action(detail=True, methods=['patch'], permission_classes=[permissions.IsAdminUser])
+    def verificar(self, request, pk=None):
+        """
+        PATCH /api/trabajadores/{pk}/verificar/  {"estado_verificado": true|false}
+        Solo staff. Sin cuerpo marca al trabajador como verificado.
+        """
+        trabajador = self.get_object()
+        estado = request.data.get('estado_verificado', True)
+        if not isinstance(estado, bool):
+            raise ValidationError({'estado_verificado': 'Debe ser true o false.'})
+        trabajador.estado_verificado = estado
+        trabajador.save(update_fields=['estado_verificado'])
+        return Response(self.get_serializer(trabajador).data)
 
 class ServicioViewSet(viewsets.ModelViewSet):
     queryset = Servicio.objects.all()
     serializer_class = ServicioSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
-class SolicitudViewSet(viewsets.ModelViewSet):
+class SolicitudViewSet(ExpansionMixin, viewsets.ModelViewSet):
     queryset = Solicitud.objects.all()
     serializer_class = SolicitudSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
@@ -171,24 +251,19 @@ class SolicitudViewSet(viewsets.ModelViewSet):
                 cliente = self.request.user.cliente_profile
             except:
                 return Solicitud.objects.none()
-            return Solicitud.objects.filter(cliente=cliente)
+            return super().get_queryset().filter(cliente=cliente)
         return super().get_queryset()
 
     def perform_create(self, serializer):
-        # Geocodifica la ubicación y guarda coordenadas junto al cliente
-        datos = serializer.validated_data
-        ubic = datos.get('ubicacion')
-        geolocator = Nominatim(user_agent="servimatch")
-        lat, lng = None, None
-        if ubic:
-            loc = geolocator.geocode(ubic)
-            if loc:
-                lat, lng = loc.latitude, loc.longitude
-        serializer.save(
+        # Se guarda de inmediato; las coordenadas se calculan en segundo plano
+        # y mientras tanto la solicitud no aparece en /cercanas/
+        solicitud = serializer.save(
             cliente=self.request.user.cliente_profile,
-            latitud=lat,
-            longitud=lng
+            latitud=None,
+            longitud=None,
+            estado_geocodificacion='pendiente'
         )
+        encolar(geocodificar_solicitud, solicitud.pk)
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def aceptar(self, request, pk=None):
@@ -241,38 +316,131 @@ class SolicitudViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     def cercanas(self, request):
         """
-        GET /api/solicitudes/cercanas/?lat={lat}&lng={lng}
-        Retorna solicitudes dentro de 10 km.
+        GET /api/solicitudes/cercanas/?lat={lat}&lng={lng}[&radius={km}]
+        Retorna solicitudes dentro del radio (10 km por defecto), ordenadas por distancia.
+        Las que aún esperan geocodificación (latitud NULL) quedan fuera.
         """
         try:
             lat = float(request.query_params['lat'])
             lng = float(request.query_params['lng'])
+            radio = leer_radio(request.query_params.get('radius'))
         except (KeyError, ValueError):
             return Response({'detail': 'Parámetros lat y lng requeridos'}, status=status.HTTP_400_BAD_REQUEST)
 
-        def haversine(lat1, lon1, lat2, lon2):
-            R = 6371
-            dlat = math.radians(lat2 - lat1)
-            dlon = math.radians(lon2 - lon1)
-            a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) \
-                * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
-            c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-            return R * c
-
-        qs = Solicitud.objects.filter(latitud__isnull=False, longitud__isnull=False)
-        cercanas = [s for s in qs if haversine(lat, lng, s.latitud, s.longitud) <= 10]
+        cercanas = filtrar_cercanos(self.get_queryset(), lat, lng, radio)
 
-        serializer = self.get_serializer(cercanas, many=True)
-        return Response(serializer.data)
+        serializer = self.get_serializer([s for s, _ in cercanas], many=True)
+        data = serializer.data
+        for item, (_, distancia) in zip(data, cercanas):
+            item['distancia'] = round(distancia, 2)
+        return Response(data)
 
 
-class PagoViewSet(viewsets.ModelViewSet):
+class PagoViewSet(ExpansionMixin, viewsets.ModelViewSet):
     queryset = Pago.objects.all()
     serializer_class = PagoSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = PagoFiltro          # ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD
+    pagination_class = PaginacionPorFechaPago
+
+    def list(self, request, *args, **kwargs):
+        """
+        Con ?desde= o ?hasta= agrega "totales" de toda la ventana (no solo de
+        la página): {"total", "pendiente", "cantidad"}, en una agregación más.
+        """
+        respuesta = super().list(request, *args, **kwargs)
+        if 'desde' in request.query_params or 'hasta' in request.query_params:
+            totales = self.filter_queryset(Pago.objects.all()).aggregate(
+                total=Sum('monto'),
+                pendiente=Sum('monto', filter=Q(liberado=False)),
+                cantidad=Count('pk'),
+            )
+            respuesta.data['totales'] = {k: v or 0 for k, v in totales.items()}
+        return respuesta
 
+    @action(detail=False, methods=['get'], url_path='pendientes-por-trabajador')
+    def pendientes_por_trabajador(self, request):
+        """
+        GET /api/pagos/pendientes-por-trabajador/
+        Pagos sin liberar agrupados por trabajador asignado, con el total y la
+        cantidad de cada uno (una agregación en SQL) y el detalle de cada pago
+        (una consulta más). Reemplaza recorrer /pagos/ o /reservas/ por trabajador.
+        """
+        pendientes = Pago.objects.filter(liberado=False, solicitud__trabajador_asignado__isnull=False)
+        grupos = (
+            pendientes
+            .values(
+                'solicitud__trabajador_asignado',
+                'solicitud__trabajador_asignado__usuario__nombre',
+                'solicitud__trabajador_asignado__usuario__apellido',
+            )
+            .annotate(total=Sum('monto'), cantidad=Count('id'))
+            .order_by('-total', 'solicitud__trabajador_asignado')
+        )
+        trabajadores = {
+            g['solicitud__trabajador_asignado']: {
+                'id': g['solicitud__trabajador_asignado'],
+                'nombre': g['solicitud__trabajador_asignado__usuario__nombre'],
+                'apellido': g['solicitud__trabajador_asignado__usuario__apellido'],
+                'total': g['total'],
+                'cantidad': g['cantidad'],
+                'citas_pendientes': [],
+            }
+            for g in grupos
+        }
+        detalle = pendientes.order_by('fecha_pago', 'id').values(
+            'id', 'monto', 'fecha_pago', 'solicitud_id', 'solicitud__trabajador_asignado',
+            'solicitud__servicio__nombre', 'solicitud__ubicacion', 'solicitud__fecha_preferida',
+            'solicitud__cliente__usuario__nombre', 'solicitud__cliente__usuario__apellido',
+        )
+        for p in detalle:
+            trabajador = trabajadores.get(p['solicitud__trabajador_asignado'])
+            if trabajador is None:
+                # Pago creado entre las dos consultas; aparecerá en la próxima
+                continue
+            trabajador['citas_pendientes'].append({
+                'pago_id': p['id'],
+                'monto': p['monto'],
+                'fecha_pago': p['fecha_pago'],
+                'solicitud_id': p['solicitud_id'],
+                'servicio': p['solicitud__servicio__nombre'],
+                'ubicacion': p['solicitud__ubicacion'],
+                'fecha_preferida': p['solicitud__fecha_preferida'],
+                'cliente': ' '.join(filter(None, [
+                    p['solicitud__cliente__usuario__nombre'], p['solicitud__cliente__usuario__apellido'],
+                ])),
+            })
+        return Response({
+            'total': sum((t['total'] for t in trabajadores.values()), 0),
+            'cantidad': sum(t['cantidad'] for t in trabajadores.values()),
+            'trabajadores': list(trabajadores.values()),
+        })
 
-class CalificacionViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def liberar(self, request):
+        """
+        POST /api/pagos/liberar/  {"trabajador": id} o {"pagos": [id, ...]}
+        Libera en una transacción todos los pagos pendientes indicados y
+        retorna lo liquidado por trabajador (ver core.pagos.liberar_pagos).
+        """
+        pago_ids = request.data.get('pagos')
+        trabajador_id = request.data.get('trabajador')
+        if pago_ids is None and trabajador_id is None:
+            raise ValidationError('Indica "pagos" o "trabajador".')
+        try:
+            if pago_ids is not None:
+                if not isinstance(pago_ids, list):
+                    raise TypeError
+                pago_ids = [int(pk) for pk in pago_ids]
+            if trabajador_id is not None:
+                trabajador_id = int(trabajador_id)
+        except (TypeError, ValueError):
+            raise ValidationError('"pagos" debe ser una lista de ids y "trabajador" un id.')
+        return Response(liberar_pagos(pago_ids=pago_ids, trabajador_id=trabajador_id))
+
+
+class CalificacionViewSet(ExpansionMixin, viewsets.ModelViewSet):
     queryset = Calificacion.objects.all()
     serializer_class = CalificacionSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
@@ -306,65 +474,65 @@ class EtiquetaViewSet(viewsets.ModelViewSet):
     serializer_class = EtiquetaSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
-class EtiquetaCalificacionViewSet(viewsets.ModelViewSet):
+class EtiquetaCalificacionViewSet(ExpansionMixin, viewsets.ModelViewSet):
     queryset = EtiquetaCalificacion.objects.all()
     serializer_class = EtiquetaCalificacionSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
 ######################PARA USAR LA API DE GOOGLE MAPS################################
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371  # Radio de la Tierra en km
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    return R * c
-
 @api_view(['GET'])
 def trabajadores_cercanos(request):
-    lat = float(request.GET.get('lat'))
-    lon = float(request.GET.get('lon'))
-    servicio_id = request.GET.get('servicio_id')
-
-    trabajadores = Trabajador.objects.filter(
-        latitud__isnull=False, longitud__isnull=False,
-        servicios=servicio_id
-    )
-
-    resultado = []
-    for t in trabajadores:
-        distancia = haversine(lat, lon, t.latitud, t.longitud)
-        if distancia <= 10:  # Dentro de 10 km
-            data = TrabajadorSerializer(t).data
-            data['distancia'] = round(distancia, 2)
-            resultado.append(data)
+    """
+    GET /api/trabajadores-cercanos/?lat={lat}&lon={lon}&servicio_id={id}[&radius={km}]
+    Trabajadores del servicio dentro del radio, ordenados por distancia.
+    """
+    try:
+        lat = float(request.GET['lat'])
+        lon = float(request.GET['lon'])
+        radio = leer_radio(request.GET.get('radius'))
+    except (KeyError, ValueError):
+        return Response({'detail': 'Parámetros lat y lon requeridos'}, status=status.HTTP_400_BAD_REQUEST)
+    servicio_id = request.GET.get('servicio_id') or None
+    if servicio_id is not None and not servicio_id.isdigit():
+        return Response({'detail': 'servicio_id inválido'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Distancia y servicio se resuelven en memoria; solo se consultan los que calzan
+    cercanos = directorio.buscar(lat, lon, radio, servicio_id)
+    distancias = dict(cercanos)
+    trabajadores = TrabajadorSerializer.optimizar_queryset(Trabajador.objects.all()) \
+        .in_bulk(list(distancias))
+    ordenados = [trabajadores[pk] for pk, _ in cercanos if pk in trabajadores]
+
+    resultado = TrabajadorSerializer(ordenados, many=True).data
+    for data, t in zip(resultado, ordenados):
+        data['distancia'] = round(distancias[t.pk], 2)
 
     return Response(resultado)
 
-class PlanServicioViewSet(viewsets.ModelViewSet):
+class PlanServicioViewSet(ExpansionMixin, viewsets.ModelViewSet):
     queryset = PlanServicio.objects.all()
     serializer_class = PlanServicioSerializer
     permission_classes = [AllowAny]
 
     def get_queryset(self):
-        # Si es solicitud de detalle (retrieve), no filtrar
-        if self.action == 'retrieve':
-            return PlanServicio.objects.all()
+        qs = super().get_queryset()
+
+        # Si es solicitud de detalle (retrieve o sus horarios), no filtrar
+        if self.action in ('retrieve', 'slots'):
+            return qs
 
         # Si es solicitud de lista, aplicar filtros
         trabajador_id = self.request.query_params.get('trabajador')
 
         if trabajador_id:
-            try:
-                trabajador = Trabajador.objects.get(pk=trabajador_id)
-                return PlanServicio.objects.filter(trabajador=trabajador)
-            except Trabajador.DoesNotExist:
-                return PlanServicio.objects.none()
+            if not trabajador_id.isdigit():
+                return qs.none()
+            return qs.filter(trabajador_id=trabajador_id)
 
         if hasattr(self.request.user, 'trabajador_profile'):
-            return PlanServicio.objects.filter(trabajador=self.request.user.trabajador_profile)
+            return qs.filter(trabajador=self.request.user.trabajador_profile)
 
-        return PlanServicio.objects.none()
+        return qs.none()
 
     def perform_create(self, serializer):
         if hasattr(self.request.user, 'trabajador_profile'):
@@ -380,7 +548,51 @@ class PlanServicioViewSet(viewsets.ModelViewSet):
         
         serializer.save(trabajador=trabajador)
 
+    # GET /api/planes/<id>/slots/?desde=YYYY-MM-DD&hasta=YYYY-MM-DD[&paso=<minutos>]
+    # Horarios reservables del rango en tres consultas: el plan, su disponibilidad
+    # y las reservas vigentes de todos los planes del trabajador en esas fechas.
+    @action(detail=True, methods=['get'])
+    def slots(self, request, pk=None):
+        plan = get_object_or_404(
+            PlanServicio.objects.select_related('trabajador').prefetch_related('trabajador__disponibilidades'),
+            pk=pk,
+        )
 
+        hoy = timezone.localdate()
+        try:
+            desde = datetime.strptime(request.GET['desde'], '%Y-%m-%d').date() if 'desde' in request.GET else hoy
+            hasta = datetime.strptime(request.GET['hasta'], '%Y-%m-%d').date() if 'hasta' in request.GET else desde + timedelta(days=6)
+            paso = int(request.GET.get('paso', SLOTS_PASO_MINUTOS))
+        except ValueError:
+            return Response({'error': 'desde/hasta deben ser YYYY-MM-DD y paso un entero'}, status=400)
+        if hasta < desde or (hasta - desde).days >= SLOTS_RANGO_MAXIMO_DIAS:
+            return Response({'error': f'El rango debe tener entre 1 y {SLOTS_RANGO_MAXIMO_DIAS} días'}, status=400)
+        if paso <= 0:
+            return Response({'error': 'paso debe ser positivo'}, status=400)
+
+        ocupados = {}
+        reservas = vigentes().filter(
+            trabajador_id=plan.trabajador_id, fecha__range=(desde, hasta),
+        ).values_list('fecha', 'hora_inicio', 'hora_fin')
+        for fecha, inicio, fin in reservas:
+            ocupados.setdefault(fecha, []).append((inicio, fin))
+
+        slots = calcular_slots(
+            franjas_guardadas(plan.trabajador), plan.duracion_estimado,
+            ocupados, desde, hasta, paso=paso, ahora=timezone.localtime(),
+        )
+        return Response({
+            'plan': plan.id,
+            'desde': desde,
+            'hasta': hasta,
+            'slots': {
+                fecha.isoformat(): [
+                    {'hora_inicio': i.strftime('%H:%M'), 'hora_fin': f.strftime('%H:%M')}
+                    for i, f in horarios
+                ]
+                for fecha, horarios in slots.items()
+            },
+        })
 
         
 class ReservaViewSet(viewsets.ModelViewSet):
@@ -400,8 +612,37 @@ class ReservaViewSet(viewsets.ModelViewSet):
         return qs
 
     def perform_create(self, serializer):
-        # asigna trabajador logueado
-        serializer.save(trabajador=self.request.user.trabajador_profile)
+        # Solo el trabajador dueño del plan bloquea horario directamente (los
+        # clientes reservan pagando, vía CreateCheckoutSessionView); se
+        # rechazan los choques con sus otras reservas
+        datos = serializer.validated_data
+        trabajador = getattr(self.request.user, 'trabajador_profile', None)
+        if trabajador is None or datos['plan'].trabajador_id != trabajador.pk:
+            raise PermissionDenied('Solo el trabajador dueño del plan puede reservar directamente.')
+        try:
+            serializer.instance = reservar(
+                datos['plan'], datos['fecha'], datos['hora_inicio'], datos['hora_fin'],
+            )
+        except (ReservaEnConflicto, ValueError) as e:
+            raise ValidationError({'hora_inicio': str(e)})
+
+    def perform_update(self, serializer):
+        # Mover una reserva pasa por la misma verificación de choques que crearla
+        reserva = serializer.instance
+        datos = serializer.validated_data
+        plan = datos.get('plan', reserva.plan)
+        trabajador = getattr(self.request.user, 'trabajador_profile', None)
+        if trabajador is None or trabajador.pk != plan.trabajador_id or trabajador.pk != reserva.plan.trabajador_id:
+            raise PermissionDenied('Solo el trabajador dueño del plan puede modificar la reserva.')
+        try:
+            serializer.instance = reprogramar(
+                reserva, plan,
+                datos.get('fecha', reserva.fecha),
+                datos.get('hora_inicio', reserva.hora_inicio),
+                datos.get('hora_fin', reserva.hora_fin),
+            )
+        except (ReservaEnConflicto, ValueError) as e:
+            raise ValidationError({'hora_inicio': str(e)})
 
 
 # views.py
@@ -421,15 +662,6 @@ class CreateCheckoutSessionView(APIView):
 
             fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date()
             hora_inicio = datetime.strptime(hora_inicio_str, '%H:%M').time()
-            dt_inicio = datetime.combine(fecha, hora_inicio)
-            dt_fin = dt_inicio + plan.duracion_estimado
-            hora_fin = dt_fin.time()
-
-            if Reserva.objects.filter(plan=plan, fecha=fecha, hora_inicio=hora_inicio).exists():
-                return Response(
-                    {'error': 'Esa franja ya está reservada. Elige otra.'},
-                    status=status.HTTP_409_CONFLICT
-                )
 
             # Validar si el usuario tiene perfil cliente
             try:
@@ -437,30 +669,39 @@ class CreateCheckoutSessionView(APIView):
             except:
                 return Response({'error': 'Usuario no tiene perfil de cliente.'}, status=403)
 
-            reserva = Reserva.objects.create(
-                cliente=cliente,
-                plan=plan,
-                fecha=fecha,
-                hora_inicio=hora_inicio,
-                hora_fin=hora_fin,
-                estado='PENDIENTE'
-            )
+            # Verifica choques con todas las reservas del trabajador y crea en la misma transacción
+            try:
+                reserva = reservar(
+                    plan, fecha, hora_inicio,
+                    cliente=cliente, estado='PENDIENTE', expira_en=vencimiento_retencion(),
+                )
+            except ReservaEnConflicto as e:
+                return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            session = stripe.checkout.Session.create(
-                payment_method_types=['card'],
-                line_items=[{
-                    'price_data': {
-                        'currency': 'clp',
-                        'product_data': {'name': plan.nombre},
-                        'unit_amount': int(plan.precio * 100),
-                    },
-                    'quantity': 1,
-                }],
-                mode='payment',
-                success_url=request.build_absolute_uri("/api/stripe/success/"),
-                cancel_url=request.build_absolute_uri("/api/stripe/cancel/"),
-                metadata={'reserva_id': reserva.id},
-            )
+            # Con timeout y reintentos acotados (ver core.pasarelas); si Stripe no
+            # responde se suelta la retención en vez de bloquear el horario 15 minutos
+            try:
+                session = stripe.checkout.Session.create(
+                    payment_method_types=['card'],
+                    line_items=[{
+                        'price_data': {
+                            'currency': 'clp',
+                            'product_data': {'name': plan.nombre},
+                            'unit_amount': int(plan.precio * 100),
+                        },
+                        'quantity': 1,
+                    }],
+                    mode='payment',
+                    success_url=request.build_absolute_uri("/api/stripe/success/"),
+                    cancel_url=request.build_absolute_uri("/api/stripe/cancel/"),
+                    metadata={'reserva_id': reserva.id},
+                )
+            except stripe.APIConnectionError:
+                Reserva.objects.filter(pk=reserva.pk).update(estado='CANCELADA')
+                return Response({'error': 'Stripe no respondió, intenta nuevamente'},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
             return Response({'url': session.url})
 
@@ -470,6 +711,30 @@ class CreateCheckoutSessionView(APIView):
 
 
 
+# POST /api/stripe/webhook/
+# Verifica la firma con STRIPE_WEBHOOK_SECRET, registra el evento y responde
+# de inmediato; la reserva se actualiza en segundo plano (ver core.webhooks).
+@csrf_exempt
+@require_POST
+def stripe_webhook(request):
+    secreto = getattr(settings, 'STRIPE_WEBHOOK_SECRET', None)
+    if not secreto:
+        return HttpResponse('STRIPE_WEBHOOK_SECRET no configurado', status=503)
+
+    payload = request.body.decode('utf-8')
+    try:
+        stripe.WebhookSignature.verify_header(payload, request.headers.get('Stripe-Signature', ''), secreto)
+        evento = json.loads(payload)
+    except (stripe.SignatureVerificationError, ValueError):
+        return HttpResponse('Firma o evento inválido', status=400)
+    if not isinstance(evento, dict) or not {'id', 'type', 'data'} <= evento.keys():
+        return HttpResponse('Evento inválido', status=400)
+
+    if registrar_evento_stripe(evento):
+        encolar(procesar_evento_stripe, evento['id'])
+    return HttpResponse(status=200)
+
+
 class StripeRedirectView(View):
     """
     Recibe el session_id y devuelve un 302 manual al deep link exitoso.
@@ -495,16 +760,45 @@ class StripeCancelRedirectView(View):
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def top_trabajadores(request):
-    print(">> Entrando al endpoint de ranking")
-    trabajadores = Trabajador.objects.annotate(
-        rating_promedio=Avg('calificaciones_recibidas__puntuacion')
-    ).order_by('-rating_promedio')[:10]
-    serializer = TrabajadorSerializer(trabajadores, many=True)
-    return Response(serializer.data)
+    """
+    GET /api/ranking/trabajadores/[?profesion={id}|?servicio={id}][&limit={n}]
+    Top-N por puntaje bayesiano, leído de RankingTrabajador.
+    """
+    try:
+        limite = min(int(request.GET.get('limit', RANKING_LIMITE)), RANKING_LIMITE_MAXIMO)
+        if limite <= 0:
+            raise ValueError
+        segmento, segmento_id = 'global', 0
+        if request.GET.get('profesion'):
+            segmento, segmento_id = 'profesion', int(request.GET['profesion'])
+        elif request.GET.get('servicio'):
+            segmento, segmento_id = 'servicio', int(request.GET['servicio'])
+    except ValueError:
+        return Response({'detail': 'Parámetros inválidos'}, status=status.HTTP_400_BAD_REQUEST)
+
+    ranking = list(TrabajadorSerializer.optimizar_queryset(
+        RankingTrabajador.objects.filter(segmento=segmento, segmento_id=segmento_id),
+        'trabajador__',
+    ).order_by('-puntaje', 'trabajador_id')[:limite])
+    data = TrabajadorSerializer([r.trabajador for r in ranking], many=True).data
+    for item, r in zip(data, ranking):
+        item['puntaje'] = round(r.puntaje, 3)
+    return Response(data)
 
 
 
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def facetas_view(request):
+    """
+    GET /api/facetas/
+    Comunas, profesiones y servicios distintos con sus conteos, para armar
+    los filtros sin descargar los listados completos (ver core.facetas).
+    """
+    return Response(facetas())
+
+
 class GaleriaTrabajadorViewSet(viewsets.ModelViewSet):
     queryset = FotoTrabajador.objects.all()
     serializer_class = FotoTrabajadorSerializer
@@ -516,45 +810,201 @@ class GaleriaTrabajadorViewSet(viewsets.ModelViewSet):
             raise ValidationError("Solo los trabajadores pueden subir imágenes.")
         serializer.save(trabajador=self.request.user.trabajador_profile)
 
+from django.db.models import Case, Count, F, Max, OuterRef, Subquery, When
+from django.db.models.functions import Coalesce, Greatest
 from .models import Chat, Mensaje
-from .serializers import ChatSerializer, MensajeSerializer
+from .serializers import ChatSerializer, ChatBandejaSerializer, MensajeSerializer
 class ChatViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
-    # GET /api/chats/<id_trabajador>/
-    def retrieve(self, request, pk=None):
+    # GET /api/chats/
+    # Bandeja del usuario: contraparte, último mensaje y no leídos en una sola consulta
+    def list(self, request):
         usuario = request.user
-        trabajador_id = pk
+        mensajes = Mensaje.objects.filter(chat=OuterRef('pk')).order_by('-id')
+        no_leidos = Mensaje.objects.filter(chat=OuterRef('pk'), id__gt=OuterRef('marcador')) \
+            .exclude(remitente=usuario).order_by().values('chat').annotate(n=Count('id')).values('n')
+
+        chats = ChatSerializer.optimizar_queryset(Chat.objects.all()) \
+            .filter(Q(cliente=usuario) | Q(trabajador=usuario)) \
+            .annotate(
+                marcador=Case(
+                    When(cliente=usuario, then=F('ultimo_leido_cliente')),
+                    default=F('ultimo_leido_trabajador'),
+                ),
+                ultimo_id=Subquery(mensajes.values('id')[:1]),
+                ultimo_contenido=Subquery(mensajes.values('contenido')[:1]),
+                ultimo_enviado=Subquery(mensajes.values('enviado')[:1]),
+                ultimo_remitente_id=Subquery(mensajes.values('remitente_id')[:1]),
+                no_leidos=Coalesce(Subquery(no_leidos), 0),
+            ) \
+            .order_by(F('ultimo_id').desc(nulls_last=True), '-id')
+
+        serializer = ChatBandejaSerializer(chats, many=True, context={'request': request})
+        return Response(serializer.data)
 
-        chat = Chat.objects.filter(cliente=usuario, trabajador_id=trabajador_id).first()
-        if not chat:
-            chat = Chat.objects.create(cliente=usuario, trabajador_id=trabajador_id)
+    # GET /api/chats/<id_trabajador>/
+    def retrieve(self, request, pk=None):
+        # La restricción única (cliente, trabajador) hace atómico el get_or_create:
+        # dos aperturas simultáneas terminan en el mismo chat
+        chat, _ = ChatSerializer.optimizar_queryset(Chat.objects.all()) \
+            .get_or_create(cliente=request.user, trabajador_id=pk)
 
         serializer = ChatSerializer(chat)
         return Response(serializer.data)
 
-    # GET /api/chats/<chat_id>/mensajes/
+    # POST /api/chats/<chat_id>/leido/  {"mensaje_id": <id>}  (por defecto, el último)
+    @action(detail=True, methods=['post'])
+    def leido(self, request, pk=None):
+        chat = get_object_or_404(Chat.objects.filter(Q(cliente=request.user) | Q(trabajador=request.user)), pk=pk)
+        campo = 'ultimo_leido_cliente' if chat.cliente_id == request.user.id else 'ultimo_leido_trabajador'
+
+        mensaje_id = request.data.get('mensaje_id')
+        if mensaje_id is None:
+            mensaje_id = chat.mensajes.aggregate(ultimo=Max('id'))['ultimo'] or 0
+        try:
+            mensaje_id = int(mensaje_id)
+        except (TypeError, ValueError):
+            return Response({'error': 'mensaje_id debe ser entero'}, status=400)
+
+        # El marcador nunca retrocede, aunque lleguen marcas fuera de orden
+        Chat.objects.filter(pk=chat.pk).update(**{campo: Greatest(F(campo), mensaje_id)})
+        return Response({'ultimo_leido': max(getattr(chat, campo), mensaje_id)})
+
+    # GET /api/chats/<chat_id>/mensajes/[?after=<id>|?before=<id>][&limit=<n>]
     # POST /api/chats/<chat_id>/mensajes/
     @action(detail=True, methods=['get', 'post'])
     def mensajes(self, request, pk=None):
-        chat = get_object_or_404(Chat, id=pk)
-
         if request.method == 'GET':
-            mensajes = chat.mensajes.order_by('enviado')
-            return Response(MensajeSerializer(mensajes, many=True).data)
+            return self._listar_mensajes(request, pk)
+
+        chat = get_object_or_404(Chat, id=pk)
 
         if request.method == 'POST':
             contenido = request.data.get('contenido', '').strip()
             if not contenido:
                 return Response({'error': 'El mensaje está vacío'}, status=400)
 
-            mensaje = Mensaje.objects.create(
-                chat=chat,
-                remitente=request.user,
-                contenido=contenido
-            )
+            if ingesta_activa():
+                mensaje = ingesta.ingerir(chat.id, request.user, contenido)
+            else:
+                mensaje = Mensaje.objects.create(
+                    chat=chat,
+                    remitente=request.user,
+                    contenido=contenido
+                )
             return Response(MensajeSerializer(mensaje).data, status=201)
 
+    def _listar_mensajes(self, request, chat_id):
+        """
+        Mensajes en orden cronológico, paginados por id sobre el índice (chat, id):
+          - ?after=<id>:  los posteriores a <id> (sincronización del polling).
+          - ?before=<id>: la página anterior a <id> (historial hacia atrás).
+          - sin cursor:   la última página de la conversación.
+        """
+        try:
+            after = int(request.GET['after']) if 'after' in request.GET else None
+            before = int(request.GET['before']) if 'before' in request.GET else None
+            limite = min(int(request.GET.get('limit', MENSAJES_LIMITE)), MENSAJES_LIMITE_MAXIMO)
+        except ValueError:
+            return Response({'error': 'after, before y limit deben ser enteros'}, status=400)
+        if limite <= 0:
+            return Response({'error': 'limit debe ser positivo'}, status=400)
+
+        mensajes = MensajeSerializer.optimizar_queryset(Mensaje.objects.filter(chat_id=chat_id))
+        if after is not None:
+            # Un polling sin novedades es una sola consulta sobre el índice
+            mensajes = list(mensajes.filter(id__gt=after).order_by('id')[:limite])
+        else:
+            if before is None:
+                get_object_or_404(Chat, id=chat_id)
+            else:
+                mensajes = mensajes.filter(id__lt=before)
+            mensajes = list(mensajes.order_by('-id')[:limite])[::-1]
+
+        return Response(MensajeSerializer(mensajes, many=True).data)
+
+
+# GET /api/chats/<chat_id>/stream/[?after=<id>]
+# Server-Sent Events: mantiene la conexión abierta y empuja cada Mensaje nuevo
+# del chat apenas se confirma (ver core.signals y core.pubsub). Al reconectar,
+# el navegador manda Last-Event-ID y se reenvía lo que se perdió entre medio.
+def _autenticar_participante(request, chat_id):
+    try:
+        resultado = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    if resultado is None:
+        return None
+    usuario = resultado[0]
+    es_participante = Chat.objects.filter(pk=chat_id) \
+        .filter(Q(cliente=usuario) | Q(trabajador=usuario)).exists()
+    return usuario if es_participante else None
+
+
+def _mensajes_posteriores(chat_id, after):
+    mensajes = MensajeSerializer.optimizar_queryset(
+        Mensaje.objects.filter(chat_id=chat_id, id__gt=after)
+    ).order_by('id')[:MENSAJES_LIMITE_MAXIMO]
+    return MensajeSerializer(mensajes, many=True).data
+
+
+def _evento_sse(mensaje):
+    return f'id: {mensaje["id"]}\nevent: mensaje\ndata: {json.dumps(mensaje)}\n\n'
+
+
+async def stream_mensajes(request, chat_id):
+    # Bajo WSGI (manage.py runserver) la respuesta se acumularía entera antes
+    # de enviarse: el cliente debe seguir con el polling de ?after=
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'error': 'El stream requiere un servidor ASGI; usa GET /api/chats/<id>/mensajes/?after=<id>'},
+            status=501,
+        )
+
+    usuario = await sync_to_async(_autenticar_participante)(request, chat_id)
+    if usuario is None:
+        return JsonResponse({'error': 'No autorizado'}, status=401)
+
+    try:
+        after = int(request.GET.get('after') or request.headers.get('Last-Event-ID') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'after debe ser entero'}, status=400)
+
+    async def eventos():
+        ultimo = after
+        pubsub = obtener_pubsub()
+        async with pubsub.suscribir(canal_chat(chat_id)) as suscripcion:
+            # Ponerse al día desde la BD recién suscrito: así no se pierde nada
+            # de lo que llegó entre la última lectura del cliente y este punto.
+            # Se pagina hasta agotar el atraso, por largo que sea
+            while ultimo:
+                pagina = await sync_to_async(_mensajes_posteriores)(chat_id, ultimo)
+                for mensaje in pagina:
+                    ultimo = mensaje['id']
+                    yield _evento_sse(mensaje)
+                if len(pagina) < MENSAJES_LIMITE_MAXIMO:
+                    break
+
+            limite = time.monotonic() + SSE_DURACION_MAXIMA
+            while time.monotonic() < limite:
+                try:
+                    datos = await suscripcion.recibir(timeout=SSE_LATIDO)
+                except SuscripcionDesbordada:
+                    break  # El cliente reconecta con Last-Event-ID y se pone al día
+                if datos is None:
+                    yield ': ping\n\n'
+                    continue
+                mensaje = json.loads(datos)
+                if mensaje['id'] > ultimo:
+                    ultimo = mensaje['id']
+                    yield _evento_sse(mensaje)
+
+    respuesta = StreamingHttpResponse(eventos(), content_type='text/event-stream')
+    respuesta['Cache-Control'] = 'no-cache'
+    respuesta['X-Accel-Buffering'] = 'no'
+    return respuesta
+
 
 ##Pasarela de pago FLOW
 class IniciarPagoFlowView(APIView):
@@ -594,8 +1044,11 @@ class IniciarPagoFlowView(APIView):
             ).hexdigest()
             data["s"] = signature
 
-            # Enviar solicitud a Flow
-            response = requests.post(f"{settings.FLOW_API_URL}/payment/create", data=data)
+            # Enviar solicitud a Flow (sesión compartida, con timeout; crear un pago no se reintenta)
+            try:
+                response = cliente_flow().post("payment/create", data=data)
+            except requests.RequestException:
+                return Response({"error": "Flow no respondió, intenta nuevamente"}, status=503)
             flow_data = response.json()
 
             if 'url' in flow_data:
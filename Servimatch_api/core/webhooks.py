@@ -0,0 +1,107 @@
+"""
+Procesamiento de webhooks de Stripe.
+
+La vista solo verifica la firma, registra el evento en EventoStripe y
+responde; el cambio de estado de la reserva corre como tarea (core.tareas).
+Un evento repetido choca con el id único y no se vuelve a procesar, salvo que
+siga sin procesado (la tarea se perdió o falló): entonces se vuelve a encolar.
+reprocesar_pendientes (comando reprocesar_eventos_stripe) hace lo mismo con los
+eventos atascados por los que Stripe ya no reintenta.
+"""
+from datetime import timedelta
+
+import logging
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .reservas import ReservaEnConflicto, confirmar
+
+logger = logging.getLogger(__name__)
+
+
+def registrar_evento_stripe(evento):
+    """
+    Guarda el evento. Retorna True si hay que procesarlo: es nuevo, o ya se
+    había recibido pero sigue sin procesar.
+    """
+    from .models import EventoStripe
+
+    try:
+        with transaction.atomic():
+            EventoStripe.objects.create(evento_id=evento['id'], tipo=evento['type'], datos=evento)
+    except IntegrityError:
+        return EventoStripe.objects.filter(evento_id=evento['id'], procesado__isnull=True).exists()
+    return True
+
+
+def _reserva_de(sesion):
+    return (sesion.get('metadata') or {}).get('reserva_id')
+
+
+def _sesion_pagada(sesion):
+    reserva_id = _reserva_de(sesion)
+    if not reserva_id or sesion.get('payment_status') != 'paid':
+        return
+    try:
+        reserva = confirmar(reserva_id)
+    except ReservaEnConflicto:
+        # Cobrado pero sin horario: queda para revisión manual (reembolso)
+        logger.error('Pago de Stripe %s para la reserva %s sin horario disponible',
+                     sesion.get('id'), reserva_id)
+        return
+    if reserva is None:
+        logger.warning('Pago de Stripe %s para la reserva inexistente %s', sesion.get('id'), reserva_id)
+
+
+def _sesion_expirada(sesion):
+    from .models import Reserva
+
+    reserva_id = _reserva_de(sesion)
+    if reserva_id:
+        Reserva.objects.filter(pk=reserva_id, estado='PENDIENTE').update(estado='CANCELADA')
+
+
+MANEJADORES = {
+    'checkout.session.completed': _sesion_pagada,
+    'checkout.session.async_payment_succeeded': _sesion_pagada,
+    'checkout.session.expired': _sesion_expirada,
+    'checkout.session.async_payment_failed': _sesion_expirada,
+}
+
+
+def procesar_evento_stripe(evento_id):
+    """Tarea: aplica un evento registrado y lo marca procesado."""
+    from .models import EventoStripe
+
+    with transaction.atomic():
+        evento = EventoStripe.objects.select_for_update() \
+            .filter(evento_id=evento_id, procesado__isnull=True).first()
+        if evento is None:
+            return
+        manejador = MANEJADORES.get(evento.tipo)
+        if manejador:
+            manejador(evento.datos['data']['object'])
+        evento.procesado = timezone.now()
+        evento.save(update_fields=['procesado'])
+
+
+def reprocesar_pendientes(antiguedad=timedelta(minutes=5)):
+    """
+    Vuelve a procesar los eventos recibidos hace más de `antiguedad` que siguen
+    sin procesar. Retorna cuántos quedaron procesados.
+    """
+    from .models import EventoStripe
+
+    pendientes = EventoStripe.objects.filter(
+        procesado__isnull=True, recibido__lt=timezone.now() - antiguedad,
+    ).order_by('recibido').values_list('evento_id', flat=True)
+    procesados = 0
+    for evento_id in list(pendientes):
+        try:
+            procesar_evento_stripe(evento_id)
+        except Exception:
+            logger.exception('Falló el reproceso del evento de Stripe %s', evento_id)
+        else:
+            procesados += 1
+    return procesados
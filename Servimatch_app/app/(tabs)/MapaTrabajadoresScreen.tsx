@@ -123,9 +123,21 @@ export default function MapaTrabajadoresScreen() {
       : `${baseUrl}?profesion__nombre__icontains=${encodeURIComponent(query)}`;
 
     try {
-      const res = await fetch(url, { headers: { Authorization: `Bearer ${tokens.access}` } });
-      const data: any = await res.json();
-      const list: Trabajador[] = Array.isArray(data) ? data : data.results ?? [];
+      // El listado viene paginado por cursor: se siguen los enlaces `next` hasta el final
+      const list: Trabajador[] = [];
+      let siguiente: string | null = url;
+      while (siguiente) {
+        const res = await fetch(siguiente, { headers: { Authorization: `Bearer ${tokens.access}` } });
+        if (!res.ok) throw new Error('Error al obtener trabajadores');
+        const data: any = await res.json();
+        if (Array.isArray(data)) {
+          list.push(...data);
+          siguiente = null;
+        } else {
+          list.push(...(data.results ?? []));
+          siguiente = data.next ?? null;
+        }
+      }
       setTrabajadores(list);
       setCount(list.length);
       // Ajustar mapa a marcadores si hay userLoc
@@ -73,7 +73,7 @@ const RankingScreen: React.FC = () => {
   useEffect(() => {
     fetch(`${API_BASE_URL}/api/profesiones/`)
       .then(res => res.json())
-      .then((data: Profesion[]) => setProfesiones(data))
+      .then(data => setProfesiones(Array.isArray(data) ? data : data.results ?? []))
       .catch(err => console.error(err));
   }, []);
 
@@ -48,7 +48,8 @@ export default function PlanesScreen() {
         `${API_BASE_URL}/api/planes/?trabajador=${trabajadorId}`,
         { headers: { Authorization: `Bearer ${tokens!.access}` } }
       );
-      const data: Plan[] = await res.json();
+      const json = await res.json();
+      const data: Plan[] = Array.isArray(json) ? json : json.results ?? [];
       setPlanes(data);
       if (data.length) {
         setSelectedPlanId(data[0].id);
@@ -39,7 +39,7 @@ export default function PlanesTrabajadorScreen() {
       headers: { Authorization: `Bearer ${tokens.access}` },
     })
       .then(r => r.json())
-      .then(setPlanes)
+      .then(data => setPlanes(Array.isArray(data) ? data : data.results ?? []))
       .catch(console.error);
   }, [tokens]);
 
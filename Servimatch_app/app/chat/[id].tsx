@@ -60,13 +60,33 @@ export default function ChatScreen() {
   useEffect(() => {
     if (!chatId || !tokens?.access) return;
 
+    // Después de la primera carga solo se piden los mensajes posteriores al último visto
+    let ultimoId: number | null = null;
+
     const cargarMensajes = async () => {
       try {
-        const res = await fetch(`${API_BASE_URL}/api/chats/${chatId}/mensajes/`, {
+        const params = ultimoId !== null ? `?after=${ultimoId}` : '';
+        const res = await fetch(`${API_BASE_URL}/api/chats/${chatId}/mensajes/${params}`, {
           headers: { Authorization: `Bearer ${tokens.access}` },
         });
         const data = await res.json();
-        setMensajes(data);
+        if (!Array.isArray(data)) return;
+        if (data.length > 0) {
+          ultimoId = data[data.length - 1].id;
+          // Marca como leído hasta el último mensaje recibido (contador de la bandeja)
+          fetch(`${API_BASE_URL}/api/chats/${chatId}/leido/`, {
+            method: 'POST',
+            headers: {
+              Authorization: `Bearer ${tokens.access}`,
+              'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ mensaje_id: ultimoId }),
+          }).catch(() => {});
+          setMensajes(prev => {
+            const vistos = new Set(prev.map(m => m.id));
+            return [...prev, ...data.filter(m => !vistos.has(m.id))];
+          });
+        }
         setCargando(false);
       } catch (error) {
         console.error('Error cargando mensajes:', error);
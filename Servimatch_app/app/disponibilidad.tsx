@@ -14,8 +14,6 @@ import BaseLayout from '../components/BaseLayout';
 import { useAuth } from '../context/AuthContext';
 
 const API_BASE_URL = 'http://192.168.100.4:8000';
-const WORK_DAY_START = 8;
-const WORK_DAY_END = 18;
 
 function formatearFecha(fecha: Date): string {
   return fecha.toLocaleDateString('es-CL', { day: '2-digit' });
@@ -45,8 +43,7 @@ export default function DisponibilidadScreen() {
   const [fecha, setFecha] = useState<Date>(new Date());
   const [trabajador, setTrabajador] = useState<any>(null);
   const [duracion, setDuracion] = useState<number>(0);
-  const [slots, setSlots] = useState<string[]>([]);
-  const [ocupados, setOcupados] = useState<string[]>([]);
+  const [slotsSemana, setSlotsSemana] = useState<Record<string, { hora_inicio: string; hora_fin: string }[]>>({});
   const [loading, setLoading] = useState(true);
   const [selectedSlot, setSelectedSlot] = useState<string | null>(null);
   const [fechaInicioSemana, setFechaInicioSemana] = useState<Date>(() => {
@@ -121,35 +118,30 @@ const textoSemana = mismoMes
       });
   }, [tokens, planId]);
 
-  // Carga de slots según fecha seleccionada
+  // Horarios reservables de toda la semana visible, calculados por el servidor
   useEffect(() => {
-    if (!duracion || !planId) return;
+    if (!planId) return;
 
     setLoading(true);
-    const fechaStr = fecha.toISOString().slice(0, 10);
-    fetch(`${API_BASE_URL}/api/reservas/?plan=${planId}&fecha=${fechaStr}`, {
+    const desde = fechaInicioSemana.toISOString().slice(0, 10);
+    const hasta = finSemana(fechaInicioSemana).toISOString().slice(0, 10);
+    fetch(`${API_BASE_URL}/api/planes/${planId}/slots/?desde=${desde}&hasta=${hasta}`, {
       headers: { Authorization: `Bearer ${tokens?.access}` },
     })
-      .then(res => res.json())
-      .then((data: any[]) => {
-        const busy = data.map(r => r.hora_inicio);
-        setOcupados(busy);
-
-        const bloques: string[] = [];
-        const step = duracion / 60;
-        for (let h = WORK_DAY_START; h + step <= WORK_DAY_END; h += step) {
-          const start = `${h.toString().padStart(2, '0')}:00`;
-          const end = `${(h + step).toString().padStart(2, '0')}:00`;
-          bloques.push(`${start} - ${end}`);
-        }
-        setSlots(bloques);
+      .then(res => {
+        if (!res.ok) throw new Error(`HTTP ${res.status}`);
+        return res.json();
       })
+      .then((json: any) => setSlotsSemana(json.slots ?? {}))
       .catch(e => {
         console.error(e);
-        Alert.alert('Error', 'No se pudo cargar las reservas');
+        Alert.alert('Error', 'No se pudo cargar la disponibilidad');
       })
       .finally(() => setLoading(false));
-  }, [fecha, duracion, planId, tokens]);
+  }, [fechaInicioSemana, planId, tokens]);
+
+  const slots = (slotsSemana[fecha.toISOString().slice(0, 10)] ?? [])
+    .map(s => `${s.hora_inicio} - ${s.hora_fin}`);
 
   const fechaIso = fecha.toISOString().slice(0, 10);
 
@@ -243,36 +235,18 @@ const textoSemana = mismoMes
 
         <Title style={{ marginTop: 16 }}>Franjas disponibles</Title>
         <View style={styles.chipContainer}>
-          {slots.map(slot => {
-            const hoy = new Date();
-            const esHoy = fecha.toDateString() === hoy.toDateString();
-            const inicio = slot.split(' - ')[0];
-
-            // Si es hoy, omitimos slots que ya pasaron
-            if (esHoy) {
-              const [hora, minuto] = inicio.split(':').map(Number);
-              if (
-                hora < hoy.getHours() ||
-                (hora === hoy.getHours() && minuto <= hoy.getMinutes())
-              ) {
-                return null; // no mostrar este slot
-              }
-            }
-
-            const disabled = ocupados.includes(inicio);
-            return (
-              <Chip
-                key={slot}
-                mode="outlined"
-                selected={selectedSlot === slot}
-                onPress={() => setSelectedSlot(slot)}
-                disabled={disabled}
-                style={styles.chip}
-              >
-                {slot}
-              </Chip>
-            );
-          })}
+          {slots.length === 0 && <Text>No hay horarios disponibles este día.</Text>}
+          {slots.map(slot => (
+            <Chip
+              key={slot}
+              mode="outlined"
+              selected={selectedSlot === slot}
+              onPress={() => setSelectedSlot(slot)}
+              style={styles.chip}
+            >
+              {slot}
+            </Chip>
+          ))}
         </View>
 
         <Button
@@ -14,7 +14,7 @@ export default function MisReservasScreen() {
       headers: { Authorization: `Bearer ${tokens?.access}` },
     })
       .then(r => r.json())
-      .then(data => setReservas(data))
+      .then(data => setReservas(Array.isArray(data) ? data : data.results ?? []))
       .catch(console.error)
       .finally(() => setLoading(false));
   }, [tokens]);
@@ -76,7 +76,7 @@ export default function CompletarPerfilScreen() {
       headers: { Authorization: `Bearer ${tokens.access}` },
     })
       .then((r) => r.json())
-      .then((data) => setProfesiones(data))
+      .then((data) => setProfesiones(Array.isArray(data) ? data : data.results ?? []))
       .catch((e) => console.error(e));
   }, [tokens]);
 
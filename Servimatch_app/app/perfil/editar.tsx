@@ -126,7 +126,7 @@ const eliminarFranja = (dia: string, index: number) => {
         }
 
         const serviciosData = await serviciosRes.json();
-        setServicios(serviciosData);
+        setServicios(Array.isArray(serviciosData) ? serviciosData : serviciosData.results ?? []);
       } catch (e) {
         console.error('Error al cargar perfil:', e);
         Alert.alert('Error', 'No se pudo cargar el perfil');
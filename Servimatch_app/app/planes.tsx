@@ -68,7 +68,8 @@ export default function PlanesScreen() {
         headers: { Authorization: `Bearer ${tokens!.access}` },
       });
       if (res.ok) {
-        setPlanes(await res.json());
+        const data = await res.json();
+        setPlanes(Array.isArray(data) ? data : data.results ?? []);
       }
     } catch (e) {
       console.error(e);
@@ -82,7 +83,10 @@ export default function PlanesScreen() {
       const res = await fetch(`${API_BASE_URL}/api/servicios/`, {
         headers: { Authorization: `Bearer ${tokens!.access}` },
       });
-      if (res.ok) setServicios(await res.json());
+      if (res.ok) {
+        const data = await res.json();
+        setServicios(Array.isArray(data) ? data : data.results ?? []);
+      }
     } catch (e) {
       console.error(e);
     }
@@ -95,26 +95,26 @@ export default function ListaSolicitudes() {
     }
     setLoading(true);
     try {
-      const resUser = await fetch(`${API_BASE_URL}/api/usuarios/me/`, {
-        headers: { Authorization: `Bearer ${tokens.access}` },
-      });
-      if (!resUser.ok) throw new Error('No se pudo obtener datos de usuario');
-      const userData: Usuario = await resUser.json();
-
-      const res = await fetch(`${API_BASE_URL}/api/solicitudes/`, {
-        headers: { Authorization: `Bearer ${tokens.access}` },
-      });
-      if (!res.ok) throw new Error('Error al obtener solicitudes');
-      const data = await res.json();
-      const lista: Solicitud[] = Array.isArray(data)
-        ? data
-        : Array.isArray(data.results)
-        ? data.results
-        : [];
-
-      const filtradas = lista.filter((s) => s.cliente.usuario.id === userData.id);
-      setSolicitudes(filtradas);
-      setFiltered(filtradas);
+      // La API ya devuelve solo las solicitudes del cliente autenticado,
+      // paginadas por cursor: se siguen los enlaces `next` hasta el final
+      const lista: Solicitud[] = [];
+      let url: string | null = `${API_BASE_URL}/api/solicitudes/`;
+      while (url) {
+        const res = await fetch(url, {
+          headers: { Authorization: `Bearer ${tokens.access}` },
+        });
+        if (!res.ok) throw new Error('Error al obtener solicitudes');
+        const data = await res.json();
+        if (Array.isArray(data)) {
+          lista.push(...data);
+          break;
+        }
+        lista.push(...(Array.isArray(data.results) ? data.results : []));
+        url = data.next ?? null;
+      }
+
+      setSolicitudes(lista);
+      setFiltered(lista);
     } catch (e) {
       console.error(e);
       Alert.alert('Error', 'No se pudo cargar tus solicitudes');
@@ -70,7 +70,7 @@ export default function NuevaSolicitudScreen() {
           headers: { Authorization: `Bearer ${tokens.access}` },
         });
         const data = await res.json();
-        setServicios(data);
+        setServicios(Array.isArray(data) ? data : data.results ?? []);
       } catch (e) {
         console.error(e);
       }